@@ -55,6 +55,11 @@ def courses():
 
     print(list(courses_generator))
 
+    # Instead of loading every html page, the course contents can also be loaded from the moodle web service.
+    # That's a lot less data and will be done in a few batched requests.
+    # If the service isn't available the html page is loaded like before.
+    courses = list(client.courses(use_service=True))
+
 
 def course_page():
     course_list = list(client.courses())
@@ -0,0 +1,32 @@
+import asyncio
+
+from pymoodle_jku import AsyncMoodleClient
+
+
+async def async_client():
+    user = input('Username: ')
+    passwd = input('Password: ')
+
+    # The AsyncMoodleClient has the same methods as the MoodleClient, but they have to be awaited.
+    # All requests share one connection pool, so there is no thread per request.
+    # limit is the max amount of connections which are open at the same time.
+    async with AsyncMoodleClient(limit=100) as client:
+        await client.login(user, passwd)
+
+        # courses() and multi_valuation() are async generators.
+        # The courses are yielded as soon as their page is loaded.
+        async for course in client.courses():
+            print(course.fullname)
+            print(course.course_page.to_course_data().links)
+
+        courses = [c async for c in client.courses(load_pages=False)]
+        async for course, evaluations in client.multi_valuation(courses):
+            print(course.fullname, len(evaluations))
+
+        # Everything else is a simple coroutine.
+        print(await client.valuation_overview())
+        print(await client.calendar(limit=10))
+
+
+if __name__ == '__main__':
+    asyncio.run(async_client())
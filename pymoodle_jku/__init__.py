@@ -1,4 +1,5 @@
 from pymoodle_jku.client.client import MoodleClient
+from pymoodle_jku.client.async_client import AsyncMoodleClient
 from pymoodle_jku.client.download_manager import DownloadManager
 from pymoodle_jku.utils.login import login
 from pymoodle_jku.classes.course_data import UrlType, Url, CourseData, Section
@@ -1,7 +1,9 @@
 from dataclasses import dataclass
-from typing import Union
+from typing import Union, Collection
 
-from pymoodle_jku.client.html_parser import CoursePage
+from pymoodle_jku.classes.model import SLOTS, known_fields
+from pymoodle_jku.client.html_parser import CoursePage, ParsedCoursePage
+from pymoodle_jku.client.service_parser import CourseContents
 
 
 def parse_course_name(fullname):
@@ -11,32 +13,45 @@ def parse_course_name(fullname):
         return fullname
 
 
-@dataclass
+# courseimage is a inline base64 image and summary the html description, both aren't used
+SKIPPED_FIELDS = ('courseimage', 'summary')
+
+
+@dataclass(**SLOTS)
 class Course:
     """
     Represents the Course object which is loaded from Moodle.
     """
     id: int
-    fullname: str
-    shortname: str
-    idnumber: str
-    summary: str
-    summaryformat: int
-    startdate: int
-    enddate: int
-    visible: bool
-    fullnamedisplay: str
-    viewurl: str
-    courseimage: str
-    progress: int
-    hasprogress: bool
-    isfavourite: bool
-    hidden: bool
-    showshortname: bool
-    showactivitydates: bool
-    showcompletionconditions: object  # don't know what this is
-    coursecategory: str
-    course_page: Union[CoursePage, None] = None
+    fullname: str = None
+    shortname: str = None
+    idnumber: str = None
+    summary: str = None
+    summaryformat: int = None
+    startdate: int = None
+    enddate: int = None
+    visible: bool = None
+    fullnamedisplay: str = None
+    viewurl: str = None
+    courseimage: str = None
+    progress: int = None
+    hasprogress: bool = None
+    isfavourite: bool = None
+    hidden: bool = None
+    showshortname: bool = None
+    showactivitydates: bool = None
+    showcompletionconditions: object = None  # don't know what this is
+    coursecategory: str = None
+    course_page: Union[CoursePage, CourseContents, ParsedCoursePage, None] = None
+
+    @classmethod
+    def from_json(cls, data: dict, skip: Collection[str] = SKIPPED_FIELDS) -> 'Course':
+        """
+        Creates a Course from a course of the moodle web service. Unknown keys are ignored.
+        :param data: The json object of the course.
+        :param skip: Fields that aren't kept.
+        """
+        return cls(**known_fields(cls, data, skip))
 
     def parse_name(self):
         return parse_course_name(self.fullname)
@@ -60,10 +75,15 @@ class Course:
         return self._cmp(other) <= 0
 
     def __eq__(self, other):
-        return self._cmp(other) == 0
+        # same as __hash__, the ordering compares the enddate
+        if not isinstance(other, Course):
+            return NotImplemented
+        return self.id == other.id
 
     def __ne__(self, other):
-        return self._cmp(other) != 0
+        if not isinstance(other, Course):
+            return NotImplemented
+        return self.id != other.id
 
     def __ge__(self, other):
         return self._cmp(other) >= 0
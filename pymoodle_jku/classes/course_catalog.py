@@ -0,0 +1,101 @@
+import time
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Optional, List, Dict, Callable, Union, Iterator
+
+from pymoodle_jku.classes.course import Course
+
+
+def ongoing(course: Course) -> bool:
+    return course.enddate is None or course.enddate == 0
+
+
+class CourseCatalog:
+    """
+    The enrolled courses of a user, indexed by id, shortname and enddate (courses of a semester share the enddate).
+    The lowercase names are kept in one string, so a name search is a few str.find calls instead of a loop over all
+    courses.
+    """
+
+    def __init__(self, courses: Iterable[Course]):
+        """
+        :param courses: The courses, a course whose id is already in the catalog is skipped.
+        """
+        self._by_id: Dict[int, Course] = {}
+        for c in courses:
+            self._by_id.setdefault(c.id, c)
+        self._courses = list(self._by_id.values())
+        self._by_shortname = {c.shortname: c for c in reversed(self._courses) if c.shortname}
+
+        # ascending enddate, ongoing courses (no enddate) last like in Course._cmp
+        self._ended = sorted((c for c in self._courses if not ongoing(c)), key=lambda c: c.enddate)
+        self._enddates = [c.enddate for c in self._ended]
+        self._ongoing = [c for c in self._courses if ongoing(c)]
+
+        names = [(c.fullname or '').lower() for c in self._courses]
+        self._names = '\n'.join(names)
+        self._name_starts, start = [], 0
+        for n in names:
+            self._name_starts.append(start)
+            start += len(n) + 1
+
+    def __len__(self) -> int:
+        return len(self._courses)
+
+    def __iter__(self) -> Iterator[Course]:
+        return iter(self._courses)
+
+    def __contains__(self, item: Union[Course, int]) -> bool:
+        return (item.id if isinstance(item, Course) else item) in self._by_id
+
+    def get(self, course_id: int) -> Optional[Course]:
+        """Returns the course with the id or None."""
+        return self._by_id.get(course_id)
+
+    def __getitem__(self, course_id: int) -> Course:
+        return self._by_id[course_id]
+
+    def by_shortname(self, shortname: str) -> Optional[Course]:
+        """Returns the course with the shortname or None."""
+        return self._by_shortname.get(shortname)
+
+    def ending_between(self, start: int, end: int) -> List[Course]:
+        """Returns the courses with a enddate between start and end (inclusive), e.g. the courses of a semester."""
+        return self._ended[bisect_left(self._enddates, start):bisect_right(self._enddates, end)]
+
+    def semesters(self) -> Dict[int, List[Course]]:
+        """Returns the courses with a enddate grouped by the enddate, in ascending order."""
+        semesters = {}
+        for c in self._ended:
+            semesters.setdefault(c.enddate, []).append(c)
+        return semesters
+
+    def current(self, now: Optional[float] = None) -> List[Course]:
+        """Returns the courses which didn't end before now, or have no enddate."""
+        now = time.time() if now is None else now
+        return self._ended[bisect_left(self._enddates, now):] + self._ongoing
+
+    def search(self, terms: Iterable[str]) -> List[Course]:
+        """
+        Returns the courses whose name contains any of the terms (ignoring case), in the order of the catalog.
+        :param terms: The search terms.
+        """
+        found = set()
+        for term in terms:
+            term = term.lower()
+            if term == '' or '\n' in term:
+                # the names are separated by newlines, so these terms are checked for each name
+                found.update(i for i in range(len(self._courses)) if term in self._name(i))
+                continue
+            index = self._names.find(term)
+            while index != -1:
+                found.add(bisect_right(self._name_starts, index) - 1)
+                index = self._names.find(term, index + 1)
+        return [self._courses[i] for i in sorted(found)]
+
+    def _name(self, index: int) -> str:
+        end = self._name_starts[index + 1] - 1 if index + 1 < len(self._name_starts) else len(self._names)
+        return self._names[self._name_starts[index]:end]
+
+    def filter(self, filter_exp: Callable[[Course], bool]) -> List[Course]:
+        """Returns the courses for which filter_exp is True."""
+        return [c for c in self._courses if filter_exp(c)]
@@ -1,6 +1,8 @@
 from dataclasses import dataclass, field
 from enum import Enum
 
+from pymoodle_jku.classes.model import SLOTS
+
 
 class UrlType(Enum):
     """
@@ -25,7 +27,7 @@ class UrlType(Enum):
     Chat = 14
 
 
-@dataclass
+@dataclass(**SLOTS)
 class Url:
     """
     Represents a given URL on moodle.
@@ -35,7 +37,7 @@ class Url:
     course: 'CourseData' = None
 
 
-@dataclass
+@dataclass(**SLOTS)
 class Section:
     """
     Represents a Section of a moodle page.
@@ -43,7 +45,7 @@ class Section:
     text: str
 
 
-@dataclass
+@dataclass(**SLOTS)
 class CourseData:
     """
     Represents the data from a course.
@@ -1,9 +1,10 @@
 from dataclasses import dataclass
 
 from pymoodle_jku.classes.course_data import UrlType, Url
+from pymoodle_jku.classes.model import SLOTS
 
 
-@dataclass
+@dataclass(**SLOTS)
 class Evaluation:
     """
     A Evaluation for a Quiz or Assignment on Moodle.
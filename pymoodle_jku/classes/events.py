@@ -1,19 +1,30 @@
 from dataclasses import dataclass
 
+from pymoodle_jku.classes.model import SLOTS, known_fields
 
-@dataclass
+
+@dataclass(frozen=True, **SLOTS)
 class Event:
     """
     A Event object which represents the Moodle Calendar events.
     There are a lot of properties missing.
     """
     id: int
-    name: str
-    description: str
-    modulename: str
-    eventtype: str
-    timestart: int
-    timesort: int
-    course_fullname: str
-    course_id: int
-    url: str
+    name: str = None
+    description: str = None
+    modulename: str = None
+    eventtype: str = None
+    timestart: int = None
+    timesort: int = None
+    course_fullname: str = None
+    course_id: int = None
+    url: str = None
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'Event':
+        """
+        Creates a Event from a event of core_calendar_get_action_events_by_timesort. Unknown keys are ignored.
+        :param data: The json object of the event.
+        """
+        course = data.get('course') or {}
+        return cls(**known_fields(cls, data), course_fullname=course.get('fullname'), course_id=course.get('id'))
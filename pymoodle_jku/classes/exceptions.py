@@ -4,3 +4,13 @@ class NotLoggedInError(Exception):
 
 class LoginError(Exception):
     """Raised when login fails"""
+
+
+class AjaxError(Exception):
+    """Raised or returned when a single call of a Moodle AJAX request fails"""
+
+    def __init__(self, methodname, exception=None):
+        exception = exception or {}
+        self.methodname = methodname
+        self.errorcode = exception.get('errorcode')
+        super().__init__(f'{methodname}: {exception.get("message", "unknown error")}')
@@ -0,0 +1,27 @@
+import sys
+from dataclasses import fields
+from functools import lru_cache
+from typing import Collection
+
+# dataclass(slots=True) needs Python 3.10, older versions fall back to a __dict__
+SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
+@lru_cache(maxsize=None)
+def field_names(cls) -> frozenset:
+    """Returns the names of the init fields of a dataclass."""
+    return frozenset(f.name for f in fields(cls) if f.init)
+
+
+def known_fields(cls, data: dict, skip: Collection[str] = ()) -> dict:
+    """
+    Selects the keys of a moodle json object that are fields of the dataclass cls.
+    Moodle adds new keys from time to time, they are ignored instead of breaking the constructor.
+
+    :param cls: The dataclass.
+    :param data: The json object.
+    :param skip: Fields that aren't used and shouldn't be kept, even if cls has them.
+    :return: The keyword arguments for cls.
+    """
+    names = field_names(cls)
+    return {k: v for k, v in data.items() if k in names and k not in skip}
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import time
+from typing import Union, List, Callable, Tuple, AsyncGenerator, Iterable, Optional, Collection
+from urllib.parse import urljoin
+
+import aiohttp
+from yarl import URL
+
+from pymoodle_jku.classes.course import Course, SKIPPED_FIELDS
+from pymoodle_jku.classes.evaluation import Evaluation
+from pymoodle_jku.classes.events import Event
+from pymoodle_jku.classes.exceptions import NotLoggedInError, LoginError
+from pymoodle_jku.client.client import MoodleClient
+from pymoodle_jku.client.html_parser import LoginPage, MyPage, \
+    ValuationOverviewPage, CoursePage, ValuationPage, PreLoginPage, PostLoginPage
+from pymoodle_jku.utils.printing import print_exc
+
+
+class PageRequest:
+    def __init__(self, url):
+        """
+        Minimal stand-in for requests.PreparedRequest, the html_parser pages only need the url.
+        :param url: The url of the (last) request.
+        """
+        self.url = url
+
+
+class PageResponse:
+    """
+    A fully read aiohttp response, which looks enough like a requests.Response that
+    the html_parser page classes and MoodleClient.check_request can use it.
+    """
+
+    def __init__(self, url, status_code, headers, content, history=()):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.history = list(history)
+        self.request = PageRequest(url)
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    @property
+    def is_redirect(self) -> bool:
+        return 'location' in self.headers and self.status_code in (301, 302, 303, 307, 308)
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncMoodleClient:
+    def __init__(self, limit=100, retries=5, backoff_factor=0.3, timeout=30):
+        """Initializes a AsyncMoodleClient, a asyncio client which can load Data from Moodle.
+        All requests share one aiohttp connection pool, so no thread is needed per request.
+        The client has to be used inside a running event loop, best with `async with`.
+
+        :param limit: Max amount of simultaneously open connections.
+        :param retries: How often a request should be retried on connection errors.
+        :param backoff_factor: Retries wait backoff_factor * 2 ** (retry - 1) seconds.
+        :param timeout: Total timeout in seconds for a single request.
+        """
+        self.limit = limit
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.sesskey = None
+        self.userid = None
+
+    async def __aenter__(self) -> 'AsyncMoodleClient':
+        self._ensure_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit)
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def close(self):
+        """Closes the connection pool."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def clear_client(self):
+        self.sesskey = None
+        self.userid = None
+        if self.session is not None:
+            self.session.cookie_jar.clear()
+
+    async def _request(self, method, url, check=True, **kwargs) -> PageResponse:
+        """Sends a request and reads the whole body.
+        Connection errors and timeouts are retried like the urllib3 Retry of the MoodleClient.
+
+        :param method: HTTP method.
+        :param url: The url to request.
+        :param check: If True the response is checked with MoodleClient.check_request.
+        :param kwargs: Passed to aiohttp.ClientSession.request.
+        :return: A PageResponse.
+        :raises NotLoggedInError: If user isn't logged in.
+        """
+        session = self._ensure_session()
+        attempt = 0
+        while True:
+            try:
+                async with session.request(method, url, **kwargs) as r:
+                    content = await r.read()
+                    history = [PageResponse(str(h.url), h.status, h.headers, b'') for h in r.history]
+                    response = PageResponse(str(r.url), r.status, r.headers, content, history)
+                break
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                await asyncio.sleep(self.backoff_factor * (2 ** (attempt - 1)))
+        if check:
+            MoodleClient.check_request(response)
+        return response
+
+    async def login(self, username, password) -> bool:
+        """Retrieves tokens and cookies for moodle.
+
+        :param username: Official JKU Username
+        :param password: Official JKU Password
+        :return: True if Login worked.
+        :raises Exception: if Login doesn't work.
+        """
+        if username is None or password is None:
+            raise LoginError('Provide Username or Password')
+        session = self._ensure_session()
+        try:
+            session.cookie_jar.clear()
+            headers = {'Content-type': 'application/x-www-form-urlencoded'}
+            response = await self._request('POST', 'https://moodle.jku.at/jku/login/index.php', headers=headers)
+
+            pre_login_page = PreLoginPage.from_response(response)
+            response = await self._request('POST', urljoin(response.url, pre_login_page.action),
+                                           data=pre_login_page.data, headers=headers)
+
+            l_page = LoginPage.from_response(response)
+            response = await self._request('POST', urljoin(response.url, l_page.action),
+                                           data=l_page.data | {'j_username': username, 'j_password': password},
+                                           headers=headers)
+
+            post_login_page = PostLoginPage.from_response(response)
+            response = await self._request('POST', post_login_page.action, data=post_login_page.data,
+                                           headers=headers)
+
+            m_page = MyPage.from_response(response)
+
+            self.sesskey, self.userid = m_page.sesskey, m_page.userid
+            cookies = {c.key: c.value for c in session.cookie_jar}
+            session.cookie_jar.clear()
+            session.cookie_jar.update_cookies(
+                {'MoodleSessionjkuSessionCookie': cookies['MoodleSessionjkuSessionCookie'],
+                 f'_shibsession_{cookies["shib_idp_session"]}': f'_{cookies["JSESSIONID"]}'},
+                URL('https://moodle.jku.at/'))
+        except (NotLoggedInError, IndexError, KeyError):
+            return False
+        return True
+
+    async def valuation_overview(self) -> dict:
+        """Loads the Overview of all valuations from Moodle.
+
+        :return: Dict[int, (str, str)]: course_id, name, Points
+        """
+        response = await self._request('GET', 'https://moodle.jku.at/jku/grade/report/overview/index.php')
+        return ValuationOverviewPage(response).valuation
+
+    async def single_valuation(self, course: Course) -> List[Evaluation]:
+        """Returns a List of Evaluation Objects for the given Course.
+        CoursePage not required.
+
+        :param course: Course Object for which the Evaluation should be loaded.
+        :return:
+        """
+        response = await self._request(
+            'GET', f'https://moodle.jku.at/jku/course/user.php?mode=grade&id={course.id}&user={self.userid}')
+        return ValuationPage(response).evaluations()
+
+    async def multi_valuation(self, courses: Optional[Iterable[Course]] = None) -> AsyncGenerator[
+        Tuple[Course, List[Evaluation]], None]:
+        """Yields a Tuple with each Course and the corresponding evaluations as soon as they are loaded.
+        CoursePage not required.
+
+        :param courses: Courses to load the evaluation from. Course.course_page doesn't need to be loaded.
+        :return: AsyncGenerator[Tuple[Course, List[Evaluation]]] The Course is the same Object as the input.
+        """
+        if courses is None:
+            courses = [c async for c in self.courses(load_pages=False)]
+
+        async def load(c):
+            return c, await self.single_valuation(c)
+
+        async for result in self._as_completed([load(c) for c in courses]):
+            yield result
+
+    async def courses(self, load_pages: Union[bool, List[Course]] = True,
+                      filter_exp: Callable[[Course], bool] = None,
+                      skip: Collection[str] = SKIPPED_FIELDS) -> AsyncGenerator[Course, None]:
+        """Loads all the moodle Courses.
+
+        :param load_pages: If True the course.course_page will be loaded. If load_pages is set to a List of Courses,
+        only the course_page's will be loaded.
+        :param filter_exp: If not None, the filter will be applied to filter the Courses.
+        :param skip: Fields of the courses that aren't kept, see Course.from_json.
+        :return: Returns a AsyncGenerator for all (filtered) Courses.
+        """
+        if type(load_pages) is list:
+            courses = load_pages
+        else:
+            response = await self._request(
+                'POST', f'https://moodle.jku.at/jku/lib/ajax/service.php?sesskey={self.sesskey}',
+                json=[{"index": 0, "methodname": "core_course_get_enrolled_courses_by_timeline_classification",
+                       "args": {"offset": 0, "limit": 0, "classification": "all", "sort": "fullname"}},
+                      {"index": 1, "methodname": "core_course_get_enrolled_courses_by_timeline_classification",
+                       "args": {"offset": 0, "limit": 0, "classification": "hidden", "sort": "fullname"}}])
+            result = response.json()
+            courses = [Course.from_json(c, skip) for c in result[0]['data']['courses'] + result[1]['data']['courses']]
+
+        if filter_exp is not None:
+            courses = filter(filter_exp, courses)
+
+        if load_pages is False:
+            for c in courses:
+                yield c
+            return
+
+        async def load(c):
+            c.course_page = CoursePage(await self._request('GET', c.viewurl))
+            return c
+
+        async for c in self._as_completed([load(c) for c in courses]):
+            yield c
+
+    async def calendar(self, limit=26) -> List[Event]:
+        """Gets the calendar entries. (Assignments, Exams etc.)
+
+        :param limit: Max amount of entries to load.
+        :return: A List of Calendar Events.
+        """
+        url = f'https://moodle.jku.at/jku/lib/ajax/service.php?sesskey={self.sesskey}'
+        data = [{"index": 0, "methodname": "core_calendar_get_action_events_by_timesort",
+                 "args": {"limitnum": limit, "timesortfrom": int(time.time()), "limittononsuspendedevents": True}}]
+        response = await self._request('POST', url, json=data)
+
+        return [Event.from_json(o) for o in response.json()[0]['data']['events']]
+
+    @staticmethod
+    async def _as_completed(coroutines):
+        """Runs all coroutines at once and yields their results in the order they finish.
+        Failed coroutines are printed and skipped, pending ones get cancelled if the consumer stops early.
+        """
+        tasks = [asyncio.ensure_future(c) for c in coroutines]
+        try:
+            for t in asyncio.as_completed(tasks):
+                try:
+                    yield await t
+                except (SystemExit, KeyboardInterrupt, GeneratorExit, asyncio.CancelledError):
+                    raise
+                except Exception as e:
+                    print_exc(e)
+        finally:
+            for t in tasks:
+                t.cancel()
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Pages which are cached. The dashboard (/jku/my/) is left out on purpose,
+# because it is used to check if a old session is still valid.
+CACHE_PATHS = ('/jku/course/view.php', '/jku/course/user.php', '/jku/grade/report/overview/index.php')
+CACHE_CONTENT_TYPES = ('text/html', 'application/json')
+# headers which describe the transferred and not the decoded body
+DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+class ResponseCache:
+    """
+    A persistent cache for Moodle pages. Entries are keyed by url and userid and stored zlib compressed in a
+    sqlite database. If the least recently used entries exceed max_size they are evicted.
+
+    Moodle sends `Cache-Control: no-store` for all pages, as the cache is opt-in this is ignored.
+    """
+
+    def __init__(self, directory: Path, ttl: float = 600, max_size: int = 100 * 1024 * 1024,
+                 paths=CACHE_PATHS):
+        """
+        :param directory: Directory where the cache is stored. Created if it doesn't exist.
+        :param ttl: Seconds a entry without ETag/Last-Modified is used without asking the server.
+        :param max_size: Max size of all compressed bodies in bytes.
+        :param paths: Url paths that should be cached.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.paths = paths
+        self.userid = None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.directory / 'cache.sqlite', check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, url TEXT, userid INTEGER, '
+                         'status INTEGER, headers TEXT, etag TEXT, last_modified TEXT, stored REAL, accessed REAL, '
+                         'size INTEGER, body BLOB)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self._db.commit()
+
+    def cacheable(self, url) -> bool:
+        """True if the url may be cached for the current user."""
+        return self.userid is not None and urlparse(url).path in self.paths
+
+    def _key(self, url) -> str:
+        return hashlib.sha256(f'{self.userid}\n{url}'.encode()).hexdigest()
+
+    def get(self, url) -> Optional[Tuple[dict, bytes, Optional[str], Optional[str], float]]:
+        """Loads a entry.
+
+        :param url: The requested url.
+        :return: (headers, body, etag, last_modified, stored) or None if there is no entry.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT headers, body, etag, last_modified, stored FROM entries WHERE key = ?',
+                                   (self._key(url),)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (time.time(), self._key(url)))
+            self._db.commit()
+        headers, body, etag, last_modified, stored = row
+        return json.loads(headers), zlib.decompress(body), etag, last_modified, stored
+
+    def put(self, url, response: requests.Response) -> None:
+        """Stores the (already read) body and headers of a response."""
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in DROPPED_HEADERS}
+        body = zlib.compress(response.content)
+        now = time.time()
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (self._key(url), url, self.userid, response.status_code, json.dumps(headers),
+                              response.headers.get('ETag'), response.headers.get('Last-Modified'), now, now,
+                              len(body), body))
+            self._evict()
+            self._db.commit()
+
+    def touch(self, url) -> None:
+        """Marks a entry as fresh after a successful revalidation."""
+        with self._lock:
+            self._db.execute('UPDATE entries SET stored = ? WHERE key = ?', (time.time(), self._key(url)))
+            self._db.commit()
+
+    def _evict(self) -> None:
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        for key, size in self._db.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall():
+            if total <= self.max_size:
+                break
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+
+    def clear(self) -> None:
+        """Removes all entries."""
+        with self._lock:
+            self._db.execute('DELETE FROM entries')
+            self._db.commit()
+            self._db.execute('VACUUM')
+
+
+class CacheAdapter(BaseAdapter):
+    """
+    A transport adapter which answers GET requests from a ResponseCache.
+    Entries with ETag or Last-Modified are revalidated with a conditional request, all others are used while
+    they are younger than the ttl. Every other request is sent with the wrapped adapter.
+    """
+
+    def __init__(self, adapter: BaseAdapter, cache: ResponseCache):
+        super().__init__()
+        self.adapter = adapter
+        self.cache = cache
+
+    def send(self, request, stream=False, **kwargs):
+        if request.method != 'GET' or stream or not self.cache.cacheable(request.url):
+            return self.adapter.send(request, stream=stream, **kwargs)
+
+        entry = self.cache.get(request.url)
+        if entry is not None:
+            headers, body, etag, last_modified, stored = entry
+            if etag is None and last_modified is None:
+                if time.time() - stored < self.cache.ttl:
+                    return self._build_response(request, headers, body)
+            else:
+                if etag is not None:
+                    request.headers['If-None-Match'] = etag
+                if last_modified is not None:
+                    request.headers['If-Modified-Since'] = last_modified
+
+        response = self.adapter.send(request, stream=stream, **kwargs)
+        if entry is not None and response.status_code == 304:
+            response.close()
+            self.cache.touch(request.url)
+            return self._build_response(request, entry[0], entry[1])
+        content_type = response.headers.get('Content-Type', '')
+        if response.status_code == 200 and content_type.startswith(CACHE_CONTENT_TYPES):
+            self.cache.put(request.url, response)
+        return response
+
+    def _build_response(self, request, headers, body) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        self.adapter.close()
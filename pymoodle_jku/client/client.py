@@ -1,10 +1,14 @@
 import json
 import os
+import re
 import time
-from concurrent.futures import as_completed
+from dataclasses import replace
+from functools import partial
+from itertools import islice
+from concurrent.futures import wait, FIRST_COMPLETED, Executor, Future
 from concurrent.futures.thread import ThreadPoolExecutor
 
-from typing import Union, List, Callable, Tuple, Generator, Iterator, Optional, Type
+from typing import Union, List, Callable, Tuple, Generator, Iterator, Optional, Type, Any, Dict, Collection, Iterable
 
 import requests
 from requests.adapters import HTTPAdapter
@@ -12,25 +16,76 @@ from requests_futures.sessions import FuturesSession
 from urllib3 import Retry
 from urllib.parse import urljoin
 
-from pymoodle_jku.classes.course import Course
+from pymoodle_jku.classes.course import Course, SKIPPED_FIELDS
+from pymoodle_jku.classes.course_catalog import CourseCatalog
 from pymoodle_jku.classes.evaluation import Evaluation
 from pymoodle_jku.classes.events import Event
-from pymoodle_jku.classes.exceptions import NotLoggedInError, LoginError
+from pymoodle_jku.classes.exceptions import NotLoggedInError, LoginError, AjaxError
 from pymoodle_jku.client.html_parser import LoginPage, MyPage, \
-    ValuationOverviewPage, CoursePage, ValuationPage, PreLoginPage, PostLoginPage
+    ValuationOverviewPage, CoursePage, ValuationPage, PreLoginPage, PostLoginPage, ParsedCoursePage, \
+    declared_encoding, parse_course_data, parse_evaluations
+from pymoodle_jku.client.cache import ResponseCache, CacheAdapter
+from pymoodle_jku.client.service_parser import CourseContents
+from pymoodle_jku.utils.concurrency import AdaptiveLimiter, LimiterAdapter
+from pymoodle_jku.utils.json_stream import JsonArrayStream
+from pymoodle_jku.utils.metrics import MetricsCollector
 from pymoodle_jku.utils.printing import print_exc
 
+LOGIN_URL = 'https://moodle.jku.at/jku/login/index.php'
+LOGIN_CHECK_PREFIX = 64 * 1024  # bytes of a streamed body that may be read to check the login state
+LOGIN_CHECK_JSON_PREFIX = 2 * 1024  # moodle names the errorcode of a failed call right after the message
+LOGIN_ERRORCODES = ('servicerequireslogin', 'requireloginerror', 'invalidsesskey')
+AJAX_URL = 'https://moodle.jku.at/jku/lib/ajax/service.php'
+AJAX_MAX_CALLS = 25  # max calls in one lib/ajax/service.php POST
+AJAX_MAX_BYTES = 32 * 1024  # max size of the json body of one lib/ajax/service.php POST
+COURSES_PAGE_SIZE = 25  # courses per core_course_get_enrolled_courses_by_timeline_classification call
+COURSES_CHUNK_SIZE = 16 * 1024  # bytes of the enrolled courses response decoded at once
+PAGES_WINDOW = 32  # max pages that are requested (or parsed) at once, the next items are taken when one finishes
+
+
+class PrefixedStream:
+    """
+    Wraps the raw urllib3 response of a streamed request after a prefix of it was already read.
+    The prefix is returned first, everything else is passed through to the raw response.
+    """
+
+    def __init__(self, prefix: bytes, raw):
+        self._prefix = prefix
+        self._raw = raw
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        if self._prefix:
+            prefix, self._prefix = self._prefix, b''
+            yield prefix
+        yield from self._raw.stream(amt, decode_content=decode_content)
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        prefix, self._prefix = self._prefix, b''
+        if amt is not None:
+            if len(prefix) >= amt:
+                self._prefix = prefix[amt:]
+                return prefix[:amt]
+            amt -= len(prefix)
+        return prefix + (self._raw.read(amt, decode_content=decode_content, **kwargs) or b'')
+
+    def __getattr__(self, item):
+        return getattr(self._raw, item)
+
 
 def requests_retry_session(
         retries=5,
         backoff_factor=0.3,
         session=None,
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
 ) -> requests.session:
     """
     Creates or modifies a session object for retrying requests if they fail.
     :param retries: How often a Retry should be done
     :param backoff_factor: Look at the official Requests documentation
     :param session: A session object, if not given one will be created.
+    :param cache: A ResponseCache, if given Moodle pages are answered from the cache.
+    :param limiter: A AdaptiveLimiter, if given it limits the amount of requests in flight.
     :return: The given or new session object.
     """
     session = session or requests.session()
@@ -43,6 +98,10 @@ def requests_retry_session(
 
     max_size = min(32, (os.cpu_count() or 1) + 4) * 3
     adapter = HTTPAdapter(max_retries=retry, pool_maxsize=max_size, pool_connections=20)
+    if limiter is not None:
+        adapter = LimiterAdapter(adapter, limiter)
+    if cache is not None:
+        adapter = CacheAdapter(adapter, cache)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
@@ -84,8 +143,7 @@ class MoodleClient:
         """Tries old cookies and sesskey.
         """
         self.session.cookies.clear()
-        self.sesskey = sesskey
-        self.userid = userid
+        self._set_user(sesskey, userid)
         self.session.cookies.update(cookies)
 
         # if no error is thrown we are logged in
@@ -97,10 +155,15 @@ class MoodleClient:
         # if not we are not logged in
 
     def clear_client(self):
-        self.sesskey = None
-        self.userid = None
+        self._set_user(None, None)
         self.session.cookies.clear()
 
+    def _set_user(self, sesskey, userid):
+        self.sesskey, self.userid = sesskey, userid
+        self._catalog = None
+        if self.cache is not None:
+            self.cache.userid = userid
+
     def login(self, username, password) -> bool:
         """Retrieves tokens and cookies for moodle.
 
@@ -131,7 +194,7 @@ class MoodleClient:
 
             m_page = MyPage.from_response(response)
 
-            self.sesskey, self.userid = m_page.sesskey, m_page.userid
+            self._set_user(m_page.sesskey, m_page.userid)
             cookies = self.session.cookies.get_dict()
             self.session.cookies.clear()
             self.session.cookies.set('MoodleSessionjkuSessionCookie', cookies['MoodleSessionjkuSessionCookie'])
@@ -168,6 +231,7 @@ class MoodleClient:
         CoursePage not required.
 
         :param courses: A List of courses to load the evaluation from. Course.course_page doesn't need to be loaded.
+        A Iterator is consumed while the pages are loaded, at most PAGES_WINDOW courses ahead.
         :return: Generator[Tuple[Course, List[Evaluation]]] The Course is the same Object as the input and doesn't change.
         """
 
@@ -177,12 +241,18 @@ class MoodleClient:
         if courses is None:
             courses = list(self.courses(load_pages=False))
 
-        futures = [self.future_session.get(
-            f'https://moodle.jku.at/jku/course/user.php?mode=grade&id={course.id}&user={self.userid}', timeout=5,
-            hooks={'response': lambda r, c=course, *args, **kwargs: build_valuation(r, c)}) for
-            course in courses]
+        if self.parse_executor is not None:
+            yield from self._parse_pages(
+                courses, lambda c: f'https://moodle.jku.at/jku/course/user.php?mode=grade&id={c.id}&user={self.userid}',
+                parse_evaluations)
+            return
+
+        def load(c):
+            return self.future_session.get(
+                f'https://moodle.jku.at/jku/course/user.php?mode=grade&id={c.id}&user={self.userid}', timeout=5,
+                hooks=self._hooks(lambda r, *args, **kwargs: build_valuation(r, c)))
 
-        for f in as_completed(futures):
+        for _, f in self._windowed(courses, load):
             try:
                 result = f.result()
                 yield result.data
@@ -191,55 +261,117 @@ class MoodleClient:
             except Exception as e:
                 print_exc(e)
 
-    def courses(self, load_pages: Union[bool, List[Course]] = True, filter_exp: Callable[[Course], bool] = None) -> \
-            Generator[Course, None, None]:
+    def ajax_batch(self, calls: List[Dict[str, Any]], max_calls=AJAX_MAX_CALLS, max_bytes=AJAX_MAX_BYTES) -> \
+            List[Union[Any, AjaxError]]:
+        """Sends multiple Moodle AJAX web service calls with as few requests as possible.
+        The calls are packed into size-bounded lib/ajax/service.php POSTs, which are sent concurrently.
+
+        Moodle stops processing a POST at the first failing call, the calls after it are sent again in a new POST.
+
+        :param calls: A List of dicts with 'methodname' and 'args' (e.g. {'methodname': ..., 'args': {...}}).
+        :param max_calls: Max amount of calls in one POST.
+        :param max_bytes: Max size of the json body of one POST. A single bigger call is sent alone.
+        :return: A List with the 'data' of each call in the same order as calls.
+        If a call failed, a AjaxError is at its position instead.
+        :raises NotLoggedInError: If user isn't logged in.
+        """
+        results: List[Union[Any, AjaxError]] = [None] * len(calls)
+
+        chunks, chunk, chunk_size = [], [], 2
+        for i, call in enumerate(calls):
+            size = len(json.dumps({'index': i, 'methodname': call['methodname'], 'args': call.get('args', {})})) + 1
+            if chunk and (len(chunk) >= max_calls or chunk_size + size > max_bytes):
+                chunks.append(chunk)
+                chunk, chunk_size = [], 2
+            chunk.append(i)
+            chunk_size += size
+        if chunk:
+            chunks.append(chunk)
+
+        def post(indices):
+            data = [{'index': idx, 'methodname': calls[i]['methodname'], 'args': calls[i].get('args', {})}
+                    for idx, i in enumerate(indices)]
+            methods = ','.join(sorted({calls[i]['methodname'] for i in indices}))
+            return self.future_session.post(f'{AJAX_URL}?sesskey={self.sesskey}&info={methods}', json=data)
+
+        pending = {post(c): c for c in chunks}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                indices = pending.pop(f)
+                answers = f.result().json()
+                for i, answer in zip(indices, answers):
+                    if answer.get('error'):
+                        results[i] = AjaxError(calls[i]['methodname'], answer.get('exception'))
+                    else:
+                        results[i] = answer.get('data')
+                if len(answers) == 0:
+                    for i in indices:
+                        results[i] = AjaxError(calls[i]['methodname'])
+                elif len(answers) < len(indices):
+                    pending[post(indices[len(answers):])] = indices[len(answers):]
+        return results
+
+    def courses(self, load_pages: Union[bool, List[Course]] = True, filter_exp: Callable[[Course], bool] = None,
+                use_service: bool = False, compact: bool = False,
+                skip: Collection[str] = SKIPPED_FIELDS) -> Generator[Course, None, None]:
         """Loads all the moodle Courses.
 
         :param load_pages: If True the course.course_page will be loaded. This takes more time, as each page needs to
         be loaded individually. If load_pages is set to a List of Courses, only the course_page's will be loaded.
         :param filter_exp: If not None, the filter will be applied to filter the Courses.
         This speeds up Page loading.
-        :return: Returns a Generator for all (filtered) Courses.
+        :param use_service: If True the course_page's are loaded as CourseContents from the
+        core_course_get_contents web service in a few batched requests. Courses for which the service isn't available
+        fall back to a CoursePage.
+        :param compact: If True the links and sections are extracted as soon as a page is loaded and the course_page is
+        a ParsedCoursePage. Neither the lxml tree nor the response is kept, so loading many courses needs little memory.
+        The page is only loaded again if ParsedCoursePage.page() is called.
+        :param skip: Fields of the courses that aren't kept, see Course.from_json. By default the courseimage and the
+        summary are skipped, pass () to keep all fields.
+        :return: Returns a Generator for all (filtered) Courses. The pages of Courses from load_pages are loaded into
+        them, the pages of the catalog are loaded into copies, so the courses of the catalog never keep a page.
         """
         if type(load_pages) is list:
             courses_json = load_pages
+            if filter_exp is not None:
+                courses_json = filter(filter_exp, courses_json)
+        elif load_pages is False:
+            for co in self._catalog_courses(skip):
+                if filter_exp is None or filter_exp(co):
+                    yield co
+            return
         else:
-            headers = {'Content-type': 'application/json'}
-            response = self.session.post(
-                f'https://moodle.jku.at/jku/lib/ajax/service.php?sesskey={self.sesskey}',
-                data=json.dumps(
-                    [{"index": 0, "methodname": "core_course_get_enrolled_courses_by_timeline_classification",
-                      "args": {"offset": 0, "limit": 0, "classification": "all", "sort": "fullname"}},
-                     {"index": 1, "methodname": "core_course_get_enrolled_courses_by_timeline_classification",
-                      "args": {"offset": 0, "limit": 0, "classification": "hidden", "sort": "fullname"}}]),
-                headers=headers)
-
-            courses_json = json.loads(response.content.decode('utf-8'))[0]['data']['courses'] + \
-                           json.loads(response.content.decode('utf-8'))[1]['data']['courses']
-
-            if load_pages is False:
-                for c in courses_json:
-                    co = Course(**c)
-                    if filter_exp is not None and filter_exp(co):
-                        yield co
-                    elif filter_exp is None:
-                        yield co
-                return
-            else:
-                courses_json = [Course(**c) for c in courses_json]
-
-        if filter_exp is not None:
-            courses_json = filter(filter_exp, courses_json)
+            courses_json = [replace(c) for c in self.catalog(skip=skip) if filter_exp is None or filter_exp(c)]
+
+        if use_service:
+            courses_json = list(courses_json)
+            loaded = set()
+            for c in self._course_contents(courses_json, compact):
+                loaded.add(id(c))
+                yield c
+            courses_json = [c for c in courses_json if id(c) not in loaded]
+
+        if self.parse_executor is not None:
+            for c, course_data in self._parse_pages(courses_json, lambda c: c.viewurl, parse_course_data):
+                c.course_page = ParsedCoursePage(course_data, c.viewurl, partial(self._course_page, c.viewurl))
+                yield c
+            return
 
         def build_course(r, c):
-            c.course_page = CoursePage(r)
+            if compact:
+                c.course_page = ParsedCoursePage(CoursePage(r).to_course_data(), c.viewurl,
+                                                 partial(self._course_page, c.viewurl))
+            else:
+                c.course_page = CoursePage(r)
             r.data = c
 
-        futures = [self.future_session.get(c.viewurl, timeout=5,
-                                           hooks={'response': lambda r, c=c, *args, **kwargs: build_course(r, c)})
-                   for c in courses_json]
+        def load(c):
+            return self.future_session.get(c.viewurl, timeout=5,
+                                           hooks=self._hooks(lambda r, *args, **kwargs: build_course(r, c)))
 
-        for f in as_completed(futures):
+        # no reference to the futures is kept, so the responses are released after they are yielded
+        for _, f in self._windowed(courses_json, load):
             try:
                 result = f.result()
                 yield result.data
@@ -248,6 +380,155 @@ class MoodleClient:
             except Exception as e:
                 print_exc(e)
 
+    def catalog(self, refresh: bool = False, skip: Collection[str] = SKIPPED_FIELDS) -> CourseCatalog:
+        """Returns the CourseCatalog of all enrolled courses.
+        The catalog is loaded once and reused until the next login (or refresh, or other skipped fields).
+
+        :param refresh: If True the courses are loaded again.
+        :param skip: Fields of the courses that aren't kept, see Course.from_json. By default the courseimage and the
+        summary are skipped, pass () to keep all fields.
+        :return: The CourseCatalog.
+        """
+        if self._catalog is None or refresh or self._catalog_skip != frozenset(skip):
+            self._set_catalog(self.enrolled_courses(skip=skip), skip)
+        return self._catalog
+
+    def _catalog_courses(self, skip: Collection[str] = SKIPPED_FIELDS) -> Generator[Course, None, None]:
+        """Yields the courses of the catalog. If it isn't loaded yet the courses are yielded while they are loaded,
+        and the catalog is set once all of them are loaded."""
+        if self._catalog is not None and self._catalog_skip == frozenset(skip):
+            yield from self._catalog
+            return
+        courses = []
+        for c in self.enrolled_courses(skip=skip):
+            courses.append(c)
+            yield c
+        self._set_catalog(courses, skip)
+
+    def _set_catalog(self, courses: Iterable[Course], skip: Collection[str]):
+        self._catalog = CourseCatalog(courses)
+        self._catalog_skip = frozenset(skip)
+
+    def enrolled_courses(self, classifications: Tuple[str, ...] = ('all', 'hidden'), page_size: int = COURSES_PAGE_SIZE,
+                         skip: Collection[str] = SKIPPED_FIELDS) -> Generator[Course, None, None]:
+        """Loads the enrolled courses with core_course_get_enrolled_courses_by_timeline_classification.
+        The courses are loaded in pages of page_size and each course is yielded as soon as it is decoded from the
+        response, so the first courses are available before the whole list is loaded.
+
+        :param classifications: The classifications to load, all doesn't include the hidden courses.
+        :param page_size: Amount of courses per request, 0 loads all courses at once.
+        :param skip: Fields of the courses that aren't kept, see Course.from_json.
+        :return: A Generator of the courses, in the order of moodle (sorted by fullname).
+        :raises NotLoggedInError: If the session isn't logged in anymore.
+        :raises AjaxError: If moodle returns a error.
+        """
+        methodname = 'core_course_get_enrolled_courses_by_timeline_classification'
+        for classification in classifications:
+            offset = 0
+            while True:
+                data = [{'index': 0, 'methodname': methodname,
+                         'args': {'offset': offset, 'limit': page_size, 'sort': 'fullname',
+                                  'classification': classification}}]
+                count = 0
+                with self.session.post(f'{AJAX_URL}?sesskey={self.sesskey}&info={methodname}', json=data,
+                                       stream=True) as response:
+                    courses = JsonArrayStream(response.iter_content(COURSES_CHUNK_SIZE), 'courses',
+                                              declared_encoding(response))
+                    for c in courses:
+                        count += 1
+                        yield Course.from_json(c, skip)
+                answer = json.loads(courses.rest)[0]
+                if answer.get('error'):
+                    if self._is_login_error(answer):
+                        raise NotLoggedInError('Please Login')
+                    raise AjaxError(methodname, answer.get('exception'))
+                next_offset = answer['data'].get('nextoffset', 0)
+                # moodle fills every page, a page with less courses is the last one
+                if page_size == 0 or count < page_size or next_offset <= offset:
+                    break
+                offset = next_offset
+
+    def _course_page(self, url: str) -> CoursePage:
+        return CoursePage(self.session.get(url))
+
+    @staticmethod
+    def _windowed(items: Iterable, submit: Callable[[Any], Future]) -> Generator[Tuple[Any, Future], None, None]:
+        """Calls submit for every item, but only for PAGES_WINDOW items at once. The next item is taken from items
+        when a future finished, so a lazy Iterator isn't consumed before the first results are yielded.
+
+        :return: Generator[Tuple[item, Future]] in the order the futures finish.
+        """
+        items = iter(items)
+        pending = {submit(i): i for i in islice(items, PAGES_WINDOW)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                item = pending.pop(f)
+                pending.update((submit(i), i) for i in islice(items, 1))
+                yield item, f
+
+    def _parse_pages(self, items: Iterable, url: Callable[[Any], str], parse: Callable[[bytes, str, str], Any]) -> \
+            Generator[Tuple[Any, Any], None, None]:
+        """Loads a page for every item and parses it in the parse_executor.
+        The network threads only submit the body of the responses, so the parsing isn't serialized by the GIL.
+        At most PAGES_WINDOW items are loaded or parsed at once.
+
+        :param items: The items to load the pages for.
+        :param url: Returns the url of the page of a item.
+        :param parse: A picklable function, called with (content, encoding, url) of a page.
+        :return: Generator[Tuple[item, result of parse]] in the order the pages are parsed.
+        """
+
+        def submit(r):
+            r.data = self.parse_executor.submit(parse, r.content, declared_encoding(r), r.request.url)
+
+        hooks = self._hooks(lambda r, *args, **kwargs: submit(r))
+        items = iter(items)
+        pending = {}
+
+        def load(i):
+            pending[self.future_session.get(url(i), timeout=5, hooks=hooks)] = (i, True)
+
+        for i in islice(items, PAGES_WINDOW):
+            load(i)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                item, loading = pending.pop(f)
+                try:
+                    if loading:
+                        pending[f.result().data] = (item, False)
+                        continue
+                    yield item, f.result()
+                except (SystemExit, KeyboardInterrupt, GeneratorExit):
+                    raise
+                except Exception as e:
+                    print_exc(e)
+                # the item is done (or failed), the next one takes its place
+                for i in islice(items, 1):
+                    load(i)
+
+    def _course_contents(self, courses: List[Course], compact: bool = False) -> Generator[Course, None, None]:
+        """Loads the CourseContents of the courses with batched core_course_get_contents calls.
+        The first course is loaded alone, so that a unavailable service is only requested once.
+        Only the courses whose contents could be loaded are yielded.
+        If compact is True the course_page is a ParsedCoursePage of the contents.
+        """
+        for batch in (courses[:1], courses[1:]):
+            if len(batch) == 0:
+                continue
+            results = self.ajax_batch(
+                [{'methodname': 'core_course_get_contents', 'args': {'courseid': c.id}} for c in batch])
+            for c, r in zip(batch, results):
+                if not isinstance(r, AjaxError):
+                    c.course_page = CourseContents(r, c.viewurl)
+                    if compact:
+                        c.course_page = ParsedCoursePage(c.course_page.to_course_data(), c.viewurl,
+                                                         partial(self._course_page, c.viewurl))
+                    yield c
+            if isinstance(results[0], AjaxError) and results[0].errorcode == 'servicenotavailable':
+                return
+
     def calendar(self, limit=26) -> List[Event]:
         """Gets the calendar entries. (Assignments, Exams etc.)
 
@@ -259,44 +540,41 @@ class MoodleClient:
                  "args": {"limitnum": limit, "timesortfrom": int(time.time()), "limittononsuspendedevents": True}}]
         response = self.session.post(url, json=data)
 
-        events = []
-        for o in response.json()[0]['data']['events']:
-            event = Event(
-                o['id'],
-                o['name'],
-                o['description'],
-                o['modulename'],
-                o['eventtype'],
-                o['timestart'],
-                o['timesort'],
-                o['course']['fullname'],
-                o['course']['id'],
-                o['url'])
-            events.append(event)
-        return events
+        return [Event.from_json(o) for o in response.json()[0]['data']['events']]
+
+    def _hooks(self, callback) -> Dict[str, list]:
+        """Returns the response hooks for a request with its own callback.
+        The hooks of a request replace the hooks of the session, so the session's hooks (metrics and check_request)
+        are added in front of the callback.
+
+        :param callback: A response hook, called after the hooks of the session.
+        :return: The hooks argument of the request.
+        """
+        return {'response': self.session.hooks['response'] + [callback]}
 
     @staticmethod
     def check_request(r, *args, **kwargs):
         """Takes a response object and checks if the user is logged in. If keywords like 'login' or 'enroll' are
         found in the url, the user seems to be logged out.
 
+        Streamed responses (stream=True) are checked with check_streamed_request, so that downloads are never
+        buffered in memory.
+
         :param r: Response that should be checked for logout.
         :param args:
-        :param kwargs:
+        :param kwargs: The send kwargs from requests, stream is used to select the validation mode.
         :return: returns the response.
 
         :raises Exception: If user isn't logged in.
         """
-        if (r.headers.get('Content-Type') == 'application/json; charset=utf-8' or r.headers.get(
-                'Content-Type') == 'application/json') and 'moodle.jku.at' in r.url:
+        if kwargs.get('stream'):
+            return MoodleClient.check_streamed_request(r)
+        if MoodleClient._is_json(r):
             j = r.json()
-            if type(j) is list and type(j[0]) is dict and 'error' in j[0] and j[0]['error'] is True:
+            if type(j) is list and type(j[0]) is dict and MoodleClient._is_login_error(j[0]):
                 raise NotLoggedInError('Please Login')
         else:
-            if '<a href="https://moodle.jku.at/jku/login/index.php">' in r.text and r.is_redirect:
-                raise NotLoggedInError('Please Login')
-            if '<title>jku: Dashboard (Guest)</title>' in r.text or '<title>jku: Dashboard (Gast)</title>' in r.text:
-                raise NotLoggedInError('Please login.')
+            MoodleClient._check_html(r.text, r)
 
         def check_url(url, redirect_url, redirect):
             if ('enroll' in redirect_url and (('enroll' not in url) or redirect)) or (
@@ -308,14 +586,85 @@ class MoodleClient:
         #    check_url(r.request.url, h.url, h.is_redirect)
         return r
 
-    def __init__(self, pool_executor=ThreadPoolExecutor(max_workers=4)):
+    @staticmethod
+    def check_streamed_request(r):
+        """Checks a streamed response for logout without reading its body.
+        The decision is made from the status, the headers and the redirect chain. Only html and json responses
+        are peeked at, html for the first LOGIN_CHECK_PREFIX bytes and json only for the first
+        LOGIN_CHECK_JSON_PREFIX bytes, so a streamed json array can be decoded before most of it is received.
+        The peeked bytes are handed back to the response, so iter_content still returns the whole body.
+
+        :param r: A response which was requested with stream=True.
+        :return: returns the response.
+
+        :raises NotLoggedInError: If user isn't logged in.
+        """
+        for h in r.history + [r]:
+            if h.is_redirect and h.headers.get('Location', '').startswith(LOGIN_URL):
+                raise NotLoggedInError('Please login.')
+
+        content_type = r.headers.get('Content-Type', '')
+        if not (content_type.startswith('text/html') or MoodleClient._is_json(r)) or r.raw is None:
+            return r
+
+        is_json = MoodleClient._is_json(r)
+        prefix = r.raw.read(LOGIN_CHECK_JSON_PREFIX if is_json else LOGIN_CHECK_PREFIX, decode_content=True) or b''
+        r.raw = PrefixedStream(prefix, r.raw)
+        text = prefix.decode(r.encoding or 'utf-8', errors='replace')
+        if is_json:
+            if re.match(r'\s*\[\s*\{\s*"error"\s*:\s*true', text) and (
+                    '"errorcode"' not in text or any(f'"{code}"' in text for code in LOGIN_ERRORCODES)):
+                raise NotLoggedInError('Please Login')
+        else:
+            MoodleClient._check_html(text, r)
+        return r
+
+    @staticmethod
+    def _is_login_error(result: dict) -> bool:
+        """A failed AJAX call is a login error, if moodle reports a session errorcode or no errorcode at all.
+        Other errors belong to the single call and are reported by ajax_batch.
+        """
+        if result.get('error') is not True:
+            return False
+        exception = result.get('exception')
+        return type(exception) is not dict or exception.get('errorcode') in LOGIN_ERRORCODES + (None,)
+
+    @staticmethod
+    def _is_json(r) -> bool:
+        return (r.headers.get('Content-Type') == 'application/json; charset=utf-8' or r.headers.get(
+            'Content-Type') == 'application/json') and 'moodle.jku.at' in r.url
+
+    @staticmethod
+    def _check_html(text, r):
+        if f'<a href="{LOGIN_URL}">' in text and r.is_redirect:
+            raise NotLoggedInError('Please Login')
+        if '<title>jku: Dashboard (Guest)</title>' in text or '<title>jku: Dashboard (Gast)</title>' in text:
+            raise NotLoggedInError('Please login.')
+
+    def __init__(self, pool_executor=ThreadPoolExecutor(max_workers=4), cache: Optional[ResponseCache] = None,
+                 limiter: Optional[AdaptiveLimiter] = None, metrics: Optional[MetricsCollector] = None,
+                 parse_executor: Optional[Executor] = None):
         """Initializes a MoodleClient, a client can load Data from Moodle.
 
-        :param pool_executor: A instance of a ThreadPoolExecutor.
+        :param pool_executor: A instance of a ThreadPoolExecutor. With a limiter it should have limiter.ceiling
+        workers.
+        :param cache: A ResponseCache for course, grade and grade overview pages. Disabled if None.
+        :param limiter: A AdaptiveLimiter which adapts the amount of requests in flight to the server.
+        :param metrics: A MetricsCollector which records every response of both sessions.
+        :param parse_executor: A ProcessPoolExecutor for parsing course and grade pages. If None the pages are parsed
+        in the threads of pool_executor. Courses loaded with it have a ParsedCoursePage instead of a CoursePage.
         """
-        self.session = requests_retry_session()
+        self.cache = cache
+        self.limiter = limiter
+        self.session = requests_retry_session(cache=cache, limiter=limiter)
         self.session.hooks['response'].append(self.check_request)
+        # the future_session sends its requests with self.session, so its own hooks are never used
         self.future_session = requests_retry_session_async(session=self.session, executor=pool_executor)
-        self.future_session.hooks['response'].append(self.check_request)
+        self.metrics = metrics
+        self.parse_executor = parse_executor
+        if metrics is not None:
+            self.session.hooks['response'].insert(0, metrics.record)
         self.sesskey = None
         self.userid = None
+        self._catalog = None
+        self._catalog_skip = None
@@ -0,0 +1,107 @@
+import os
+from typing import Callable, Optional, Tuple, Dict, List
+from urllib.parse import urlparse
+
+from pymoodle_jku.classes.course_data import UrlType
+
+YOUTUBE_HOSTS = ('youtube.com', 'youtu.be')
+
+
+class Lane:
+    def __init__(self, name: str, workers: Optional[int] = None, pool: str = 'thread'):
+        """
+        A lane has its own executor, so downloads in one lane never wait for the workers of another lane.
+
+        :param name: Name of the lane.
+        :param workers: Max amount of downloads at once. If None thread lanes use the ceiling of the client's limiter
+        and subprocess lanes half of the cpus.
+        :param pool: 'thread' for handlers that download in the python process, 'subprocess' for handlers that mostly
+        wait for a external program like ffmpeg.
+        """
+        if pool not in ('thread', 'subprocess'):
+            raise ValueError(f'unknown pool {pool}')
+        self.name = name
+        self.workers = workers
+        self.pool = pool
+
+    def size(self, limiter=None) -> int:
+        """Returns the amount of workers of the lane."""
+        if self.workers is not None:
+            return self.workers
+        if self.pool == 'subprocess':
+            return max(1, (os.cpu_count() or 2) // 2)
+        return limiter.ceiling if limiter is not None else min(32, (os.cpu_count() or 1) + 4)
+
+
+class DownloadHandler:
+    def __init__(self, url_type: UrlType, download: Callable, lane: str = 'files', hosts: Tuple[str, ...] = ()):
+        """
+        Downloads the items of one UrlType (and host).
+
+        :param url_type: The UrlType the handler downloads.
+        :param download: Called with (DownloadManager, item, path), returns (finished, url, path) or a Handoff.
+        :param lane: Name of the lane the downloads run in.
+        :param hosts: If given the handler is only used for links to these hosts (or their subdomains).
+        """
+        self.url_type = url_type
+        self.download = download
+        self.lane = lane
+        self.hosts = hosts
+
+    def matches(self, item) -> bool:
+        if getattr(item, 'type', None) is not self.url_type:
+            return False
+        if len(self.hosts) == 0:
+            return True
+        host = urlparse(item.link).hostname or ''
+        return any(host == h or host.endswith('.' + h) for h in self.hosts)
+
+
+class Handoff:
+    def __init__(self, lane: str, download: Callable, *args):
+        """
+        Returned by a handler if the download should continue in another lane, e.g. a moodle url that redirects to
+        YouTube.
+
+        :param lane: The lane that continues the download.
+        :param download: Called with (DownloadManager, *args), returns (finished, url, path).
+        """
+        self.lane = lane
+        self.download = download
+        self.args = args
+
+
+LANES: Dict[str, Lane] = {
+    'files': Lane('files'),
+    'quiz': Lane('quiz', workers=4),
+    'media': Lane('media', workers=2, pool='subprocess'),
+}
+
+# the first matching handler is used, handlers with hosts come first
+HANDLERS: List[DownloadHandler] = [
+    DownloadHandler(UrlType.Url, lambda dm, l, path: dm.download_youtube(l.link, l.link, path), 'media',
+                    YOUTUBE_HOSTS),
+    DownloadHandler(UrlType.Quiz, lambda dm, l, path: dm.download_evaluation(l, path), 'quiz'),
+    DownloadHandler(UrlType.Resource, lambda dm, l, path: dm.get_request(l.link, path)),
+    DownloadHandler(UrlType.Folder, lambda dm, l, path: dm.post_request(l.link, path)),
+    DownloadHandler(UrlType.Streamurl, lambda dm, l, path: dm._download_stream(l, path), 'media'),
+    DownloadHandler(UrlType.Url, lambda dm, l, path: dm.download_from_url(l.link, path)),
+]
+
+
+def register_handler(handler: DownloadHandler, lane: Optional[Lane] = None) -> None:
+    """Registers a handler in front of the existing ones, so it replaces them for its UrlType (and hosts).
+
+    :param handler: The new handler.
+    :param lane: The lane of the handler, if it doesn't exist yet.
+    """
+    if lane is not None:
+        LANES[lane.name] = lane
+    if handler.lane not in LANES:
+        raise ValueError(f'unknown lane {handler.lane}')
+    HANDLERS.insert(0, handler)
+
+
+def find_handler(item, handlers: List[DownloadHandler] = HANDLERS) -> Optional[DownloadHandler]:
+    """Returns the first handler for item or None if it can't be downloaded."""
+    return next((h for h in handlers if h.matches(item)), None)
@@ -1,23 +1,35 @@
+import hashlib
+import json
 import logging
+import os
 import re
+import functools
+import queue
 import subprocess
-import time
+import threading
 import traceback
-from concurrent.futures import as_completed
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import as_completed, Future
 from concurrent.futures.thread import ThreadPoolExecutor
 from pathlib import Path
-from typing import Tuple, Optional, List
-from urllib.parse import unquote, urlparse
+from typing import Tuple, Optional, List, Dict, Iterable, Union, Callable, Any
+from urllib.parse import unquote, urlparse, urljoin
 
 import iouuid
 from lxml import html
 from pytube import YouTube
+from sty import fg
 
 from pymoodle_jku.classes.course_data import UrlType, Url
 from pymoodle_jku.classes.evaluation import Evaluation
 from pymoodle_jku.client.client import MoodleClient
+from pymoodle_jku.client.download_handlers import HANDLERS, LANES, Handoff, find_handler
+from pymoodle_jku.client.hls import HlsDownloader
 from pymoodle_jku.client.html_parser import QuizSummary, QuizPage
-from pymoodle_jku.utils.net_usage import net_usage
+from pymoodle_jku.utils.dedup import BlobStore, file_digest
+from pymoodle_jku.utils.manifest import SyncManifest
+from pymoodle_jku.utils.net_usage import TokenBucket, InterfaceSampler, mbit_to_bytes
 from pymoodle_jku.utils.printing import print_exc, yn_question
 
 logger = logging.getLogger(__name__)
@@ -38,51 +50,149 @@ def rsuffix(suffix) -> str:
         return suffix
 
 
+PRIORITIES = {
+    'page': None,
+    'smallest': lambda item, size, content_type: (size is None, size or 0),
+}
+
+
+class CourseDownloads:
+    def __init__(self, urls, path: Path, name: Optional[str] = None, course_id: Optional[int] = None):
+        """
+        The urls of one course (or any other group of urls) that are downloaded into the same directory.
+
+        :param urls: A List of Objects to download.
+        :param path: The directory where the downloads are stored.
+        :param name: Name that is printed when the group is done, defaults to the name of path.
+        :param course_id: The id of the course, stored in the manifest.
+        """
+        self.urls = urls
+        self.path = Path(path)
+        self.name = name or self.path.name
+        self.course_id = course_id
+        self.done: List[Tuple[str, Path]] = []
+        self.failed = []
+        self.pending = 0
+
+
 class DownloadManager:
-    def __init__(self, urls, client: 'MoodleClient', path, download_speed, net_interface):
+    def __init__(self, urls, client: 'MoodleClient', path, download_speed: Optional[float] = None,
+                 net_interface: Optional[str] = None, manifest: Optional[SyncManifest] = None,
+                 course_id: Optional[int] = None, store: Optional[BlobStore] = None, segments: int = 1,
+                 segment_threshold: int = 64 * 1024 * 1024,
+                 priority: Union[None, str, Callable[[object, Optional[int], Optional[str]], Any]] = None):
         """Takes Objects which should be downloaded with a Moodle client.
 
         :param urls: A List of Objects to download. The DownloadManager will check if these are downloadable.
+        More urls for other directories can be given with the sources of download.
         :param client: A instance of a MoodleClient, that should be logged in.
         :param path: The directory where downloads are stored.
+        :param download_speed: Max download speed in Mbit/s for all downloads together. Unlimited if None.
+        :param net_interface: If given, the traffic of other programs on this interface is sampled in the background
+        and subtracted from download_speed.
+        :param manifest: A SyncManifest, every finished download is recorded in it.
+        :param course_id: The id of the course the urls belong to, stored in the manifest.
+        :param store: A BlobStore, downloaded files are stored once in it and linked into path.
+        :param segments: Files bigger than segment_threshold are downloaded with this many range requests at once, if
+        the server supports ranges.
+        :param segment_threshold: Min size in bytes for segmented downloads.
+        :param priority: If not None the size and Content-Type of Resources and Urls are probed before they are
+        queued and each lane downloads in the order of priority(item, size, content_type) (smallest first).
+        Can also be a name of PRIORITIES. None downloads in page order.
         """
-        self.futures = []
         self.urls = urls
+        self.groups = [CourseDownloads(urls, path, course_id=course_id)]
         self.failed = []
         self.done: List[Tuple[str, Path]] = []
         self.client = client
         self.path = Path(path)
         self.download_speed = download_speed
         self.net_interface = net_interface
+        self.bandwidth = TokenBucket(mbit_to_bytes(download_speed)) if download_speed else None
+        self.manifest = manifest
+        self.store = store
+        self.segments = segments
+        self.segment_threshold = segment_threshold
+        self.file_info: Dict[str, Tuple[Optional[str], Optional[str]]] = {}  # url: (etag, last_modified)
+        self.handlers = list(HANDLERS)
+        self.priority = PRIORITIES[priority] if type(priority) is str else priority
+        self.probes: Dict[str, Tuple[Optional[int], Optional[str]]] = {}  # link: (size, content_type)
+        self._images: Dict[str, Future] = {}
+        self._images_lock = threading.Lock()
+        self._image_pool: Optional[ThreadPoolExecutor] = None
+        self.lanes = dict(LANES)
+
+    def _chunk_size(self) -> int:
+        return self.bandwidth.chunk_size() if self.bandwidth is not None else 1024 * 1024
+
+    def _throttle(self, size: int) -> None:
+        """Blocks until the bandwidth limit allows size more bytes."""
+        if self.bandwidth is not None:
+            self.bandwidth.consume(size)
+
+    @staticmethod
+    def _part_files(url, path: Path) -> Tuple[Path, Path]:
+        """Returns the .part file and its metadata file for a url in path.
+        The names only depend on the url, so a interrupted download is found again by the next run.
+        """
+        key = hashlib.sha1(url.encode()).hexdigest()[:16]
+        return path / f'.{key}.part', path / f'.{key}.part.json'
 
-    def get_request(self, url):
+    def _resume_headers(self, url, path=None) -> dict:
+        """Builds the Range headers to continue a interrupted download of url.
+
+        :param url: The url of the download.
+        :param path: The directory of the download.
+        :return: A dict of headers, empty if there is nothing to resume.
+        """
+        part, meta = self._part_files(url, path or self.path)
+        try:
+            meta_data = json.loads(meta.read_text())
+            size = part.stat().st_size
+        except (FileNotFoundError, ValueError):
+            return {}
+        if not meta_data.get('resumable') or size == 0 or 'segments' in meta_data:
+            # segmented downloads are continued by _download_segments after the first response
+            return {}
+        headers = {'Range': f'bytes={size}-'}
+        if validator := meta_data.get('etag') or meta_data.get('last_modified'):
+            headers['If-Range'] = validator
+        return headers
+
+    def get_request(self, url, path=None):
         """Sends a GET requests to download files.
 
         :param url: Link to a file.
+        :param path: The directory of the download, defaults to self.path.
         :return: Calls process_response on return.
         """
         print(f'Starting download of {url}')
-        response = self.client.session.get(url, stream=True)
-        return self.process_response(url, response)
+        response = self.client.session.get(url, stream=True, headers=self._resume_headers(url, path))
+        return self.process_response(url, response, path=path)
 
-    def post_request(self, url):
+    def post_request(self, url, path=None):
         """Sends a POST request to download files.
+        download_folder.php creates the zip on the fly and ignores Range, so the download restarts from zero.
 
         :param url: Link to a file.
+        :param path: The directory of the download, defaults to self.path.
         :return: Calls process_response on return.
         """
         print(f'Starting download of {url}')
         response = self.client.session.post('https://moodle.jku.at/jku/mod/folder/download_folder.php',
                                             data={'id': url.split('id=')[1].split('&')[0],
-                                                  'sesskey': self.client.sesskey}, stream=True)
-        return self.process_response(url, response)
+                                                  'sesskey': self.client.sesskey}, stream=True,
+                                            headers=self._resume_headers(url, path))
+        return self.process_response(url, response, path=path)
 
-    def download_evaluation(self, l) -> Tuple[bool, str, Optional[Path]]:
+    def download_evaluation(self, l, path=None) -> Tuple[bool, str, Optional[Path]]:
         """Downloads a Evaluation or Url.Quiz Object.
 
         :param l: Evaluation or Url to download.
+        :param path: The directory of the download, defaults to self.path.
         :return: A Tuple that describes the download (finished,url,path).
         """
+        path = path or self.path
         print(f'Starting download of {l.link}')
         if type(l) is Evaluation:
             weblink = l.url
@@ -106,55 +216,97 @@ class DownloadManager:
         name = re.sub(r'[-\s]+', '-', name).strip('-_')
         name = name.replace(' ', '_')
 
-        images = [im for im in qz_page.images if im in output and 'jku.at' in urlparse(str(im)).hostname]
-        if len(qz_page.images) > 0:
-            d_path = self.path / name
+        images = [str(im) for im in qz_page.images if im in output and
+                  'jku.at' in (urlparse(str(im)).hostname or '')]
+        if len(images) > 0:
+            d_path = path / name
             try:
                 d_path.mkdir()
             except (FileNotFoundError, OSError):
                 pass
 
-            for i in images:
-                response = self.client.session.get(str(i), stream=True)
-                link, done, file = self.process_response(str(i), response, path=d_path)
-                if file is not None:
-                    output = output.replace(i, str(file.relative_to(self.path)))
+            files = {}
+            with self._image_executor() as pool:
+                futures = [self._image(i, d_path, pool) for i in images]
+                for i, f in zip(images, futures):
+                    try:
+                        if (file := f.result()) is not None:
+                            files[i] = Path(os.path.relpath(file, path)).as_posix()
+                    except (SystemExit, KeyboardInterrupt, GeneratorExit):
+                        raise
+                    except Exception as e:
+                        logger.error(e)
+            if len(files) > 0:
+                # longest first, so a url that is the prefix of another one doesn't match its beginning
+                pattern = re.compile('|'.join(re.escape(i) for i in sorted(files, key=len, reverse=True)))
+                output = pattern.sub(lambda m: files[m.group(0)], output)
 
-        filename = iouuid.generate_id(self.path / f'{name}.md', size=2)
+        filename = iouuid.generate_id(path / f'{name}.md', size=2)
 
-        with open(self.path / filename, 'w', encoding="utf-8") as f:
+        with open(path / filename, 'w', encoding="utf-8") as f:
             f.write(output)
 
         # HTML(string=html_str.decode('utf-8')).write_pdf(filename)
         # pdfkit.from_string(html_str.decode('utf-8'), filename)
 
-        return True, weblink, self.path / filename
+        return True, weblink, path / filename
 
-    def _prepare_download_source(self, l, check=False):
-        """
-        Calls the corresponding method for the object l if l is downloadable.
-        Check is to check if object is downloadable.
+    @contextmanager
+    def _image_executor(self):
+        """Yields the image pool of download. A quiz downloaded on its own gets a pool that is shut down after it."""
+        if self._image_pool is not None:
+            yield self._image_pool
+        else:
+            with ThreadPoolExecutor(max_workers=8, thread_name_prefix='download-images') as pool:
+                yield pool
+
+    def _image(self, url, path: Path, pool: ThreadPoolExecutor) -> Future:
+        """Returns a Future of the file of a quiz image. Images are downloaded once and shared by all quizzes,
+        moodle uses the same images in many questions.
+
+        :param url: The url of the image.
+        :param path: The directory where the image is stored, if it isn't downloaded yet.
+        :param pool: The executor the image is downloaded in.
+        :return: A Future of the Path of the image, None if it couldn't be downloaded.
         """
-        try:
-            if l.type is UrlType.Quiz:
-                return True if check else self.download_evaluation(l)
-            elif l.type is UrlType.Resource:
-                return True if check else self.get_request(l.link)
-            elif l.type is UrlType.Folder:
-                return True if check else self.post_request(l.link)
-            elif l.type is UrlType.Streamurl:
-                return True if check else self._download_stream(l)
-            elif l.type is UrlType.Url:
-                return True if check else self.download_from_url(l.link)
-            else:
-                if check:
-                    return False
+        with self._images_lock:
+            if url in self._images:
+                return self._images[url]
+            future = self._images[url] = pool.submit(self._download_image, url, path)
+        # outside of the lock, the callback runs right away if the download already finished
+        future.add_done_callback(lambda f: self._forget_image(url, f))
+        return future
+
+    def _forget_image(self, url, future: Future) -> None:
+        """Removes a failed image download, so the next quiz that uses the image tries again."""
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            return
+        with self._images_lock:
+            if self._images.get(url) is future:
+                del self._images[url]
+
+    def _download_image(self, url, path: Path) -> Optional[Path]:
+        response = self.client.session.get(url, stream=True)
+        done, _, file = self.process_response(url, response, path=path)
+        return file
 
-                # return false because if we later add the datatype we still want to download it.
-                def return_false(l):
-                    return False, l.link, None
+    def _prepare_download_source(self, l, path=None, check=False):
+        """
+        Calls the handler for the object l if l is downloadable.
+        Check is to check if object is downloadable. Path is the directory of the download.
+        """
+        handler = find_handler(l, self.handlers)
+        if check:
+            return handler is not None
+        if handler is None:
+            # return false because if we later add the datatype we still want to download it.
+            return False, l.link, None
+        return self._run(l, handler.download, self, l, path)
 
-                return return_false(l)
+    def _run(self, l, download, *args):
+        """Calls download(*args) and turns every exception into a failed download of l."""
+        try:
+            return download(*args)
         except KeyboardInterrupt:
             input("Want to continue?")
             if not yn_question("Still want to continue?"):
@@ -166,54 +318,166 @@ class DownloadManager:
             # traceback.print_exc()
             return False, l.link, None
 
-    def get_done_futures(self):
-        return [f.result() for f in self.futures if self._is_success(f)]
-
-    def _is_success(self, dl_future):
-        return dl_future.done() and not dl_future.cancelled() and dl_future.exception() is None
+    def _queue_group(self, group: CourseDownloads, backlogs: Dict[str, deque]) -> None:
+        """Appends the downloadable urls of group to the backlog of their handler's lane."""
+        for url in group.urls:
+            handler = find_handler(url, self.handlers)
+            if handler is None:
+                self.failed.append(url.link)
+                group.failed.append(url.link)
+                continue
+            backlogs[handler.lane].append(
+                (functools.partial(self._run, url, handler.download, self, url, group.path), url, group))
+            group.pending += 1
+        if group.pending == 0:
+            self._group_done(group)
+        elif self.priority is not None:
+            for name, backlog in backlogs.items():
+                backlogs[name] = deque(sorted(backlog, key=lambda e: self._priority(e[1])))
+
+    def _priority(self, item):
+        size, content_type = self.probes.get(getattr(item, 'link', None), (None, None))
+        return self.priority(item, size, content_type)
+
+    @staticmethod
+    def _url_link(url) -> str:
+        """Returns the link of a moodle Url that redirects to the file."""
+        if '?' in Path(url).name and '=' in Path(url).name:  # doing this for moodle download
+            return url + '&forcedownload=1&redirect=1'  # normally every other server ignores this
+        return url + '?forcedownload=1&redirect=1'
+
+    def _probe(self, urls) -> None:
+        """Loads size and Content-Type of the Resources and Urls with concurrent HEAD requests into self.probes.
+        If a server doesn't allow HEAD, the first byte is requested with a GET.
+        """
+        items = {u.link: self._url_link(u.link) if u.type is UrlType.Url else u.link for u in urls
+                 if type(u) is Url and u.type in (UrlType.Resource, UrlType.Url) and u.link not in self.probes}
+        futures = {self.client.future_session.head(link, allow_redirects=True, timeout=10): url
+                   for url, link in items.items()}
+        for f in as_completed(futures):
+            url = futures[f]
+            try:
+                r = f.result()
+                if r.status_code in (405, 501):
+                    r = self.client.session.get(items[url], headers={'Range': 'bytes=0-0'}, stream=True, timeout=10)
+                    r.close()
+                self.probes[url] = (self._probed_size(r), r.headers.get('Content-Type'))
+            except (SystemExit, KeyboardInterrupt, GeneratorExit):
+                raise
+            except Exception as e:
+                logger.info(f'probe of {url} failed: {e}')
+                self.probes[url] = (None, None)
+
+    @staticmethod
+    def _probed_size(r) -> Optional[int]:
+        if r.status_code == 206 and '/' in r.headers.get('Content-Range', ''):
+            total = r.headers['Content-Range'].rsplit('/', 1)[1]
+            return int(total) if total.isdigit() else None
+        if r.status_code == 200 and r.headers.get('Content-Encoding', 'identity') == 'identity' and \
+                (length := r.headers.get('Content-Length', '')).isdigit():
+            return int(length)
+        return None
+
+    def _plan(self, group: CourseDownloads) -> None:
+        """Probes the urls of group and prints how much will be downloaded."""
+        self._probe(group.urls)
+        sizes = [self.probes[u.link][0] for u in group.urls if type(u) is Url and u.link in self.probes]
+        known = [size for size in sizes if size is not None]
+        total = sum(known)
+        message = f'{group.name}: {len(group.urls)} items, {total / 1024 / 1024:.1f} MiB in {len(known)} files'
+        if self.download_speed:
+            message += f', ETA {total / mbit_to_bytes(self.download_speed) / 60:.1f} minutes'
+        print(message)
+
+    @staticmethod
+    def _group_done(group: CourseDownloads) -> None:
+        print(fg.li_green + f'Done with {group.name}' + fg.rs)
+
+    def _discover(self, sources, events: queue.Queue) -> None:
+        """Puts the groups of sources into events, runs in its own thread.
+        With a priority the groups are planned here, so the downloads don't wait for the probes.
+        A exception of sources is passed on with the closed event."""
+        try:
+            for urls, path, name, course_id in sources:
+                group = CourseDownloads(urls, path, name, course_id)
+                if self.priority is not None:
+                    self._plan(group)
+                events.put(('add', group))
+        except Exception as e:
+            events.put(('closed', e))
+        else:
+            events.put(('closed', None))
 
-    def download(self) -> None:
+    def download(self, sources: Optional[Iterable[Tuple[list, Path, Optional[str], Optional[int]]]] = None) -> None:
         """Downloads the urls to the path in the filesystem.
+        Every url is downloaded by the handler for its UrlType in the lane of the handler. Each lane has its own
+        executor and backlog, only as many downloads as the lane has workers are submitted at once. So big streams
+        in the media lane never block the small files in the files lane.
         Finished downloads are stored in self.done as Tuple[str, Path] (url, file).
 
+        :param sources: A Iterable of (urls, path, name, course_id), for example a generator that loads the links of
+        courses. It is consumed in a background thread while the known urls are already downloaded. Each group is
+        downloaded into its own path and 'Done with name' is printed when all of its urls finished.
         :return: Nothing
         """
-        lengths = len(self.urls)
+        events = queue.Queue()
+        if sources is not None:
+            threading.Thread(target=self._discover, args=(sources, events), daemon=True).start()
+        else:
+            events.put(('closed', None))
+        error = None
+        sampler = None
+        if self.bandwidth is not None and self.net_interface is not None:
+            sampler = InterfaceSampler(self.bandwidth, self.net_interface, mbit_to_bytes(self.download_speed))
+            sampler.start()
         try:
-            with ThreadPoolExecutor() as executor:
-                print(f"Downloading {len(self.urls)} items")
-
-                self.futures = []
-
-                for url in self.urls:
-                    if not self._prepare_download_source(url, check=True):
-                        self.failed.append(url.link)
-                        continue
-                    inet_usage = net_usage(self.net_interface)
-                    download_speed = inet_usage[0]
-                    print(f"Current net-usage:\nIN: {download_speed} Mbit/s")
-                    while download_speed > self.download_speed - 5:
-                        inet_usage = net_usage(self.net_interface)  # there is a 1 sec wait in net_usage
-                        download_speed = inet_usage[0]
-                        print(f"Current net-usage:\nIN: {download_speed} Mbit/s")
-                    self.futures.append(executor.submit(self._prepare_download_source, url))
-                    time.sleep(0.5)  # wait half a second till download started
-                for f in as_completed(self.futures):
-                    # todo reimplement as completed for my own needs
-                    try:
-                        done, url, file = f.result()
-                        logger.info(f'received: {url}')
-                        if done:
-                            self.done.append((url, file))
-                        else:
-                            self.failed.append(url)
-                    except (SystemExit, KeyboardInterrupt, GeneratorExit):
-                        raise
-                    except Exception as e:
-                        print_exc(e)
-                        logger.error(e)
-                    print(f'{len(self.done) + len(self.failed)}/{lengths}', end='\r')
-                self.futures = []
+            with ExitStack() as stack:
+                # entered first, so it is shut down after the lanes that download the quizzes
+                self._image_pool = stack.enter_context(
+                    ThreadPoolExecutor(max_workers=8, thread_name_prefix='download-images'))
+                workers = {name: lane.size(self.client.limiter) for name, lane in self.lanes.items()}
+                executors = {name: stack.enter_context(ThreadPoolExecutor(max_workers=size,
+                                                                          thread_name_prefix=f'download-{name}'))
+                             for name, size in workers.items()}
+                backlogs = {name: deque() for name in self.lanes}
+                in_flight = {name: 0 for name in self.lanes}
+                for group in self.groups:
+                    if len(group.urls) > 0:
+                        if self.priority is not None:
+                            self._plan(group)
+                        self._queue_group(group, backlogs)
+                total = sum(len(b) for b in backlogs.values())
+                finished = 0
+                closed = False
+                while True:
+                    for name, backlog in backlogs.items():
+                        while backlog and in_flight[name] < workers[name]:
+                            download, url, group = backlog.popleft()
+                            f = executors[name].submit(download)
+                            f.add_done_callback(
+                                lambda f, url=url, group=group, name=name: events.put(('done', f, url, group, name)))
+                            in_flight[name] += 1
+                    if closed and sum(in_flight.values()) == 0:
+                        break
+                    event = events.get()
+                    if event[0] == 'add':
+                        self.groups.append(event[1])
+                        pending = sum(len(b) for b in backlogs.values())
+                        self._queue_group(event[1], backlogs)
+                        total += sum(len(b) for b in backlogs.values()) - pending
+                    elif event[0] == 'closed':
+                        closed, error = True, event[1]
+                    else:
+                        f, url, group, name = event[1:]
+                        in_flight[name] -= 1
+                        if self._is_handoff(f):
+                            handoff = f.result()
+                            backlogs[handoff.lane].appendleft(
+                                (functools.partial(self._run, url, handoff.download, self, *handoff.args), url, group))
+                            continue
+                        finished += 1
+                        self._finished(f, url, group)
+                        print(f'{finished}/{total}', end='\r')
         except KeyboardInterrupt:
             if yn_question('Do you want to stop pymoodle?'):
                 raise
@@ -222,91 +486,316 @@ class DownloadManager:
         except Exception as e:
             print_exc(e)
             logger.error(e)
-
-    def download_from_url(self, url) -> Tuple[bool, str, Optional[Path]]:
+        finally:
+            if sampler is not None:
+                sampler.stop()
+            self._image_pool = None
+        if error is not None:
+            # raised after the started downloads finished, so that e.g. relogin can handle it
+            raise error
+
+    @staticmethod
+    def _is_handoff(f) -> bool:
+        return f.exception() is None and isinstance(f.result(), Handoff)
+
+    def _finished(self, f, item, group: CourseDownloads) -> None:
+        """Handles a finished download future of item in group."""
+        try:
+            done, url, file = f.result()
+            logger.info(f'received: {url}')
+            if done:
+                self.done.append((url, file))
+                group.done.append((url, file))
+                self._record(url, file, item.type.name if type(item) is Url else None, group.course_id)
+            else:
+                self.failed.append(url)
+                group.failed.append(url)
+        except (SystemExit, KeyboardInterrupt, GeneratorExit):
+            raise
+        except Exception as e:
+            print_exc(e)
+            logger.error(e)
+        finally:
+            group.pending -= 1
+            if group.pending == 0:
+                self._group_done(group)
+
+    def _record(self, url, file, url_type=None, course_id=None) -> None:
+        """Records a finished download in the manifest."""
+        if self.manifest is not None:
+            etag, last_modified = self.file_info.get(url, (None, None))
+            self.manifest.record(url, file, course_id=course_id, url_type=url_type, etag=etag,
+                                 last_modified=last_modified)
+
+    def download_from_url(self, url, path=None) -> Union[Tuple[bool, str, Optional[Path]], Handoff]:
         """Downloads a file from a url. If its a moodle url it will call process_response with the response object.
-        If its a youtube link it will download it with pytube.
+        If it redirects to YouTube the download is handed off to download_youtube in the media lane.
 
         :param url: Link to the Download.
+        :param path: The directory of the download, defaults to self.path.
         :return: A Tuple that describes the download (finished,url,path).
         """
+        path = path or self.path
         print(f'Starting download of {url}')
-        p = Path(url)
-        link = url
-        if '?' in p.name and '=' in p.name:  # doing this for moodle download
-            link += '&forcedownload=1&redirect=1'  # normally every other server ignores this
-        else:
-            link += '?forcedownload=1&redirect=1'
-        response = self.client.session.get(link, stream=True)
-        if response.url.startswith('https://www.youtube.com/watch') or response.url.startswith(
-                'youtube.com/watch') or response.url.startswith('https://youtube.com/watch'):
-            youtube = YouTube(response.url)
+        response = self.client.session.get(self._url_link(url), stream=True, headers=self._resume_headers(url, path))
+        if urlparse(response.url).hostname in ('www.youtube.com', 'youtube.com') and \
+                urlparse(response.url).path == '/watch':
             response.close()
-            highest_res_stream = youtube.streams.filter(resolution='720p', progressive=True, file_extension='mp4')
-            if len(highest_res_stream) == 0:
-                highest_res_stream = youtube.streams.filter(progressive=True, file_extension='mp4').order_by(
-                    'resolution').desc()
-                if len(highest_res_stream) != 0:
-                    download_obj = highest_res_stream[0]
-                else:
-                    return False, url, None
-            else:
-                download_obj = highest_res_stream.order_by('fps')[-1]
+            return Handoff('media', DownloadManager.download_youtube, response.url, url, path)
+        return self.process_response(url, response, path=path)
 
-            filename = download_obj.default_filename
-            filename = iouuid.generate_id(self.path / filename, size=2)
-            download_obj.download(output_path=self.path, filename=Path(filename).stem)
-            return True, url, self.path / filename
+    def download_youtube(self, watch_url, url, path=None) -> Tuple[bool, str, Optional[Path]]:
+        """Downloads a YouTube video with pytube, the 720p stream if there is one, else the highest resolution.
+
+        :param watch_url: The YouTube url of the video.
+        :param url: The url of the download, returned in the Tuple.
+        :param path: The directory of the download, defaults to self.path.
+        :return: A Tuple that describes the download (finished,url,path).
+        """
+        path = path or self.path
+        youtube = YouTube(watch_url, on_progress_callback=lambda s, chunk, r: self._throttle(len(chunk)))
+        highest_res_stream = youtube.streams.filter(resolution='720p', progressive=True, file_extension='mp4')
+        if len(highest_res_stream) == 0:
+            highest_res_stream = youtube.streams.filter(progressive=True, file_extension='mp4').order_by(
+                'resolution').desc()
+            if len(highest_res_stream) != 0:
+                download_obj = highest_res_stream[0]
+            else:
+                return False, url, None
         else:
-            return self.process_response(url, response)
+            download_obj = highest_res_stream.order_by('fps')[-1]
+
+        filename = download_obj.default_filename
+        filename = iouuid.generate_id(path / filename, size=2)
+        download_obj.download(output_path=path, filename=Path(filename).stem)
+        return True, url, path / filename
 
     def process_response(self, url, response, path=None) -> Tuple[bool, str, Optional[Path]]:
         """Processes a Response object from a given url.
-        It takes the content as chunks and writes it to the filesystem.
+        It takes the content as chunks and writes it to a .part file, which is renamed to the real filename when
+        the download is complete. If the response is a 206 continuing the .part file, the chunks are appended.
+        With a BlobStore the file is hashed while it is written and linked from the store.
 
         :param url: The url for the response.
         :param response: A response object of a request.
         :param path: A Path where the file should be stored.
         :return: A Tuple that describes the download (finished,url,path).
         """
+        if path is None:
+            path = self.path
+        part, meta = self._part_files(url, path)
+        if response.status_code == 416:
+            # the .part file doesn't fit to the file anymore, next run starts again
+            response.close()
+            part.unlink(missing_ok=True)
+            meta.unlink(missing_ok=True)
+            return False, url, None
+        resume = response.status_code == 206 and part.is_file() and meta.is_file()
+        try:
+            meta_data = json.loads(meta.read_text()) if resume else {}
+        except ValueError:
+            meta_data, resume = {}, False
+        if resume and not response.headers.get('Content-Range', '').startswith(f'bytes {part.stat().st_size}-'):
+            resume = False
+        if response.status_code == 206 and not resume:
+            # a part of the file that doesn't continue the .part file, it must never be stored as the whole file
+            response.close()
+            part.unlink(missing_ok=True)
+            meta.unlink(missing_ok=True)
+            return False, url, None
+
         if (cnt_dis := response.headers.get('Content-Disposition')) is not None:
             filename = cnt_dis.split('filename="')[1][:-1]
-            size = 1024 * 1024
-            chunk = next(response.iter_content(chunk_size=size))
-            try:
-                data = chunk.decode()
-                m = 'w'
-            except (UnicodeDecodeError, AttributeError):
-                m = 'wb'
-                data = chunk
-            if path is None:
-                path = self.path
-            filename = iouuid.generate_id(path / filename, size=2)
-            with open(path / filename, m) as file:
-                file.write(data)
-                for chunk in response.iter_content(chunk_size=size):
-                    file.write(chunk)
-            del data
-            return True, url, path / filename
+        elif resume:
+            filename = meta_data['filename']
+        else:
+            response.close()
+            return False, url, None
+
+        if resume:
+            total = meta_data.get('length')
+            self.file_info[url] = (meta_data.get('etag'), meta_data.get('last_modified'))
+        else:
+            self.file_info[url] = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            length = response.headers.get('Content-Length')
+            # with a Content-Encoding the length and ranges are about the encoded and not the written bytes
+            encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+            total = int(length) if length is not None and response.status_code == 200 and not encoded else None
+            resumable = response.headers.get('Accept-Ranges') == 'bytes' and not encoded
+            if resumable and self.segments > 1 and total is not None and total > self.segment_threshold:
+                return self._download_segments(url, response, part, meta, path / filename, total)
+            meta.write_text(json.dumps({'url': url, 'filename': filename, 'length': total, 'resumable': resumable,
+                                        'etag': response.headers.get('ETag'),
+                                        'last_modified': response.headers.get('Last-Modified')}))
+        digest = hashlib.sha256() if self.store is not None else None
+        if digest is not None and resume:
+            with open(part, 'rb') as file:
+                while block := file.read(1024 * 1024):
+                    digest.update(block)
+        # always binary, a text file bigger than one chunk would otherwise mix str and bytes writes
+        with open(part, 'ab' if resume else 'wb') as file:
+            for chunk in response.iter_content(chunk_size=self._chunk_size()):
+                self._throttle(len(chunk))
+                if digest is not None:
+                    digest.update(chunk)
+                file.write(chunk)
+
+        if total is not None and part.stat().st_size != total:
+            # connection ended early, the .part file is continued by the next run
+            return False, url, None
+
+        return True, url, self._finish(url, part, meta, path / filename, digest)
+
+    def _finish(self, url, part: Path, meta: Path, file: Path, digest=None) -> Path:
+        """Moves a complete .part file to a free name next to file (or into the store) and removes its metadata.
+        If file is the file the manifest recorded for url, the changed file replaces it.
+
+        :param url: The url of the download.
+        :param part: The complete .part file.
+        :param meta: The metadata of the .part file.
+        :param file: The wanted file.
+        :param digest: The sha256 of the .part file, calculated here if None and a store is used.
+        :return: The file with the downloaded content.
+        """
+        replace = self._recorded(url, file)
+        if self.store is not None:
+            digest = file_digest(part) if digest is None else digest.hexdigest()
+            file = self._link_blob(self.store.add(part, digest), file, replace)
         else:
+            if not replace:
+                file = file.parent / iouuid.generate_id(file, size=2)
+            os.replace(part, file)
+        meta.unlink()
+        return file
+
+    def _recorded(self, url, file: Path) -> bool:
+        """Returns True if file exists and is the file the manifest recorded for url."""
+        if self.manifest is None or not file.is_file():
+            return False
+        if (recorded := self.manifest.entries([url]).get(url, {}).get('path')) is None:
+            return False
+        recorded = self.manifest.root / recorded
+        return recorded.is_file() and os.path.samefile(recorded, file)
+
+    def _download_segments(self, url, response, part: Path, meta: Path, file: Path, total: int) -> Tuple[
+        bool, str, Optional[Path]]:
+        """Downloads a file with self.segments concurrent range requests into a preallocated .part file.
+        The first segment is read from response, which is the response of a normal GET. The other segments are
+        requested from response.url, the file a moodle link redirected to.
+        Finished segments are stored in the metadata, a interrupted download only fetches the missing ones.
+
+        :param url: The url of the file.
+        :param response: The 200 response for url.
+        :param part: The .part file.
+        :param meta: The metadata of the .part file.
+        :param file: The wanted file.
+        :param total: The size of the file.
+        :return: A Tuple that describes the download (finished,url,path).
+        """
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        size = -(-total // self.segments)
+        ranges = [(start, min(start + size, total) - 1) for start in range(0, total, size)]
+        try:
+            old = json.loads(meta.read_text())
+        except (FileNotFoundError, ValueError):
+            old = {}
+        same = (old.get('length') == total and old.get('segments') == [list(r) for r in ranges] and
+                old.get('etag') == etag and old.get('last_modified') == last_modified and
+                part.is_file() and part.stat().st_size == total)
+        done = set(old.get('done', [])) if same else set()
+        meta_data = {'url': url, 'filename': file.name, 'length': total, 'resumable': True, 'etag': etag,
+                     'last_modified': last_modified, 'segments': ranges, 'done': sorted(done)}
+        meta.write_text(json.dumps(meta_data))
+        if not same:
+            with open(part, 'wb') as f:
+                f.truncate(total)
+        lock = threading.Lock()
+
+        def fetch(i) -> bool:
+            start, end = ranges[i]
+            if i == 0:
+                r = response
+            else:
+                headers = {'Range': f'bytes={start}-{end}'}
+                if validator := etag or last_modified:
+                    headers['If-Range'] = validator
+                r = self.client.session.get(response.url, stream=True, headers=headers)
+                if r.status_code != 206 or not r.headers.get('Content-Range', '').startswith(f'bytes {start}-{end}/'):
+                    r.close()
+                    return False
+            if not self._write_range(r, part, start, end):
+                return False
+            with lock:
+                done.add(i)
+                meta_data['done'] = sorted(done)
+                meta.write_text(json.dumps(meta_data))
+            return True
+
+        missing = [i for i in range(len(ranges)) if i not in done]
+        if 0 not in missing:
             response.close()
+        with ThreadPoolExecutor(max_workers=len(missing) or 1) as executor:
+            results = list(executor.map(fetch, missing))
+        if not all(results) or part.stat().st_size != total:
             return False, url, None
+        return True, url, self._finish(url, part, meta, file)
+
+    def _write_range(self, response, part: Path, start: int, end: int) -> bool:
+        """Writes the body of response to part from start to end (inclusive).
+
+        :return: True if exactly end - start + 1 bytes were written.
+        """
+        length = end - start + 1
+        written = 0
+        try:
+            with open(part, 'r+b') as f:
+                f.seek(start)
+                for chunk in response.iter_content(chunk_size=self._chunk_size()):
+                    chunk = chunk[:length - written]
+                    self._throttle(len(chunk))
+                    f.write(chunk)
+                    written += len(chunk)
+                    if written == length:
+                        break
+        finally:
+            response.close()
+        return written == length
 
-    def _download_stream_with_ffmpeg(self, url, filename):
+    def _link_blob(self, blob: Path, file: Path, replace: bool = False) -> Path:
+        """Links a blob to file, if file already has the content of the blob no copy with a new name is created.
+
+        :param blob: A blob of the store.
+        :param file: The wanted file.
+        :param replace: If True an existing file is replaced, else the blob is linked to a free name next to file.
+        :return: The file with the blob's content.
+        """
+        if self.store.has_content(blob, file):
+            return file
+        if replace:
+            file.unlink(missing_ok=True)
+        else:
+            file = file.parent / iouuid.generate_id(file, size=2)
+        self.store.link(blob, file)
+        return file
+
+    def _download_stream_with_ffmpeg(self, url, file):
         process = subprocess.Popen(
             ['ffmpeg', '-y', '-protocol_whitelist', 'file,blob,http,https,tcp,tls,crypto', '-i',
              url,
              '-c', 'copy',
-             self.path / filename], stderr=subprocess.DEVNULL)
+             file], stderr=subprocess.DEVNULL)
         return_code = process.wait(timeout=30 * 60)
         return return_code
 
-    def _download_stream(self, l: Url) -> Tuple[bool, str, Optional[Path]]:
-        """Downloads a stream with ffmpeg to the filesystem.
+    def _download_stream(self, l: Url, path=None) -> Tuple[bool, str, Optional[Path]]:
+        """Downloads a stream to the filesystem. HLS streams are downloaded with the HlsDownloader, everything else
+        (or playlists it can't read) with ffmpeg.
 
         :param l: A Url object to download.
+        :param path: The directory of the download, defaults to self.path.
         :return: A Tuple that describes the download (finished,url,path).
         """
+        path = path or self.path
         print(f'Starting download of {l.link}')
         response = self.client.session.get(l.link)
         tree = html.fromstring(response.content.decode('utf-8'))
@@ -314,10 +803,17 @@ class DownloadManager:
         link = video.get('src')
         url = link
         link_path = Path(unquote(url))
-        filename = iouuid.generate_id(self.path / link_path.name, rsuffix=rsuffix, size=2)
-        return_code = self._download_stream_with_ffmpeg(url, filename)
-        if return_code != 0 and not (self.path / filename).is_file():
-            return_code = self._download_stream_with_ffmpeg(url, filename)  # try a second time if download fails.
+        filename = iouuid.generate_id(path / link_path.name, rsuffix=rsuffix, size=2)
+        if link_path.suffix.startswith('.m3u'):
+            try:
+                file = HlsDownloader(self.client.session, throttle=self._throttle).download(
+                    urljoin(response.url, url), path / filename)
+                return file is not None, l.link, file
+            except ValueError:
+                pass  # not a playlist the HlsDownloader understands
+        return_code = self._download_stream_with_ffmpeg(url, path / filename)
+        if return_code != 0 and not (path / filename).is_file():
+            return_code = self._download_stream_with_ffmpeg(url, path / filename)  # try a second time if download fails.
         if return_code != 0:
             return False, l.link, None
-        return True, l.link, self.path / filename
+        return True, l.link, path / filename
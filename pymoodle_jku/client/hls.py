@@ -0,0 +1,229 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, List, Callable, Dict, Tuple
+from urllib.parse import urljoin
+
+import requests
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+logger = logging.getLogger(__name__)
+
+ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_attributes(line: str) -> Dict[str, str]:
+    """Parses the attribute list of a tag like #EXT-X-KEY:METHOD=AES-128,URI="key"."""
+    return {k: v.strip('"') for k, v in ATTRIBUTE.findall(line.split(':', 1)[1])}
+
+
+class Key:
+    def __init__(self, method: str, uri: Optional[str] = None, iv: Optional[bytes] = None):
+        """
+        A #EXT-X-KEY of a media playlist.
+
+        :param method: NONE or AES-128.
+        :param uri: Absolute url of the key.
+        :param iv: The IV, if None the media sequence number of the segment is used.
+        """
+        self.method = method
+        self.uri = uri
+        self.iv = iv
+
+
+class Segment:
+    def __init__(self, uri: str, sequence: int, key: Optional[Key] = None,
+                 byterange: Optional[Tuple[int, int]] = None):
+        """
+        A media segment.
+
+        :param uri: Absolute url of the segment.
+        :param sequence: The media sequence number.
+        :param key: The key of the segment, None if not encrypted.
+        :param byterange: (start, end) inclusive, if the segment is only a part of uri.
+        """
+        self.uri = uri
+        self.sequence = sequence
+        self.key = key
+        self.byterange = byterange
+
+
+class Playlist:
+    def __init__(self, text: str, url: str):
+        """
+        Parses a master or media playlist.
+        A master playlist has variants (bandwidth, url), a media playlist segments and maybe a init segment
+        (#EXT-X-MAP of fragmented mp4 streams).
+
+        :param text: The m3u8 file.
+        :param url: The url of the playlist, relative uris are resolved against it.
+        """
+        if not text.lstrip('\ufeff').startswith('#EXTM3U'):
+            raise ValueError('not a m3u8 playlist')
+        self.variants: List[Tuple[int, str]] = []
+        self.segments: List[Segment] = []
+        self.init: Optional[Segment] = None
+        sequence = 0
+        key = None
+        variant = None
+        byterange = None
+        offset = 0
+        for line in text.splitlines():
+            line = line.strip()
+            if line.startswith('#EXT-X-STREAM-INF'):
+                variant = int(parse_attributes(line).get('BANDWIDTH', 0))
+            elif line.startswith('#EXT-X-MEDIA-SEQUENCE'):
+                sequence = int(line.split(':', 1)[1])
+            elif line.startswith('#EXT-X-KEY'):
+                attributes = parse_attributes(line)
+                iv = attributes.get('IV')
+                key = Key(attributes['METHOD'], urljoin(url, attributes['URI']) if 'URI' in attributes else None,
+                          bytes.fromhex(iv[2:]) if iv else None)
+                if key.method == 'NONE':
+                    key = None
+            elif line.startswith('#EXT-X-MAP'):
+                attributes = parse_attributes(line)
+                init_range = None
+                if 'BYTERANGE' in attributes:
+                    length, _, start = attributes['BYTERANGE'].partition('@')
+                    init_range = (int(start or 0), int(start or 0) + int(length) - 1)
+                self.init = Segment(urljoin(url, attributes['URI']), -1, key, init_range)
+            elif line.startswith('#EXT-X-BYTERANGE'):
+                length, _, start = line.split(':', 1)[1].partition('@')
+                start = int(start) if start else offset
+                byterange = (start, start + int(length) - 1)
+                offset = start + int(length)
+            elif line and not line.startswith('#'):
+                if variant is not None:
+                    self.variants.append((variant, urljoin(url, line)))
+                    variant = None
+                else:
+                    self.segments.append(Segment(urljoin(url, line), sequence, key, byterange))
+                    sequence += 1
+                    byterange = None
+
+
+class HlsDownloader:
+    """
+    Downloads HLS streams without ffmpeg. The segments are fetched concurrently with a session, decrypted
+    (AES-128) and stored in a directory next to the output, so a interrupted download continues with the missing
+    segments. The finished segments are concatenated, mpeg-ts streams are remuxed to mp4 with ffmpeg if it is
+    installed, else the .ts file is kept.
+    """
+
+    def __init__(self, session: requests.Session, workers: int = 4, throttle: Optional[Callable[[int], None]] = None):
+        """
+        :param session: The session for all requests.
+        :param workers: Max amount of segments downloaded at once.
+        :param throttle: Called with the size of every received chunk, may block to limit the bandwidth.
+        """
+        self.session = session
+        self.workers = workers
+        self.throttle = throttle
+        self._keys: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def playlist(self, url: str) -> Playlist:
+        """Loads the media playlist of url. For a master playlist the variant with the highest bandwidth is used."""
+        playlist = Playlist(self._get(url).decode('utf-8'), url)
+        while len(playlist.variants) > 0:
+            bandwidth, url = max(playlist.variants)
+            playlist = Playlist(self._get(url).decode('utf-8'), url)
+        return playlist
+
+    def _get(self, url: str, byterange: Optional[Tuple[int, int]] = None) -> bytes:
+        headers = {'Range': f'bytes={byterange[0]}-{byterange[1]}'} if byterange is not None else {}
+        # streamed, so the response hooks of the session don't decode the binary body as text
+        with self.session.get(url, headers=headers, stream=True, timeout=30) as r:
+            r.raise_for_status()
+            data = bytearray()
+            for chunk in r.iter_content(chunk_size=64 * 1024):
+                if self.throttle is not None:
+                    self.throttle(len(chunk))
+                data += chunk
+        return bytes(data)
+
+    def _key(self, uri: str) -> bytes:
+        # the lock is held while loading, so every key is only requested once
+        with self._lock:
+            if uri not in self._keys:
+                self._keys[uri] = self._get(uri)
+            return self._keys[uri]
+
+    def _segment(self, segment: Segment, file: Path) -> None:
+        """Downloads and decrypts a segment to file, if file doesn't exist already."""
+        if file.is_file():
+            return
+        data = self._get(segment.uri, segment.byterange)
+        if segment.key is not None:
+            if segment.key.method != 'AES-128':
+                raise ValueError(f'unsupported encryption {segment.key.method}')
+            iv = segment.key.iv or segment.sequence.to_bytes(16, 'big')
+            decryptor = Cipher(algorithms.AES(self._key(segment.key.uri)), modes.CBC(iv)).decryptor()
+            unpadder = padding.PKCS7(128).unpadder()
+            data = unpadder.update(decryptor.update(data) + decryptor.finalize()) + unpadder.finalize()
+        tmp = file.with_suffix('.tmp')
+        tmp.write_bytes(data)
+        os.replace(tmp, file)
+
+    def download(self, url: str, file: Path) -> Optional[Path]:
+        """Downloads the stream of the playlist url.
+
+        :param url: Url of a master or media playlist.
+        :param file: The output file, should end with .mp4 or .ts.
+        :return: The written file (.ts if a mpeg-ts stream couldn't be remuxed) or None if it failed.
+        """
+        playlist = self.playlist(url)
+        if len(playlist.segments) == 0:
+            return None
+        segment_dir = file.parent / f'.{hashlib.sha1(url.encode()).hexdigest()[:16]}.hls'
+        segment_dir.mkdir(exist_ok=True)
+        files = [segment_dir / f'{i:06}.seg' for i in range(len(playlist.segments))]
+        jobs = list(zip(playlist.segments, files))
+        if playlist.init is not None:
+            jobs.insert(0, (playlist.init, segment_dir / 'init.seg'))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self._segment, s, f) for s, f in jobs]
+            failed = 0
+            for f in futures:
+                try:
+                    f.result()
+                except (SystemExit, KeyboardInterrupt, GeneratorExit):
+                    raise
+                except Exception as e:
+                    logger.error(e)
+                    failed += 1
+        if failed > 0:
+            logger.info(f'{failed}/{len(jobs)} segments of {url} failed, they are loaded by the next run')
+            return None
+
+        fmp4 = playlist.init is not None
+        output = file if fmp4 or file.suffix == '.ts' else file.with_suffix('.ts')
+        with open(output, 'wb') as out:
+            for _, f in jobs:
+                with open(f, 'rb') as seg:
+                    shutil.copyfileobj(seg, out)
+        shutil.rmtree(segment_dir)
+        if output != file:
+            output = self.remux(output, file)
+        return output
+
+    @staticmethod
+    def remux(ts: Path, file: Path) -> Path:
+        """Remuxes a .ts file to file with ffmpeg. Returns ts if ffmpeg isn't installed or failed."""
+        if shutil.which('ffmpeg') is None:
+            return ts
+        process = subprocess.run(['ffmpeg', '-y', '-i', ts, '-c', 'copy', file], stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.DEVNULL)
+        if process.returncode != 0 or not file.is_file():
+            return ts
+        ts.unlink()
+        return file
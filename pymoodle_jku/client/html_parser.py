@@ -1,15 +1,13 @@
 import re
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Callable
 from urllib.parse import urlparse, unquote, parse_qs
 
-import antimarkdown
 from lxml import html, etree
-from lxml.etree import _ElementUnicodeResult
-from lxml.html.clean import Cleaner
 
 from pymoodle_jku.classes.course_data import Url, UrlType, CourseData
 from pymoodle_jku.classes.evaluation import Evaluation
+from pymoodle_jku.client.markdown import converter
 from pymoodle_jku.utils.printing import print_exc
 
 
@@ -17,18 +15,94 @@ def d_utf8(obj) -> str:
     return obj.decode('utf-8')
 
 
+def declared_encoding(response, default='utf-8') -> str:
+    """Returns the charset of the Content-Type header, or default."""
+    content_type = response.headers.get('Content-Type', '')
+    if 'charset=' in content_type:
+        return content_type.split('charset=')[1].split(';')[0].strip().strip('"') or default
+    return default
+
+
+PAGE_FOOTER = b'id="page-footer"'
+
+# compiled once, the page classes run these on every page
+XPATHS = {
+    # pages
+    'main_region': etree.XPath('.//div[@id="region-main-box"]'),
+    'main': etree.XPath('.//div[@role="main"]'),
+    'h2_text': etree.XPath('.//h2/text()', smart_strings=False),
+    'hrefs': etree.XPath('.//a/@href', smart_strings=False),
+    'href': etree.XPath('./@href', smart_strings=False),
+    'nodes': etree.XPath('./node()'),
+    'child_divs': etree.XPath('./div'),
+    # login forms
+    'form_action': etree.XPath('//form/@action', smart_strings=False),
+    'form_inputs': etree.XPath('//form/input'),
+    'form_div_inputs': etree.XPath('//form/div/input'),
+    # course links
+    'sections': etree.XPath('.//ul[@class=$name]/li'),
+    'link_images': etree.XPath('.//a/img'),
+    # quiz blocks
+    'quiz_summary': etree.XPath('.//table[contains(@class,"quizreviewsummary")]'),
+    'quiz_info': etree.XPath('.//div[contains(@id,"question-")]/div[@class="info"]'),
+    'quiz_content': etree.XPath('.//div[contains(@id,"question-")]/div[@class="content"]'),
+    'content_images': etree.XPath('.//img/@src', smart_strings=False),
+    # grade tables
+    'table': etree.XPath('.//table'),
+    'table_head': etree.XPath('.//table/thead/tr'),
+    'header': etree.XPath('./th[@id=$id]'),
+    'table_rows': etree.XPath('.//table/tbody/tr'),
+    'overview_values': etree.XPath('.//table/tbody/tr/td/text()', smart_strings=False),
+    'overview_names': etree.XPath('.//table/tbody/tr/td/a/text()', smart_strings=False),
+    'overview_urls': etree.XPath('.//table/tbody/tr/td/a/@href', smart_strings=False),
+    'link_text': etree.XPath('./a/text()', smart_strings=False),
+    'link_href': etree.XPath('./a/@href', smart_strings=False),
+    'text': etree.XPath('./text()', smart_strings=False),
+}
+
+
+def parse_main_region(content: bytes, encoding='utf-8'):
+    """
+    Parses a moodle page up to the page footer and returns the region-main-box div.
+    The footer and everything after it (drawers, modals, javascript) comes after the main region, so the bytes are cut
+    in front of the last footer tag and the parser closes the open elements. The page isn't decoded to a str first.
+
+    :param content: The page.
+    :param encoding: The encoding of content.
+    :return: The region-main-box element.
+    """
+    parser = html.HTMLParser(encoding=encoding)
+    if (end := content.rfind(b'<', 0, max(content.rfind(PAGE_FOOTER), 0))) != -1:
+        region = XPATHS['main_region'](html.fromstring(content[:end], parser=parser))
+        if len(region) > 0:
+            return region[0]
+    # no footer, or a theme that places the main region after it
+    return XPATHS['main_region'](html.fromstring(content, parser=parser))[0]
+
+
 class MainRegion:
     def __init__(self, response):
         """
         Takes a Response and extracts the region-main-box from it.
         :param response: A Response from a request call.
         """
-        tree = html.fromstring(response.content.decode('utf-8'))
-        main_region = tree.xpath('//body//div[@id="region-main-box"]')[0]
-
-        self.region = main_region
+        self.region = parse_main_region(response.content, declared_encoding(response))
         self.url = response.request.url
 
+    @classmethod
+    def from_content(cls, content: bytes, encoding: str, url: str):
+        """
+        Creates the page from the body of a response, e.g. in a process without the Response.
+        Pages which extend __init__ can't be created this way.
+        :param content: The body of the response.
+        :param encoding: The encoding of content.
+        :param url: The url of the request.
+        """
+        page = cls.__new__(cls)
+        page.region = parse_main_region(content, encoding)
+        page.url = url
+        return page
+
 
 # href="https://moodle.jku.at/jku/mod/quiz/review.php?attempt=661309&cmid=4628980"
 
@@ -43,15 +117,15 @@ class QuizSummary(MainRegion):
         :param response: A Response to extract the quiz from.
         """
         super().__init__(response)
-        self.main = self.region.xpath('.//div[@role="main"]')[0]
-        self.name = self.main.xpath('.//h2/text()')[0]
+        self.main = XPATHS['main'](self.region)[0]
+        self.name = XPATHS['h2_text'](self.main)[0]
 
     def quiz_url(self) -> Optional[Url]:
         """
         The Url to the Moodle Quiz will be extracted.
         :return: A Url object if found, else None.
         """
-        all_urls = self.region.xpath('.//a/@href')
+        all_urls = XPATHS['hrefs'](self.region)
 
         for url in all_urls:
             try:
@@ -72,24 +146,10 @@ def convert_elements(elements) -> str:
     """
     Cleans up the elements of a html string.
     Also converts it to markdown.
-    :param elements: A List of str.
+    :param elements: A List of lxml elements and text nodes.
     :return: A markdown string.
     """
-
-    output = ''
-    cleaner = Cleaner()
-    cleaner.forms = False
-    cleaner.remove_tags = ['span']
-    for e in elements:
-        if isinstance(e, _ElementUnicodeResult):
-            output += '\n'.join([line.strip() for line in str(e).splitlines()]) + '\n'
-        else:
-            e.attrib.clear()
-            conv = antimarkdown.to_markdown(cleaner.clean_html(d_utf8(etree.tostring(e))))
-            output += '\n'.join([line.strip() for line in conv.splitlines()])
-        output += '\n'
-    output += '\n'
-    return output
+    return converter.convert(elements)
 
 
 class QuizPage(MainRegion):
@@ -99,17 +159,16 @@ class QuizPage(MainRegion):
         :param response: A Response to extract the quiz from.
         """
         super().__init__(response)
-        self.quiz = self.region.xpath('.//div[@role="main"]')[0]
-        self.summary = self.quiz.xpath('.//table[contains(@class,"quizreviewsummary")]')[0]
-        self.info = self.quiz.xpath('.//div[contains(@id,"question-")]/div[@class="info"]')
-        questions = self.quiz.xpath('.//div[contains(@id,"question-")]/div[@class="content"]')
+        self.quiz = XPATHS['main'](self.region)[0]
+        self.summary = XPATHS['quiz_summary'](self.quiz)[0]
+        self.info = XPATHS['quiz_info'](self.quiz)
+        questions = XPATHS['quiz_content'](self.quiz)
 
-        images = self.quiz.xpath('.//div[contains(@id,"question-")]/div[@class="content"]//img/@src')
-        self.images = list(set(images))
+        self.images = list({src for q in questions for src in XPATHS['content_images'](q)})
 
         self.questions = []
         for q in questions:
-            divs = q.xpath('./div')
+            divs = XPATHS['child_divs'](q)
             if len(divs) > 1:
                 self.questions.append((divs[0], divs[1]))
             else:
@@ -122,32 +181,32 @@ class QuizPage(MainRegion):
         """
         questions = zip(self.info, self.questions)
 
-        summary = antimarkdown.to_markdown(d_utf8(etree.tostring(self.summary))) + '\n'
+        summary = converter.element(self.summary, clean=False) + '\n'
 
         # markdownify isnt parsing tables
         # tomd is removing a lot of stuff ()
         # html2markdown
-        output = f'{summary}\n'
+        output = [f'{summary}\n']
         for i, (q, f) in questions:
-            subs = i.xpath('./node()')
+            subs = XPATHS['nodes'](i)
             info = convert_elements(subs)
             # info = html2markdown.convert(d_utf8(etree.tostring(i)))
 
-            subs = q.xpath('./node()')
+            subs = XPATHS['nodes'](q)
 
             question = convert_elements(subs)
             # question = html2markdown.convert(d_utf8(etree.tostring(q)))
 
             if f is not None:
-                subs = f.xpath('./node()')
+                subs = XPATHS['nodes'](f)
                 feedback = convert_elements(subs)
             else:
                 feedback = '\n'
             # feedback = '' if f is None else html2markdown.convert(d_utf8(etree.tostring(f)))
 
-            output += f'{info}{question}{feedback}'
+            output.append(f'{info}{question}{feedback}')
 
-        return output
+        return ''.join(output)
 
 
 class CoursePage(MainRegion):
@@ -161,8 +220,8 @@ class CoursePage(MainRegion):
         :return: A List of lxml HTML objects.
         """
         sections = []
-        for section in self.region.xpath('.//ul[@class=$name]/li', name='topics'):
-            subs = section.xpath('./node()')
+        for section in XPATHS['sections'](self.region, name='topics'):
+            subs = XPATHS['nodes'](section)
             sections.append(convert_elements(subs))
         return sections
 
@@ -171,10 +230,10 @@ class CoursePage(MainRegion):
         Loads all the URLs on a CoursePage.
         :return: A List of URLs.
         """
-        all_url_imgs = self.region.xpath('.//a/img')
+        all_url_imgs = XPATHS['link_images'](self.region)
         urls = []
         for i in all_url_imgs:
-            if (url_p := Path(unquote(urlparse((url := i.getparent().xpath('./@href')[0])).path)).parts)[2] == 'mod':
+            if (url_p := Path(unquote(urlparse((url := XPATHS['href'](i.getparent())[0])).path)).parts)[2] == 'mod':
                 try:
                     urls.append(Url(str(url), UrlType[url_p[3].capitalize()]))
                 except KeyError as err:
@@ -194,6 +253,58 @@ class CoursePage(MainRegion):
         return cd
 
 
+class ParsedCoursePage:
+    """
+    The extracted links and sections of a CoursePage, without the page itself.
+    It offers the same methods as a CoursePage, the lxml tree is only loaded again by page().
+    """
+    __slots__ = ('course_data', 'url', '_load')
+
+    def __init__(self, course_data: CourseData, url=None, load: Optional[Callable[[], 'CoursePage']] = None):
+        """
+        :param course_data: The CourseData of the page.
+        :param url: The url of the page.
+        :param load: Loads the CoursePage again, used by page().
+        """
+        self.course_data = course_data
+        self.url = url
+        self._load = load
+
+    def page(self) -> 'CoursePage':
+        """
+        Loads the CoursePage again, for callers that need the lxml tree. The page isn't kept.
+        :raises ValueError: If the page can't be loaded again.
+        """
+        if self._load is None:
+            raise ValueError('the page of this course can\'t be loaded again')
+        return self._load()
+
+    def sections(self) -> List[str]:
+        return self.course_data.sections
+
+    def urls(self) -> List[Url]:
+        return self.course_data.links
+
+    def to_course_data(self) -> CourseData:
+        return self.course_data
+
+
+def parse_course_data(content: bytes, encoding: str, url: str) -> CourseData:
+    """
+    Parses the body of a course page to CourseData.
+    Takes and returns only picklable objects, so it can run in a ProcessPoolExecutor.
+    """
+    return CoursePage.from_content(content, encoding, url).to_course_data()
+
+
+def parse_evaluations(content: bytes, encoding: str, url: str) -> List[Evaluation]:
+    """
+    Parses the body of a grade page to the Evaluations.
+    Takes and returns only picklable objects, so it can run in a ProcessPoolExecutor.
+    """
+    return ValuationPage.from_content(content, encoding, url).evaluations()
+
+
 class PreLoginPage:
     def __init__(self, action, data):
         """
@@ -212,16 +323,11 @@ class PreLoginPage:
         :return: The LoginPage of the response.
         """
         tree = html.fromstring(response.content.decode('utf-8'))
-        form_action = tree.xpath('//form/@action')[0]
-        form = tree.xpath('//form/input')
+        form_action = XPATHS['form_action'](tree)[0]
+        form = XPATHS['form_inputs'](tree)
         data = {}
         for inp in form:
-            name = inp.xpath('./@name')[0]
-            if len(values := inp.xpath('./@value')) == 0:
-                values = ['']
-
-            value = values[0]
-            data[name] = value
+            data[inp.attrib['name']] = inp.get('value', '')
 
         return PreLoginPage(form_action, data)
 
@@ -244,13 +350,11 @@ class LoginPage:
         :return: The LoginPage of the response.
         """
         tree = html.fromstring(response.content.decode('utf-8'))
-        form_action = tree.xpath('//form/@action')[0]
-        form = tree.xpath('//form/input')
+        form_action = XPATHS['form_action'](tree)[0]
+        form = XPATHS['form_inputs'](tree)
         data = {}
         for inp in form:
-            name = inp.xpath('./@name')[0]
-            value = inp.xpath('./@value')[0]
-            data[name] = value
+            data[inp.attrib['name']] = inp.attrib['value']
 
         return LoginPage(form_action, data)
 
@@ -273,16 +377,11 @@ class PostLoginPage:
         :return: The LoginPage of the response.
         """
         tree = html.fromstring(response.content.decode('utf-8'))
-        form_action = tree.xpath('//form/@action')[0]
-        form = tree.xpath('//form/div/input')
+        form_action = XPATHS['form_action'](tree)[0]
+        form = XPATHS['form_div_inputs'](tree)
         data = {}
         for inp in form:
-            name = inp.xpath('./@name')[0]
-            if len(values := inp.xpath('./@value')) == 0:
-                values = ['']
-
-            value = values[0]
-            data[name] = value
+            data[inp.attrib['name']] = inp.get('value', '')
 
         return PostLoginPage(form_action, data)
 
@@ -341,9 +440,9 @@ class ValuationOverviewPage(MainRegion):
         :param response: A Response from where the valuations should be parsed.
         """
         super().__init__(response)
-        valuation_values = self.region.xpath('.//table/tbody/tr/td/text()')
-        valuation_names = self.region.xpath('.//table/tbody/tr/td/a/text()')
-        valuation_urls = self.region.xpath('.//table/tbody/tr/td/a/@href')
+        valuation_values = XPATHS['overview_values'](self.region)
+        valuation_names = XPATHS['overview_names'](self.region)
+        valuation_urls = XPATHS['overview_urls'](self.region)
         valuation_course_ids = [int(parse_qs(urlparse(u).query)['id'][0]) for u in valuation_urls]
 
         self.valuation = dict(zip(valuation_course_ids, zip(valuation_names, valuation_values)))
@@ -360,26 +459,30 @@ class ValuationPage(MainRegion):
         Extracts all Evaluations from a Page.
         :return: A List of all Evaluations.
         """
-        if len(self.region.xpath('.//table')) == 0:
+        if len(XPATHS['table'](self.region)) == 0:
             return []
 
-        grade = self.region.xpath('.//table/thead/tr/th[@id="grade"]')[0]
-        grade_range = self.region.xpath('.//table/thead/tr/th[@id="range"]')[0]
-
-        first_row = self.region.xpath('.//table/thead/tr')[0]
-        index_grade = first_row.index(grade)
-        index_range = first_row.index(grade_range)
-
-        table_rows = self.region.xpath('.//table/tbody/tr')
+        first_row = XPATHS['table_head'](self.region)[0]
+        index_grade = first_row.index(XPATHS['header'](first_row, id='grade')[0])
+        index_range = first_row.index(XPATHS['header'](first_row, id='range')[0])
 
         evaluations = []
-        for row in table_rows:
-            if len(row.xpath('./td')) <= 1 or len(row.xpath('./th/a/text()')) == 0:
+        for row in XPATHS['table_rows'](self.region):
+            # one pass over the cells, the grade and range columns are counted in the text of the td cells
+            names, urls, criteria, tds = [], [], [], 0
+            for cell in row:
+                if cell.tag == 'th':
+                    names += XPATHS['link_text'](cell)
+                    urls += XPATHS['link_href'](cell)
+                elif cell.tag == 'td':
+                    tds += 1
+                    criteria += XPATHS['text'](cell)
+            if tds <= 1 or len(names) == 0:
                 continue
-            name, url, criteria = row.xpath('./th/a/text()')[0], row.xpath('./th/a/@href')[0], row.xpath('./td/text()')
+            name, url = names[0], urls[0]
             grade, grade_range = criteria[index_grade - 1], criteria[index_range - 1]
 
             evaluations.append(
-                Evaluation(name, Url(str(url), UrlType[Path(unquote(urlparse(url).path)).parts[3].capitalize()]), grade,
+                Evaluation(name, Url(url, UrlType[Path(unquote(urlparse(url).path)).parts[3].capitalize()]), grade,
                            grade_range))
         return evaluations
@@ -0,0 +1,89 @@
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+import antimarkdown
+from antimarkdown import handlers
+from lxml import etree
+from lxml.etree import _ElementUnicodeResult
+from lxml.html.clean import Cleaner
+
+
+def strip_lines(text: str) -> str:
+    return '\n'.join([line.strip() for line in text.splitlines()])
+
+
+class MarkdownConverter:
+    """
+    Converts the lxml elements of moodle pages to markdown.
+    The elements are cleaned and rendered as lxml trees, without serializing and parsing them again like
+    antimarkdown.to_markdown does. Results are memoised by a hash of the serialized element, moodle repeats the same
+    blocks (question info, flags, section headers) on every page. The element is still serialized for the key, a hit
+    only skips the conversion (serializing in lxml is faster than hashing a walk over the tree in python).
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        """
+        :param max_entries: Max amount of memoised conversions, the least recently used are dropped.
+        """
+        self.cleaner = Cleaner(forms=False, remove_tags=['span'])
+        self.max_entries = max_entries
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _memoised(self, key: bytes, convert) -> str:
+        key = hashlib.blake2b(key, digest_size=16).digest()
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        result = convert()
+        with self._lock:
+            self._memo[key] = result
+            if len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return result
+
+    def element(self, e, clean: bool = True) -> str:
+        """Converts a element (and its tail) to markdown. The element isn't changed, a copy of it is converted if the
+        result isn't memoised yet.
+
+        :param e: A lxml element.
+        :param clean: If True the attributes of e are dropped and the element is cleaned with the Cleaner first.
+        :return: The markdown.
+        """
+        return self._memoised(b'%d' % clean + etree.tostring(e), lambda: self._convert(e, clean))
+
+    def _convert(self, e, clean: bool) -> str:
+        e = copy.deepcopy(e)
+        if clean:
+            e.attrib.clear()
+            self.cleaner(e)
+        if (fragment := antimarkdown.clean_fragment(e)) is None:
+            return ''
+        return handlers.render(fragment)
+
+    def html(self, text: str) -> str:
+        """Converts a html string to markdown, like antimarkdown.to_markdown but memoised."""
+        return self._memoised(text.encode('utf-8'), lambda: antimarkdown.to_markdown(text))
+
+    def convert(self, elements: Iterable) -> str:
+        """
+        Cleans up the elements and converts them to markdown.
+        :param elements: A List of lxml elements and text nodes (like the result of xpath('./node()')).
+        :return: A markdown string.
+        """
+        output = []
+        for e in elements:
+            if isinstance(e, _ElementUnicodeResult):
+                output.append(strip_lines(str(e)) + '\n')
+            else:
+                output.append(strip_lines(self.element(e)))
+            output.append('\n')
+        output.append('\n')
+        return ''.join(output)
+
+
+converter = MarkdownConverter()
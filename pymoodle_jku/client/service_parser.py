@@ -0,0 +1,73 @@
+from pathlib import Path
+from typing import List
+from urllib.parse import urlparse, unquote
+
+from pymoodle_jku.classes.course_data import Url, UrlType, CourseData
+from pymoodle_jku.client.markdown import converter, strip_lines
+from pymoodle_jku.utils.printing import print_exc
+
+
+class CourseContents:
+    """
+    CourseContents is the content of a Moodle Course loaded from the core_course_get_contents web service.
+    It offers the same methods as a CoursePage, but no html page needs to be loaded or parsed.
+    """
+
+    def __init__(self, contents: List[dict], url=None):
+        """
+        :param contents: The 'data' of a core_course_get_contents call (a List of sections).
+        :param url: The viewurl of the course.
+        """
+        self.contents = contents
+        self.url = url
+
+    def sections(self) -> List[str]:
+        """
+        Returns all the sections of the course as markdown. Sections are normally different Topics.
+        Like on a CoursePage, a section has its name, summary and modules, each module with its description.
+        Labels have no link, only their description (the text of the label) is rendered.
+        :return: A List of markdown strings.
+        """
+        sections = []
+        for section in self.contents:
+            output = f'{section.get("name", "")}\n\n'
+            if summary := section.get('summary'):
+                output += strip_lines(converter.html(summary)) + '\n\n'
+            for module in section.get('modules', []):
+                if (url := module.get('url')) is not None:
+                    output += f'*   [{module.get("name", "")}](<{url}>)\n'
+                if description := module.get('description'):
+                    output += strip_lines(converter.html(description)) + '\n\n'
+            sections.append(output + '\n\n')
+        return sections
+
+    def urls(self) -> List[Url]:
+        """
+        Loads all the URLs of the course modules.
+        :return: A List of URLs.
+        """
+        urls = []
+        for section in self.contents:
+            for module in section.get('modules', []):
+                if (url := module.get('url')) is None:
+                    continue  # labels and other modules without a page
+                url_p = Path(unquote(urlparse(url).path)).parts
+                if len(url_p) < 4 or url_p[2] != 'mod':
+                    continue
+                try:
+                    urls.append(Url(str(url), UrlType[url_p[3].capitalize()]))
+                except KeyError as err:
+                    print_exc(err)
+        return urls
+
+    def to_course_data(self) -> CourseData:
+        """
+        Converts the CourseContents to CourseData with links and sections.
+        :return: A converted CourseData.
+        """
+        cd = CourseData(links=self.urls(), sections=self.sections())
+
+        for l in cd.links:
+            l.course = cd
+
+        return cd
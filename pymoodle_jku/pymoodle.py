@@ -62,6 +62,9 @@ def main():
     parser.add_argument('-c', '--credentials', nargs=2, metavar=('username', 'password'),
                         help='JKU username and password. (Optional, if not provided you will be asked to Enter it)')
 
+    parser.add_argument('--metrics', metavar='path',
+                        help='Writes request metrics to the file at exit (json if it ends with .json, else Prometheus text format)')
+
     subparsers = parser.add_subparsers(help='Utilities', dest='utility')
 
     grades_parser = subparsers.add_parser('grades', help='Grading Utility')
@@ -89,10 +92,22 @@ def main():
                                  help='Use if you want to download old courses.')
 
     download_parser.add_argument('--speed', type=float,
-                                 help='Max Internet downlaod speed')
+                                 help='Max download speed in Mbit/s for all downloads together')
 
     download_parser.add_argument('--interface', type=str,
-                                 help='Interface which is currently used (example eth0 or en0)')
+                                 help='Interface which is currently used (example eth0 or en0). If given, traffic of other programs on it is subtracted from [--speed]')
+
+    download_parser.add_argument('-u', '--update', action='store_true',
+                                 help='Checks already downloaded files for changes and downloads changed files again.')
+
+    download_parser.add_argument('--dedup', action='store_true',
+                                 help='Stores every file once in .pymoodle-store and hardlinks it into the course folders.')
+
+    download_parser.add_argument('--segments', type=int, default=1,
+                                 help='Downloads files bigger than 64 MiB with this many connections at once.')
+
+    download_parser.add_argument('--order', choices=['page', 'smallest'], default='page',
+                                 help='smallest checks the size of all files first and downloads the small ones first.')
 
     timeline_parser = subparsers.add_parser('timeline', help='Timeline Utility')
 
@@ -107,9 +122,18 @@ def main():
     config_parser.add_argument('-t', '--threads',
                                help='Changes max amount of Threads used for crawling.')
 
+    config_parser.add_argument('--min-threads',
+                               help='Changes min amount of Threads used for crawling. Between min and max the amount is adapted to the server.')
+
     config_parser.add_argument('-c', '--credentials',
                                help='Sets the moodle credentials.')
 
+    config_parser.add_argument('--cache', choices=['on', 'off'],
+                               help='Enables or disables the local cache for course and grade pages.')
+
+    config_parser.add_argument('--parse-processes', type=int,
+                               help='Parses course and grade pages in this many processes. 0 parses them in the crawling threads.')
+
     argcomplete.autocomplete(parser)
 
     args = parser.parse_args()
@@ -154,7 +178,13 @@ def main():
         if args.utility == 'config':
             return config.main(args)
 
-        client: MoodleClient = login.login(credentials=args.credentials)
+        metrics = None
+        if args.metrics:
+            from pymoodle_jku.utils.metrics import MetricsCollector
+            metrics = MetricsCollector()
+            atexit.register(metrics.dump, args.metrics)
+
+        client: MoodleClient = login.login(credentials=args.credentials, metrics=metrics)
 
         if client is None:
             raise LoginError('Try again. Login Failed.')
@@ -1,56 +1,109 @@
 import logging
 import time
 from pathlib import Path
-from typing import Union, List, Tuple
+from concurrent.futures import as_completed
+from typing import Union, List, Iterable, Generator, Tuple
 
-from sty import fg
-import atexit
 
+from pymoodle_jku.classes.course import Course
 from pymoodle_jku.classes.course_data import Url, UrlType
 from pymoodle_jku.classes.evaluation import Evaluation
+from pymoodle_jku.classes.exceptions import NotLoggedInError
 from pymoodle_jku.client.client import MoodleClient
 from pymoodle_jku.client.download_manager import DownloadManager
 from pymoodle_jku.utils.config import config
+from pymoodle_jku.utils.dedup import BlobStore
 from pymoodle_jku.utils.login import relogin
+from pymoodle_jku.utils.manifest import SyncManifest
 from pymoodle_jku.utils.net_usage import net_interfaces
-from pymoodle_jku.utils.printing import print_pick_results_table
+from pymoodle_jku.utils.printing import print_pick_results_table, print_exc
 
 logger = logging.getLogger(__name__)
 
 
-def get_all_downloads(dir_: Path, links: List[Union[Url, Evaluation]]) -> Tuple[
-    List[Union[Url, Evaluation]], List[str]]:
-    '''
-    Compares the urls from urls.txt with [links].
-    :param dir_: the directory where urls.txt is stored.
+def get_all_downloads(manifest: SyncManifest, links: List[Union[Url, Evaluation]]) -> List[Union[Url, Evaluation]]:
+    """
+    Looks up [links] in the manifest.
+    :param manifest: The manifest of the download directory.
     :param links: A list of Urls or Evaluations from where to get the urls
-    :return: The new urls which are not found in urls.txt
-    '''
-    url_list = dir_ / 'urls.txt'
-    try:
-        urls = url_list.read_text().splitlines()
-        f = list(filter(lambda l: l.link not in urls, links))
-        return f, urls
-    except FileNotFoundError:
-        return links, []
+    :return: The links which are not downloaded yet.
+    """
+    completed = manifest.completed(l.link for l in links)
+    return [l for l in links if l.link not in completed]
 
 
-def write_urls(dir_: Path, urls: List[str]) -> None:
+def get_changed_downloads(client: MoodleClient, manifest: SyncManifest, links: List[Union[Url, Evaluation]]) -> List[
+    Url]:
     """
-    Writes the given urls to the urls.txt.
-    :param dir_:
-    :param urls:
-    :return:
+    Checks downloaded Resources with a HEAD request, files that have a new ETag/Last-Modified are downloaded again.
+    :param client: A logged in MoodleClient.
+    :param manifest: The manifest of the download directory.
+    :param links: A list of Urls or Evaluations.
+    :return: The Resources which changed since they were downloaded.
+    """
+    resources = {l.link: l for l in links if type(l) is Url and l.type is UrlType.Resource}
+    entries = {u: e for u, e in manifest.entries(resources).items() if e['etag'] or e['last_modified']}
+    futures = {client.future_session.head(u, allow_redirects=True, timeout=10): u for u in entries}
+    changed = []
+    for f in as_completed(futures):
+        try:
+            headers = f.result().headers
+        except Exception:
+            continue
+        e = entries[futures[f]]
+        if (e['etag'] and headers.get('ETag') not in (None, e['etag'])) or (
+                not e['etag'] and headers.get('Last-Modified') not in (None, e['last_modified'])):
+            changed.append(resources[futures[f]])
+    return changed
+
+
+def course_sources(client: MoodleClient, courses: Iterable[Course], path: Path, manifest: SyncManifest,
+                   update: bool = False) -> Generator[Tuple[list, Path, str, int], None, None]:
     """
-    url_list = dir_ / 'urls.txt'
-    url_list.write_text('\n'.join(urls))
+    Loads the grades of all courses concurrently and yields the links of each course that still need to be downloaded.
+    The grades of a course whose grade page couldn't be loaded are loaded again on their own, if that fails too only
+    the links of the course page are yielded. A NotLoggedInError is raised, so that relogin can handle it.
+    :param client: A logged in MoodleClient.
+    :param courses: Courses with a loaded course_page.
+    :param path: The download root, every course gets a directory in it.
+    :param manifest: The manifest of the download root.
+    :param update: If True changed files are downloaded again.
+    :return: A Generator of (urls, directory, course name, course id) for DownloadManager.download.
+    """
+    missing = {}
 
+    def remember(courses):
+        for c in courses:
+            missing[c.id] = c
+            yield c
 
-def handle_exit(dl_manager: DownloadManager, path: Path, old_urls: List[str]) -> None:
-    done = [(d[1], d[2]) for d in dl_manager.get_done_futures() if d[0]]
-    finished_url = old_urls + [u for u, f in done]
+    def links(c, evaluations):
+        print('Starting with Course: ' + c.parse_name())
+        cur_dir = path / (c.parse_name())
+        try:
+            cur_dir.mkdir()
+        except (FileNotFoundError, OSError):
+            pass
+
+        all_links = c.course_page.to_course_data().links + [v.url for v in evaluations]
+        new_urls = get_all_downloads(manifest, all_links)
+        if update:
+            new_urls += get_changed_downloads(client, manifest, all_links)
+        return new_urls, cur_dir, c.parse_name(), c.id
 
-    write_urls(path, finished_url)
+    for c, evaluations in client.multi_valuation(remember(courses)):
+        missing.pop(c.id, None)
+        yield links(c, evaluations)
+
+    for c in missing.values():
+        try:
+            evaluations = client.single_valuation(c)
+        except NotLoggedInError:
+            raise
+        except Exception as e:
+            print_exc(e)
+            evaluations = []
+        yield links(c, evaluations)
 
 
 @relogin
@@ -69,11 +122,10 @@ def main(client: MoodleClient, args):
         print('Search parameters can\'t be used when using all mode.')
         return 0
     elif args.search is not None:
-        courses = client.courses(
-            filter_exp=lambda c, search=args.search: any(
-                s.lower() in c.fullname.lower() for s in search) and filter_new(c))
+        courses = client.courses(load_pages=[c for c in client.catalog().search(args.search) if filter_new(c)],
+                                 use_service=True, compact=True)
     elif args.all or args.quiet:
-        courses = client.courses(filter_exp=filter_new)
+        courses = client.courses(filter_exp=filter_new, use_service=True, compact=True)
     else:
         loaded_more = False
         courses = list(client.courses(load_pages=False, filter_exp=filter_new))
@@ -89,51 +141,35 @@ def main(client: MoodleClient, args):
                 if index == -2:
                     if not args.old and not loaded_more:
                         loaded_more = True
-                        courses = list(client.courses(load_pages=False))
+                        courses = list(client.catalog())
             else:
                 break
         picked_courses = [courses[idx] for v, idx in selected]
-        courses = client.courses(load_pages=picked_courses)
+        courses = client.courses(load_pages=picked_courses, use_service=True, compact=True)
 
-    count = 0
     start = time.time()
 
-    if args.interface is None:
-        net_inter = net_interfaces()
-        network_interface = print_pick_results_table([[e] for e in net_inter], False, False)
-        interface = net_inter[network_interface[1]]
-    else:
-        interface = args.interface
-    download_speed = args.speed or float(input('Download Speed in Mbit/s: '))
-
-    for c in list(courses):
-        print('Starting with Course: ' + c.parse_name())
-        count += 1
-        cur_dir = path / (c.parse_name())
-        try:
-            cur_dir.mkdir()
-        except (FileNotFoundError, OSError):
-            pass
-
-        valuations = [v.url for v in client.single_valuation(c)]
-
-        all_links = c.course_page.to_course_data().links + valuations
-        new_urls, old_urls = get_all_downloads(path, all_links)
-
-        dm = DownloadManager(new_urls, client, path=cur_dir, download_speed=download_speed, net_interface=interface)
-        atexit.register(handle_exit, dm, path, old_urls)
-        try:
-            dm.download()
-        except KeyboardInterrupt:
-            return 0
-
-        atexit.unregister(handle_exit)
-        finished_url = old_urls + [u for u, f in dm.done]
-
-        write_urls(path, finished_url)
-        del dm
+    interface = args.interface
+    if interface is not None and interface not in net_interfaces():
+        print(f'Unknown interface {interface}, available: {", ".join(net_interfaces())}')
+        return 0
+    download_speed = args.speed
+    if download_speed is None and not args.quiet:
+        download_speed = float(input('Download Speed in Mbit/s (leave empty for unlimited): ') or 0) or None
 
-        print(fg.li_green + f'Done with {c.parse_name()}' + fg.rs)
+    manifest = SyncManifest(path)
+    try:
+        store = BlobStore(path) if args.dedup else None
+        sources = course_sources(client, courses, path, manifest, args.update)
+        dm = DownloadManager([], client, path=path, download_speed=download_speed, net_interface=interface,
+                             manifest=manifest, store=store, segments=args.segments, priority=args.order)
+        dm.download(sources)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        # also if a NotLoggedInError is passed on to relogin
+        manifest.close()
+    count = len(dm.groups) - 1
 
     end = time.time()
     print(f'{(end - start) / 60} minutes runtime')
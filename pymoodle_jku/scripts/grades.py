@@ -2,6 +2,7 @@ import time
 from argparse import Namespace
 
 from pymoodle_jku.classes.course import parse_course_name
+from pymoodle_jku.classes.course_catalog import CourseCatalog
 from pymoodle_jku.client.client import MoodleClient
 from pymoodle_jku.utils.login import relogin
 from pymoodle_jku.utils.printing import print_pick_results_table, clean_screen, print_array_results_table
@@ -10,13 +11,12 @@ from pymoodle_jku.utils.printing import print_pick_results_table, clean_screen,
 @relogin
 def main(client: MoodleClient, args: Namespace):
     now = int(time.time())
-    old_filter = lambda c, t=now: c.enddate >= t or c.enddate is None or c.enddate == 0
+    catalog = client.catalog()
     if args.search:
-        filter_exp = lambda c, search=args.search: any(s.lower() in c.fullname.lower() for s in search)
+        courses = catalog.search(args.search)
         if not args.old:
-            old_filter_exp = filter_exp
-            filter_exp = lambda c, t=now: old_filter_exp(c) and old_filter(c)
-        courses = client.courses(load_pages=False, filter_exp=filter_exp)
+            current = CourseCatalog(catalog.current(now))
+            courses = [c for c in courses if c in current]
         evals = client.multi_valuation(courses)
         for c, eval in evals:
             print(f' {c.fullname}')
@@ -36,14 +36,12 @@ def main(client: MoodleClient, args: Namespace):
     valuations = client.valuation_overview()
     original_valuations = valuations
     if not args.old:
-        courses = client.courses(load_pages=False, filter_exp=old_filter)
-        courses = sorted(courses, reverse=True)
-        course_ids = [c.id for c in courses]
-        valuations = dict([(key, val) for key, val in valuations.items() if key in course_ids])
+        current = CourseCatalog(catalog.current(now))
+        courses = sorted(current, reverse=True)
+        valuations = {key: val for key, val in valuations.items() if key in current}
     else:
-        courses = client.courses(load_pages=False)
-        courses = sorted(courses, reverse=True)
-        valuations = dict([(key, val) for key, val in valuations.items()])
+        courses = sorted(catalog, reverse=True)
+        valuations = dict(valuations)
     if len(courses) == 0:
         print('No Courses to display. Try [-o] for older courses.')
         return 0
@@ -67,8 +65,7 @@ def main(client: MoodleClient, args: Namespace):
                 # load more data if possible
                 if not args.old and not loaded_more:
                     loaded_more = True
-                    courses = client.courses(load_pages=False)
-                    courses = sorted(courses, reverse=True)
+                    courses = sorted(catalog, reverse=True)
                     vals = []
                     for c in courses:
                         if c.id in original_valuations.keys():
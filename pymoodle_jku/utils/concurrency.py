@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Optional
+
+from requests.adapters import BaseAdapter
+
+# statuses moodle uses if it wants us to slow down
+THROTTLE_STATUS = (429, 503)
+
+
+class AdaptiveLimiter:
+    """
+    Limits the amount of requests that are in flight at the same time.
+    The limit is adapted like TCP congestion control (AIMD):
+    every successful request increases the limit by increase / limit (so about `increase` per round trip),
+    throttling responses (429/503), errors or a latency above latency_factor * base latency
+    multiply the limit with decrease. The limit always stays between floor and ceiling.
+    """
+
+    def __init__(self, floor: int = 2, ceiling: int = 16, initial: Optional[int] = None, increase: float = 1.0,
+                 decrease: float = 0.5, latency_factor: float = 3.0):
+        """
+        :param floor: Min amount of requests in flight.
+        :param ceiling: Max amount of requests in flight.
+        :param initial: Start limit, defaults to floor.
+        :param increase: Additive increase per round trip.
+        :param decrease: Multiplicative decrease on congestion.
+        :param latency_factor: A request slower than latency_factor * base latency counts as congestion.
+        """
+        if floor < 1 or ceiling < floor:
+            raise ValueError('1 <= floor <= ceiling is required')
+        self.floor = floor
+        self.ceiling = ceiling
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.limit = float(min(max(initial or floor, floor), ceiling))
+        self.in_flight = 0
+        self.base_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        """Blocks until a request may be sent."""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency: Optional[float] = None, status: Optional[int] = None, error: bool = False) -> None:
+        """Frees the slot of a finished request and adapts the limit.
+
+        :param latency: Seconds the request took, None if unknown.
+        :param status: HTTP status of the response, None if unknown.
+        :param error: True if the request failed.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            congested = error or status in THROTTLE_STATUS
+            if latency is not None and not congested:
+                if self.base_latency is None or latency < self.base_latency:
+                    self.base_latency = latency
+                else:
+                    # let the base latency slowly follow the current one, moodle gets slower during the day
+                    self.base_latency += (latency - self.base_latency) * 0.01
+                congested = latency > self.base_latency * self.latency_factor
+            if congested:
+                # decrease only once per round trip, all requests in flight saw the same congestion
+                if now - self._last_decrease > (self.base_latency or 1.0):
+                    self.limit = max(self.floor, self.limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.ceiling, self.limit + self.increase / self.limit)
+            self._cond.notify_all()
+
+
+class LimiterAdapter(BaseAdapter):
+    """
+    A transport adapter which sends every request through a AdaptiveLimiter.
+    The slot is held until the response headers are received, streamed bodies are not counted.
+    """
+
+    def __init__(self, adapter: BaseAdapter, limiter: AdaptiveLimiter):
+        super().__init__()
+        self.adapter = adapter
+        self.limiter = limiter
+
+    def send(self, request, **kwargs):
+        self.limiter.acquire()
+        start = time.monotonic()
+        try:
+            response = self.adapter.send(request, **kwargs)
+        except BaseException:
+            self.limiter.release(error=True)
+            raise
+        self.limiter.release(latency=time.monotonic() - start, status=response.status_code,
+                             error=response.status_code >= 500)
+        return response
+
+    def close(self):
+        self.adapter.close()
@@ -1,3 +1,4 @@
+import shutil
 from getpass import getpass
 from pathlib import Path
 
@@ -7,7 +8,7 @@ from pick import pick
 
 from pymoodle_jku.classes.exceptions import LoginError
 from pymoodle_jku.client.client import MoodleClient
-from pymoodle_jku.utils.config_data import config, set_new_user, write_config, config_file
+from pymoodle_jku.utils.config_data import config, set_new_user, write_config, config_file, cache_dir
 from pymoodle_jku.utils.logging import log_file
 from pymoodle_jku.utils.printing import clean_screen, yn_question
 
@@ -22,6 +23,8 @@ def build_questions():
                  f'Disable Save Password Question for new user' if config.getboolean(
                      'SaveQuestion') else 'Enable Save Password Question for new user',
                  f'Disable check for updates' if config.getboolean('UpdateInfo') else 'Enable check for updates',
+                 f'Disable page cache ({cache_dir})' if config.getboolean(
+                     'Cache') else f'Enable page cache ({cache_dir})',
                  'Remove PyMoodle installation (config & keyring)', 'Exit']
 
     return questions
@@ -35,6 +38,18 @@ def main(args):
     if args.credentials:
         interactive = False
         set_new_user(args.credentials)
+    if args.threads:
+        interactive = False
+        config['Threads'] = str(int(args.threads))
+    if args.min_threads:
+        interactive = False
+        config['MinThreads'] = str(int(args.min_threads))
+    if args.cache:
+        interactive = False
+        config['Cache'] = str(args.cache == 'on')
+    if args.parse_processes is not None:
+        interactive = False
+        config['ParseProcesses'] = str(max(0, int(args.parse_processes)))
 
     if interactive:
         while True:
@@ -87,6 +102,12 @@ def main(args):
                 if save_password:
                     config['UpdateInfo'] = str(not config.getboolean('UpdateInfo'))
             elif idx == 5:
+                question = 'Disable?' if config.getboolean('Cache') else 'Enable?'
+                enable_cache = yn_question(question)
+                if enable_cache:
+                    config['Cache'] = str(not config.getboolean('Cache'))
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+            elif idx == 6:
                 delete_config = yn_question(
                     'Password and config will be deleted. Downloaded files wont!\nAre you sure?')
                 if delete_config:
@@ -99,10 +120,11 @@ def main(args):
                     except FileNotFoundError:
                         pass
                     finally:
+                        shutil.rmtree(cache_dir, ignore_errors=True)
                         print(
                             'Everything Deleted. When running PyMoodle again, a new (default) config will be created.')
                         return 0
-            elif idx == 6:
+            elif idx == 7:
                 break
             write_config()
     else:
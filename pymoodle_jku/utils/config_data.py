@@ -6,9 +6,11 @@ from keyring.errors import PasswordDeleteError
 
 cp = configparser.ConfigParser(allow_no_value=True)
 config_file = Path.home() / '.pymoodle'
+cache_dir = Path.home() / '.pymoodle_cache'
 
 cp['DEFAULT'] = {'Path': None, 'Username': None, 'SaveQuestion': 'True', 'Session': None,
-                 'UpdateInfo': 'True', 'Logging': 'True'}
+                 'UpdateInfo': 'True', 'Logging': 'True', 'Cache': 'False', 'CacheTTL': '600', 'CacheSize': '100',
+                 'MinThreads': '2', 'Threads': '16', 'ParseProcesses': '0'}
 if config_file.is_file():
     cp.read(config_file)
 
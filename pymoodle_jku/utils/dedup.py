@@ -0,0 +1,92 @@
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+STORE_DIR = '.pymoodle-store'
+FICLONE = 0x40049409  # linux ioctl to create a reflink (btrfs, xfs)
+
+
+def file_digest(file: Path) -> str:
+    """Returns the sha256 hexdigest of a file."""
+    digest = hashlib.sha256()
+    with open(file, 'rb') as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """
+    A content-addressed store under the download root. Every file is stored once as
+    .pymoodle-store/<first 2 chars of sha256>/<sha256>, the course directories only contain hardlinks or reflinks to
+    the blobs. If neither is supported by the filesystem the blob is copied.
+
+    Hardlinked files share their content, editing one of them edits all of them.
+    """
+
+    def __init__(self, root: Path):
+        """
+        :param root: The download root, the store is created in it.
+        """
+        self.directory = Path(root) / STORE_DIR
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def blob(self, digest: str) -> Path:
+        """Returns the path of a blob."""
+        return self.directory / digest[:2] / digest
+
+    def add(self, file: Path, digest: str) -> Path:
+        """Moves a finished file into the store. If the blob exists already the file is removed.
+
+        :param file: The downloaded file.
+        :param digest: The sha256 hexdigest of the file.
+        :return: The path of the blob.
+        """
+        blob = self.blob(digest)
+        if blob.is_file():
+            Path(file).unlink()
+        else:
+            blob.parent.mkdir(exist_ok=True)
+            os.replace(file, blob)
+        return blob
+
+    @staticmethod
+    def has_content(blob: Path, file: Path) -> bool:
+        """Returns True if file has the content of blob. A hardlink is detected without reading the file, a reflink
+        or copy by its size and sha256 (the name of the blob).
+
+        :param blob: A blob of the store.
+        :param file: The file to check.
+        """
+        if not file.is_file():
+            return False
+        if os.path.samefile(file, blob):
+            return True
+        return file.stat().st_size == blob.stat().st_size and file_digest(file) == blob.name
+
+    @staticmethod
+    def link(blob: Path, target: Path) -> None:
+        """Creates target with the content of blob. Tries a hardlink, then a reflink and copies if both fail.
+
+        :param blob: A blob of the store.
+        :param target: The file that should be created.
+        """
+        try:
+            os.link(blob, target)
+            return
+        except OSError:
+            pass
+        if fcntl is not None:
+            try:
+                with open(blob, 'rb') as src, open(target, 'wb') as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except OSError:
+                pass
+        shutil.copyfile(blob, target)
@@ -0,0 +1,75 @@
+import codecs
+import json
+import re
+from typing import Iterable, Any, Iterator, Optional
+
+WHITESPACE = ' \t\n\r'
+
+
+class JsonArrayStream:
+    """
+    Decodes the items of a array in a json document while the document is read, e.g. the courses of a moodle web
+    service response. Each item is decoded with json.JSONDecoder.raw_decode as soon as it is complete.
+
+    After the iteration rest holds the document with the array emptied, so the envelope (errors, offsets) can be read
+    with json.loads(rest).
+    """
+
+    def __init__(self, chunks: Iterable[bytes], key: str, encoding: str = 'utf-8'):
+        """
+        :param chunks: The document in chunks, e.g. Response.iter_content().
+        :param key: The name of the array, the first array with this name is decoded.
+        :param encoding: The encoding of the document.
+        """
+        self.chunks = chunks
+        self.rest: Optional[str] = None
+        self._key = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._text = codecs.getincrementaldecoder(encoding)()
+        self._decoder = json.JSONDecoder()
+
+    def __iter__(self) -> Iterator[Any]:
+        head, buffer = None, ''
+        chunks = iter(self.chunks)
+        for chunk in chunks:
+            buffer += self._text.decode(chunk)
+            if head is None:
+                if (m := self._key.search(buffer)) is None:
+                    continue
+                head, buffer = buffer[:m.end()], buffer[m.end():]
+            while True:
+                start = skip(buffer, WHITESPACE + ',')
+                if start == len(buffer):
+                    buffer = ''
+                    break
+                if buffer[start] == ']':
+                    self.rest = head + buffer[start:] + ''.join(self._text.decode(c) for c in chunks) + \
+                                self._text.decode(b'', final=True)
+                    return
+                try:
+                    item, end = self._decoder.raw_decode(buffer, start)
+                except json.JSONDecodeError:
+                    buffer = buffer[start:]
+                    break  # the item isn't complete yet
+                if end == len(buffer):
+                    # a number at the end of the buffer could go on in the next chunk
+                    buffer = buffer[start:]
+                    break
+                yield item
+                buffer = buffer[end:]
+
+        buffer += self._text.decode(b'', final=True)
+        if head is None:
+            self.rest = buffer  # no array, e.g. a error response
+            return
+        # the document ended in the array, only a last item without the closing bracket can be left
+        start = skip(buffer, WHITESPACE + ',')
+        if start < len(buffer):
+            yield self._decoder.raw_decode(buffer, start)[0]
+        raise ValueError('the json document ended before the array')
+
+
+def skip(text: str, chars: str, start: int = 0) -> int:
+    """Returns the index of the first character at or after start that isn't in chars."""
+    while start < len(text) and text[start] in chars:
+        start += 1
+    return start
@@ -2,7 +2,9 @@ import atexit
 import base64
 import functools
 import logging
+import multiprocessing
 import pickle
+from concurrent.futures import ProcessPoolExecutor
 from concurrent.futures.thread import ThreadPoolExecutor
 from getpass import getpass
 from typing import Optional
@@ -15,8 +17,11 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
 from pymoodle_jku.classes.exceptions import NotLoggedInError
+from pymoodle_jku.client.cache import ResponseCache
 from pymoodle_jku.client.client import MoodleClient
-from pymoodle_jku.utils.config_data import config, write_config
+from pymoodle_jku.utils.concurrency import AdaptiveLimiter
+from pymoodle_jku.utils.config_data import config, write_config, cache_dir
+from pymoodle_jku.utils.metrics import MetricsCollector
 from pymoodle_jku.utils.printing import yn_question
 
 logger = logging.getLogger(__name__)
@@ -86,6 +91,34 @@ def setup_encryption(password):
         f = Fernet(key)
 
 
+def response_cache() -> Optional[ResponseCache]:
+    """
+    Creates the ResponseCache in the cache directory, if the cache is enabled in the config.
+    CacheSize is in MB.
+    """
+    if config.getboolean('Cache'):
+        return ResponseCache(cache_dir, ttl=config.getfloat('CacheTTL'),
+                             max_size=int(config.getfloat('CacheSize') * 1024 * 1024))
+    return None
+
+
+def adaptive_limiter() -> AdaptiveLimiter:
+    """
+    Creates a AdaptiveLimiter between MinThreads and Threads of the config.
+    """
+    ceiling = max(1, config.getint('Threads'))
+    return AdaptiveLimiter(floor=min(max(1, config.getint('MinThreads')), ceiling), ceiling=ceiling)
+
+
+def parse_executor() -> Optional[ProcessPoolExecutor]:
+    """
+    Creates a ProcessPoolExecutor with ParseProcesses workers of the config, or None if it is 0.
+    """
+    if (processes := config.getint('ParseProcesses')) > 0:
+        return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+    return None
+
+
 def register_atexit(client):
     global registered
     if registered is False:
@@ -93,17 +126,21 @@ def register_atexit(client):
         registered = True
 
 
-def login(credentials, client: MoodleClient = None) -> Optional[MoodleClient]:
+def login(credentials, client: MoodleClient = None, metrics: MetricsCollector = None) -> Optional[MoodleClient]:
     """
     Tries to Login the user multiple times or uses a .
 
     :param credentials: Tuple[str, str] with (username, password).
     :param threads: the amount of threads to use for crawling.
     :param client: a prepared MoodleClient.
+    :param metrics: a MetricsCollector for the new MoodleClient, if no client is given.
     :return: A Moodle client if login worked, else None
     """
     client_prepared = client is not None
-    client = client or MoodleClient(pool_executor=ThreadPoolExecutor())
+    if client is None:
+        limiter = adaptive_limiter()
+        client = MoodleClient(pool_executor=ThreadPoolExecutor(max_workers=limiter.ceiling), cache=response_cache(),
+                              limiter=limiter, metrics=metrics, parse_executor=parse_executor())
 
     new_credentials = False
     username, password = credentials or (config.get('Username'), None)
@@ -0,0 +1,114 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Iterable, Dict
+
+MANIFEST_FILE = '.pymoodle.sqlite'
+URLS_FILE = 'urls.txt'
+
+
+class SyncManifest:
+    """
+    Stores which urls were already downloaded into a download root, together with the course, UrlType, local path,
+    size and ETag/Last-Modified of the file. Every finished file is committed on its own, so nothing is lost if
+    pymoodle is stopped.
+    """
+
+    def __init__(self, root: Path):
+        """
+        Opens or creates the manifest in the download root. A urls.txt of older versions is migrated once.
+        :param root: The download root.
+        """
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.root / MANIFEST_FILE, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS files (url TEXT PRIMARY KEY, course_id INTEGER, type TEXT, '
+                         'path TEXT, size INTEGER, etag TEXT, last_modified TEXT, completed REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS files_course ON files (course_id)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._db.commit()
+        self.migrate(self.root / URLS_FILE)
+
+    def migrate(self, urls_file: Path) -> int:
+        """Imports the urls of a urls.txt, only the url and the time of the file are known.
+
+        :param urls_file: Path to the urls.txt.
+        :return: The amount of imported urls.
+        """
+        with self._lock:
+            if self._db.execute('SELECT 1 FROM meta WHERE key = ?', (str(urls_file),)).fetchone() is not None:
+                return 0
+            try:
+                urls = urls_file.read_text().splitlines()
+                completed = urls_file.stat().st_mtime
+            except FileNotFoundError:
+                return 0
+            self._db.executemany('INSERT OR IGNORE INTO files (url, completed) VALUES (?, ?)',
+                                 [(u, completed) for u in urls if u])
+            self._db.execute('INSERT INTO meta VALUES (?, ?)', (str(urls_file), 'migrated'))
+            self._db.commit()
+        return len(urls)
+
+    def completed(self, urls: Iterable[str]) -> set:
+        """Returns the urls which were already downloaded.
+
+        :param urls: The urls to look up.
+        :return: A set with the downloaded urls.
+        """
+        urls = list(urls)
+        found = set()
+        with self._lock:
+            for i in range(0, len(urls), 500):
+                chunk = urls[i:i + 500]
+                rows = self._db.execute(f'SELECT url FROM files WHERE url IN ({",".join("?" * len(chunk))})', chunk)
+                found.update(r[0] for r in rows)
+        return found
+
+    def entries(self, urls: Iterable[str]) -> Dict[str, dict]:
+        """Returns the stored values of the urls which were already downloaded.
+
+        :param urls: The urls to look up.
+        :return: A dict url: dict of the stored columns.
+        """
+        urls = list(urls)
+        entries = {}
+        with self._lock:
+            for i in range(0, len(urls), 500):
+                chunk = urls[i:i + 500]
+                cursor = self._db.execute(f'SELECT * FROM files WHERE url IN ({",".join("?" * len(chunk))})', chunk)
+                columns = [c[0] for c in cursor.description]
+                for row in cursor:
+                    entries[row[0]] = dict(zip(columns, row))
+        return entries
+
+    def record(self, url: str, path: Optional[Path] = None, course_id: Optional[int] = None,
+               url_type: Optional[str] = None, size: Optional[int] = None, etag: Optional[str] = None,
+               last_modified: Optional[str] = None) -> None:
+        """Stores a finished download and commits it.
+
+        :param url: The downloaded url.
+        :param path: The local file, stored relative to the root if possible.
+        :param course_id: Id of the course the url belongs to.
+        :param url_type: Name of the UrlType.
+        :param size: Size of the file in bytes.
+        :param etag: ETag header of the download.
+        :param last_modified: Last-Modified header of the download.
+        """
+        if path is not None:
+            path = Path(path)
+            if size is None and path.is_file():
+                size = path.stat().st_size
+            try:
+                path = path.resolve().relative_to(self.root.resolve())
+            except ValueError:
+                pass
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             (url, course_id, url_type, None if path is None else str(path), size, etag,
+                              last_modified, time.time()))
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,164 @@
+import json
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict
+from urllib.parse import urlparse
+
+# first matching endpoint wins, everything else is counted as 'other'
+ENDPOINTS = (
+    ('login', ('/jku/login/', '/idp/', '/Shibboleth.sso/')),
+    ('ajax', ('/jku/lib/ajax/service.php',)),
+    ('course', ('/jku/course/view.php',)),
+    ('grades', ('/jku/course/user.php', '/jku/grade/report/')),
+    ('download', ('/jku/pluginfile.php', '/jku/mod/resource/', '/jku/mod/folder/download_folder.php',
+                  '/jku/mod/url/', '/jku/mod/streamurl/')),
+    ('quiz', ('/jku/mod/quiz/',)),
+)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class EndpointMetrics:
+    def __init__(self):
+        """
+        The collected values of one endpoint.
+        """
+        self.requests = 0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+        self.retries = 0
+        self.bytes_in = 0
+        self.status = Counter()
+
+    def observe(self, latency: float) -> None:
+        self.requests += 1
+        self.latency_sum += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def to_dict(self) -> dict:
+        return {'requests': self.requests, 'latency_sum': self.latency_sum,
+                'latency_avg': self.latency_sum / self.requests if self.requests else None,
+                'latency_buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], self.buckets)),
+                'retries': self.retries, 'bytes_in': self.bytes_in,
+                'status': {str(k): v for k, v in sorted(self.status.items())}}
+
+
+class CountingStream:
+    """
+    Wraps the raw urllib3 response of a streamed request and counts the bytes that are read from it.
+    """
+
+    def __init__(self, raw, count):
+        self._raw = raw
+        self._count = count
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            self._count(len(chunk))
+            yield chunk
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        data = self._raw.read(amt, decode_content=decode_content, **kwargs)
+        self._count(len(data or b''))
+        return data
+
+    def __getattr__(self, item):
+        return getattr(self._raw, item)
+
+
+class MetricsCollector:
+    """
+    Collects latency histograms, retries, received bytes and status codes per endpoint.
+    Use record as the first response hook of a session (MoodleClient(metrics=...) does that).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints: Dict[str, EndpointMetrics] = {}
+
+    @staticmethod
+    def endpoint(url) -> str:
+        """Returns the endpoint name of a url."""
+        path = urlparse(url).path
+        for name, prefixes in ENDPOINTS:
+            if path.startswith(prefixes):
+                return name
+        return 'other'
+
+    def _metrics(self, endpoint) -> EndpointMetrics:
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = EndpointMetrics()
+        return self.endpoints[endpoint]
+
+    def record(self, r, *args, **kwargs):
+        """Response hook which records a response.
+        Bodies of streamed responses are counted while they are read.
+
+        :param r: The response.
+        :param kwargs: The send kwargs from requests.
+        :return: returns the response.
+        """
+        endpoint = self.endpoint(r.url)
+        retries = getattr(getattr(r.raw, 'retries', None), 'history', None) or ()
+        if kwargs.get('stream') and r.raw is not None:
+            size = 0
+            r.raw = CountingStream(r.raw, lambda n, e=endpoint: self.add_bytes(e, n))
+        else:
+            size = len(r.content or b'')
+        with self._lock:
+            m = self._metrics(endpoint)
+            m.observe(r.elapsed.total_seconds())
+            m.retries += len(retries)
+            m.bytes_in += size
+            m.status[r.status_code] += 1
+        return r
+
+    def add_bytes(self, endpoint, size: int) -> None:
+        with self._lock:
+            self._metrics(endpoint).bytes_in += size
+
+    def summary(self) -> Dict[str, dict]:
+        """Returns all collected values as dict of endpoint: values."""
+        with self._lock:
+            return {name: m.to_dict() for name, m in sorted(self.endpoints.items())}
+
+    def to_json(self) -> str:
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Returns all collected values in the Prometheus text format."""
+        lines = ['# HELP pymoodle_request_duration_seconds Time until the response headers were received.',
+                 '# TYPE pymoodle_request_duration_seconds histogram']
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            for name, m in endpoints:
+                cumulative = 0
+                for bound, count in zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], m.buckets):
+                    cumulative += count
+                    lines.append(f'pymoodle_request_duration_seconds_bucket{{endpoint="{name}",le="{bound}"}} '
+                                 f'{cumulative}')
+                lines.append(f'pymoodle_request_duration_seconds_sum{{endpoint="{name}"}} {m.latency_sum}')
+                lines.append(f'pymoodle_request_duration_seconds_count{{endpoint="{name}"}} {m.requests}')
+            lines += ['# HELP pymoodle_request_retries_total Retries done by urllib3.',
+                      '# TYPE pymoodle_request_retries_total counter']
+            lines += [f'pymoodle_request_retries_total{{endpoint="{name}"}} {m.retries}' for name, m in endpoints]
+            lines += ['# HELP pymoodle_response_bytes_total Received (decoded) body bytes.',
+                      '# TYPE pymoodle_response_bytes_total counter']
+            lines += [f'pymoodle_response_bytes_total{{endpoint="{name}"}} {m.bytes_in}' for name, m in endpoints]
+            lines += ['# HELP pymoodle_responses_total Responses by status code.',
+                      '# TYPE pymoodle_responses_total counter']
+            lines += [f'pymoodle_responses_total{{endpoint="{name}",status="{status}"}} {count}'
+                      for name, m in endpoints for status, count in sorted(m.status.items())]
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: Path) -> None:
+        """Writes the metrics to path. Files ending with .json are written as json, everything else in the
+        Prometheus text format.
+        """
+        path = Path(path)
+        path.write_text(self.to_json() if path.suffix == '.json' else self.to_prometheus(), encoding='utf-8')
@@ -1,11 +1,19 @@
-import psutil
+import threading
 import time
+from typing import Optional
+
+import psutil
 
 
 def net_interfaces():
     return list(psutil.net_io_counters(pernic=True, nowrap=True).keys())
 
 
+def mbit_to_bytes(mbit: float) -> float:
+    """Converts Mbit/s (like net_usage returns them) to bytes/s."""
+    return mbit * 1024 * 1024 / 8
+
+
 def net_usage(inf="en0"):  # change the inf variable according to the interface
     net_stat = psutil.net_io_counters(pernic=True, nowrap=True)[inf]
     net_in_1 = net_stat.bytes_recv
@@ -20,3 +28,87 @@ def net_usage(inf="en0"):  # change the inf variable according to the interface
 
     return net_in, net_out
     # print(f"Current net-usage:\nIN: {net_in} Mbit/s, OUT: {net_out} Mbit/s")
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket which limits the bandwidth of all downloads that share it.
+    Every received chunk consumes its size in tokens, tokens are refilled with rate bytes per second.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        :param rate: Allowed bytes per second.
+        :param burst: Max amount of tokens that can be saved up, defaults to a quarter second of rate.
+        """
+        self.rate = rate
+        self.burst = burst or rate / 4
+        self.tokens = self.burst
+        self.consumed = 0  # total consumed bytes, used by the InterfaceSampler
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def consume(self, amount: int) -> None:
+        """Takes amount tokens and blocks until they are paid back.
+        Bigger amounts than burst are allowed, the bucket is in debt afterwards.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            self.consumed += amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    def chunk_size(self, max_size=1024 * 1024, min_size=16 * 1024) -> int:
+        """A chunk size which lets the downloads follow the rate smoothly (about 8 chunks per second)."""
+        return int(min(max_size, max(min_size, self.rate / 8)))
+
+
+class InterfaceSampler(threading.Thread):
+    """
+    Samples the traffic of a network interface in the background and gives the TokenBucket only the bandwidth
+    which isn't used by other programs.
+    """
+
+    def __init__(self, bucket: TokenBucket, interface: str, limit: float, interval: float = 1.0,
+                 min_rate: Optional[float] = None):
+        """
+        :param bucket: The TokenBucket of the downloads.
+        :param interface: The interface to sample (example eth0 or en0).
+        :param limit: Max bytes per second for the whole interface.
+        :param interval: Seconds between two samples.
+        :param min_rate: Bytes per second the downloads always get, defaults to 5% of limit.
+        """
+        super().__init__(daemon=True)
+        self.bucket = bucket
+        self.interface = interface
+        self.limit = limit
+        self.interval = interval
+        self.min_rate = min_rate or limit / 20
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        received = psutil.net_io_counters(pernic=True, nowrap=True)[self.interface].bytes_recv
+        consumed = self.bucket.consumed
+        last = time.monotonic()
+        while not self._stop_event.wait(self.interval):
+            new_received = psutil.net_io_counters(pernic=True, nowrap=True)[self.interface].bytes_recv
+            new_consumed = self.bucket.consumed
+            now = time.monotonic()
+            foreign = max(0, (new_received - received) - (new_consumed - consumed)) / (now - last)
+            self.bucket.set_rate(max(self.min_rate, self.limit - foreign))
+            received, consumed, last = new_received, new_consumed, now
+
+    def stop(self) -> None:
+        self._stop_event.set()
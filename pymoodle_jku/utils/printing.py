@@ -40,9 +40,8 @@ def print_courses(client):
     :param client: A MoodleClient that is logged in.
     :return:
     """
-    courses = client.courses()
-    output = '\n'.join(map(lambda c: f'{c.id}: {c.fullname}', courses))
-    print(output, flush=True)
+    for c in client.courses(load_pages=False):
+        print(f'{c.id}: {c.fullname}', flush=True)
 
 
 def print_pick_results_table(data: List, multiselect=False, load_more=True) -> Optional[Any]:
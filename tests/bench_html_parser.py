@@ -0,0 +1,67 @@
+"""
+Benchmarks the parsing of a large grade report, built from the saved page in tests/fixtures.
+legacy is the extraction of older versions (string xpath expressions, four queries per table row).
+
+python -m tests.bench_html_parser
+"""
+import re
+import timeit
+from pathlib import Path
+from typing import List
+from urllib.parse import unquote, urlparse
+
+from pymoodle_jku.classes.course_data import Url, UrlType
+from pymoodle_jku.classes.evaluation import Evaluation
+from pymoodle_jku.client.html_parser import ValuationPage
+from tests.test_html_parser import fixture_response
+
+
+def legacy_evaluations(region) -> List[Evaluation]:
+    if len(region.xpath('.//table')) == 0:
+        return []
+
+    grade = region.xpath('.//table/thead/tr/th[@id="grade"]')[0]
+    grade_range = region.xpath('.//table/thead/tr/th[@id="range"]')[0]
+
+    first_row = region.xpath('.//table/thead/tr')[0]
+    index_grade = first_row.index(grade)
+    index_range = first_row.index(grade_range)
+
+    evaluations = []
+    for row in region.xpath('.//table/tbody/tr'):
+        if len(row.xpath('./td')) <= 1 or len(row.xpath('./th/a/text()')) == 0:
+            continue
+        name, url, criteria = row.xpath('./th/a/text()')[0], row.xpath('./th/a/@href')[0], row.xpath('./td/text()')
+        grade, grade_range = criteria[index_grade - 1], criteria[index_range - 1]
+
+        evaluations.append(
+            Evaluation(name, Url(str(url), UrlType[Path(unquote(urlparse(url).path)).parts[3].capitalize()]), grade,
+                       grade_range))
+    return evaluations
+
+
+def large_report(repeat: int):
+    """Returns a Response of the saved grade report with every body row repeated."""
+    response = fixture_response('grades_user.html', 'https://moodle.jku.at/jku/grade/report/user/index.php?id=1234')
+    page = response.content.decode('utf-8')
+    body = re.search(r'<tbody>(.*)</tbody>', page, re.S)
+    response._content = (page[:body.start(1)] + body.group(1) * repeat + page[body.end(1):]).encode('utf-8')
+    return response
+
+
+def main(repeat=50, number=5):
+    page = ValuationPage(large_report(repeat))
+    evaluations = page.evaluations()
+    assert evaluations == legacy_evaluations(page.region)
+
+    runs = {
+        'legacy': lambda: legacy_evaluations(page.region),
+        'compiled': page.evaluations,
+    }
+    for name, run in runs.items():
+        seconds = min(timeit.repeat(run, number=1, repeat=number))
+        print(f'{name:10} {seconds * 1000:8.1f} ms for {len(evaluations)} rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmarks the markdown conversion of the saved quiz and course pages in tests/fixtures.
+legacy is the conversion of older versions (serialize, clean and parse again for every element).
+
+python -m tests.bench_markdown
+"""
+import timeit
+
+import antimarkdown
+from lxml import etree
+from lxml.etree import _ElementUnicodeResult
+from lxml.html.clean import Cleaner
+
+from pymoodle_jku.client.html_parser import QuizPage, CoursePage
+from pymoodle_jku.client.markdown import MarkdownConverter
+from tests.test_html_parser import fixture_response
+
+
+def legacy_convert_elements(elements) -> str:
+    output = ''
+    cleaner = Cleaner()
+    cleaner.forms = False
+    cleaner.remove_tags = ['span']
+    for e in elements:
+        if isinstance(e, _ElementUnicodeResult):
+            output += '\n'.join([line.strip() for line in str(e).splitlines()]) + '\n'
+        else:
+            e.attrib.clear()
+            conv = antimarkdown.to_markdown(cleaner.clean_html(etree.tostring(e).decode('utf-8')))
+            output += '\n'.join([line.strip() for line in conv.splitlines()])
+        output += '\n'
+    output += '\n'
+    return output
+
+
+def node_lists():
+    quiz = QuizPage(fixture_response('quiz_review.html'))
+    course = CoursePage(fixture_response('course_view.html'))
+    lists = [i.xpath('./node()') for i in quiz.info]
+    for q, f in quiz.questions:
+        lists.append(q.xpath('./node()'))
+        if f is not None:
+            lists.append(f.xpath('./node()'))
+    lists += [s.xpath('./node()') for s in course.region.xpath('.//ul[@class=$name]/li', name='topics')]
+    return lists
+
+
+def main(number=5):
+    lists = node_lists()
+    warm = MarkdownConverter()
+    assert all(legacy_convert_elements(n) == warm.convert(n) for n in lists)
+
+    def cold():
+        converter = MarkdownConverter()
+        for n in lists:
+            converter.convert(n)
+
+    runs = {
+        'legacy': lambda: [legacy_convert_elements(n) for n in lists],
+        'engine (cold memo)': cold,
+        'engine (warm memo)': lambda: [warm.convert(n) for n in lists],
+    }
+    for name, run in runs.items():
+        seconds = min(timeit.repeat(run, number=1, repeat=number))
+        print(f'{name:20} {seconds * 1000:8.1f} ms for {len(lists)} blocks')
+
+
+if __name__ == '__main__':
+    main()
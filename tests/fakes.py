@@ -0,0 +1,25 @@
+import io
+from typing import Callable, Tuple, Union, BinaryIO
+
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+
+class FakeAdapter(HTTPAdapter):
+    """
+    A transport adapter that answers requests without a network.
+    respond(request) returns (status, headers, body) of each request, body is bytes or a file. It is read through a
+    real urllib3 response, so streaming and Content-Encoding work like with a server.
+    """
+
+    def __init__(self, respond: Callable[[object], Tuple[int, dict, Union[bytes, BinaryIO]]]):
+        super().__init__()
+        self.respond = respond
+        self.requests = []
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        self.requests.append(request)
+        status, headers, body = self.respond(request)
+        body = body if hasattr(body, 'read') else io.BytesIO(body)
+        raw = HTTPResponse(body=body, headers=headers, status=status, preload_content=False, decode_content=True)
+        return self.build_response(request, raw)
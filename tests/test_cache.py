@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from pymoodle_jku.client import cache as cache_module
+from pymoodle_jku.client.cache import ResponseCache, CacheAdapter
+from tests.fakes import FakeAdapter
+
+COURSE_URL = 'https://moodle.jku.at/jku/course/view.php?id='
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 1000.0
+        clock = mock.patch.object(cache_module, 'time')
+        clock.start().time.side_effect = lambda: self.now
+        self.addCleanup(clock.stop)
+
+        self.pages = {}  # url: (headers, body)
+        self.adapter = FakeAdapter(self.respond)
+        self.cache = ResponseCache(Path(tempfile.mkdtemp()), ttl=600)
+        self.cache.userid = 1
+        self.session = requests.Session()
+        self.session.mount('https://moodle.jku.at/', CacheAdapter(self.adapter, self.cache))
+
+    def respond(self, request):
+        headers, body = self.pages[request.url]
+        etag = headers.get('ETag')
+        if etag is not None and request.headers.get('If-None-Match') == etag:
+            return 304, {'ETag': etag}, b''
+        return 200, {'Content-Type': 'text/html; charset=utf-8', **headers}, body
+
+    def get(self, url):
+        self.now += 1
+        return self.session.get(url)
+
+    def test_ttl(self):
+        self.pages[COURSE_URL + '1'] = ({}, b'<html>course</html>')
+        self.assertEqual(self.get(COURSE_URL + '1').content, b'<html>course</html>')
+        self.assertEqual(self.get(COURSE_URL + '1').content, b'<html>course</html>')
+        self.assertEqual(len(self.adapter.requests), 1)
+
+        self.pages[COURSE_URL + '1'] = ({}, b'<html>changed</html>')
+        self.now += 600
+        self.assertEqual(self.get(COURSE_URL + '1').content, b'<html>changed</html>')
+        self.assertEqual(len(self.adapter.requests), 2)
+
+    def test_revalidation(self):
+        self.pages[COURSE_URL + '1'] = ({'ETag': '"v1"'}, b'<html>course</html>')
+        self.get(COURSE_URL + '1')
+        response = self.get(COURSE_URL + '1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, '<html>course</html>')
+        self.assertEqual(len(self.adapter.requests), 2)
+        self.assertEqual(self.adapter.requests[1].headers['If-None-Match'], '"v1"')
+
+        self.pages[COURSE_URL + '1'] = ({'ETag': '"v2"'}, b'<html>changed</html>')
+        self.assertEqual(self.get(COURSE_URL + '1').content, b'<html>changed</html>')
+        self.assertEqual(self.cache.get(COURSE_URL + '1')[2], '"v2"')
+
+    def test_users(self):
+        self.pages[COURSE_URL + '1'] = ({}, b'<html>course</html>')
+        self.get(COURSE_URL + '1')
+        self.cache.userid = 2
+        self.get(COURSE_URL + '1')
+        self.get(COURSE_URL + '1')
+        self.assertEqual(len(self.adapter.requests), 2)
+
+        self.cache.userid = None
+        self.get(COURSE_URL + '1')
+        self.assertEqual(len(self.adapter.requests), 3)
+        self.cache.userid = 1
+        self.get(COURSE_URL + '1')
+        self.assertEqual(len(self.adapter.requests), 3)
+
+    def test_eviction(self):
+        # random bodies can't be compressed, so every entry needs a bit more than 1000 bytes
+        for i in range(1, 4):
+            self.pages[COURSE_URL + str(i)] = ({}, os.urandom(1000))
+        self.cache.max_size = 2500
+        self.get(COURSE_URL + '1')
+        self.get(COURSE_URL + '2')
+        self.get(COURSE_URL + '1')
+        self.get(COURSE_URL + '3')
+        self.assertEqual(len(self.adapter.requests), 3)
+
+        self.assertIsNone(self.cache.get(COURSE_URL + '2'))
+        self.assertIsNotNone(self.cache.get(COURSE_URL + '1'))
+        self.assertIsNotNone(self.cache.get(COURSE_URL + '3'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from unittest import mock
+
+import requests
+
+from pymoodle_jku.utils import concurrency
+from pymoodle_jku.utils.concurrency import AdaptiveLimiter, LimiterAdapter
+from tests.fakes import FakeAdapter
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 1000.0
+        clock = mock.patch.object(concurrency, 'time')
+        clock.start().monotonic.side_effect = lambda: self.now
+        self.addCleanup(clock.stop)
+
+    def request(self, limiter, latency=None, status=200, error=False):
+        limiter.acquire()
+        limiter.release(latency=latency, status=status, error=error)
+
+    def test_increase(self):
+        limiter = AdaptiveLimiter(floor=2, ceiling=16)
+        self.request(limiter, 0.1)
+        self.assertEqual(limiter.limit, 2.5)
+        self.assertEqual(limiter.base_latency, 0.1)
+        # about one more request in flight per round trip
+        for _ in range(9):
+            self.request(limiter, 0.1)
+        self.assertAlmostEqual(limiter.limit, 5, delta=0.5)
+        for _ in range(1000):
+            self.request(limiter, 0.1)
+        self.assertEqual(limiter.limit, 16)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_decrease(self):
+        limiter = AdaptiveLimiter(floor=2, ceiling=16, initial=8)
+        self.request(limiter, 0.1)
+        self.assertEqual(limiter.limit, 8.125)
+
+        # slower than 3 * base latency
+        self.request(limiter, 0.35)
+        self.assertEqual(limiter.limit, 8.125 / 2)
+        # only once per round trip
+        self.request(limiter, 0.35)
+        self.request(limiter, status=429)
+        self.assertEqual(limiter.limit, 8.125 / 2)
+        # a bit slower is no congestion
+        self.request(limiter, 0.25)
+        self.assertGreater(limiter.limit, 8.125 / 2)
+
+        self.now += 1
+        self.request(limiter, status=503)
+        self.assertLess(limiter.limit, 8.125 / 2)
+        for _ in range(10):
+            self.now += 1
+            self.request(limiter, error=True)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_bounds(self):
+        self.assertEqual(AdaptiveLimiter(floor=2, ceiling=16, initial=32).limit, 16)
+        self.assertEqual(AdaptiveLimiter(floor=2, ceiling=16, initial=1).limit, 2)
+        with self.assertRaises(ValueError):
+            AdaptiveLimiter(floor=4, ceiling=2)
+
+    def test_adapter(self):
+        statuses = iter([200, 503])
+        limiter = AdaptiveLimiter(floor=2, ceiling=16, initial=8)
+        session = requests.Session()
+        session.mount('https://moodle.jku.at/', LimiterAdapter(FakeAdapter(lambda r: (next(statuses), {}, b'')),
+                                                               limiter))
+        session.get('https://moodle.jku.at/jku/my/')
+        self.assertEqual(limiter.limit, 8.125)
+        self.assertEqual(session.get('https://moodle.jku.at/jku/my/').status_code, 503)
+        self.assertEqual(limiter.limit, 8.125 / 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
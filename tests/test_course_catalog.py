@@ -0,0 +1,83 @@
+import json
+import unittest
+
+from pymoodle_jku.classes.course import Course
+from pymoodle_jku.classes.course_catalog import CourseCatalog
+from pymoodle_jku.client.client import MoodleClient
+from tests.fakes import FakeAdapter
+
+
+def course(id, fullname, enddate, shortname=None):
+    return Course.from_json({'id': id, 'fullname': fullname, 'shortname': shortname or f'c{id}', 'enddate': enddate,
+                             'courseimage': 'data:image/svg+xml;base64,AAAA', 'somenewfield': 1})
+
+
+class TestCourseCatalog(unittest.TestCase):
+    def setUp(self) -> None:
+        self.courses = [course(1, 'Logik, 2022S', 300), course(2, 'Algebra, 2022S', 300),
+                        course(3, 'Logik, 2021W', 200), course(4, 'Mentoring', 0), course(5, 'Analysis, 2021S', 100),
+                        course(1, 'Logik, 2022S', 300)]
+        self.catalog = CourseCatalog(self.courses)
+
+    def test_index(self):
+        self.assertEqual(len(self.catalog), 5)
+        self.assertIs(self.catalog[3], self.courses[2])
+        self.assertIn(2, self.catalog)
+        self.assertIn(course(2, 'Other', 1), self.catalog)
+        self.assertNotIn(6, self.catalog)
+        self.assertIs(self.catalog.by_shortname('c5'), self.courses[4])
+        self.assertIsNone(self.catalog[1].courseimage)
+
+    def test_dates(self):
+        self.assertEqual([c.id for c in self.catalog.current(250)], [1, 2, 4])
+        self.assertEqual([c.id for c in self.catalog.ending_between(100, 200)], [5, 3])
+        self.assertEqual(list(self.catalog.semesters()), [100, 200, 300])
+
+    def test_search(self):
+        self.assertEqual([c.id for c in self.catalog.search(['logik'])], [1, 3])
+        self.assertEqual([c.id for c in self.catalog.search(['ALGEBRA', 'mentoring'])], [2, 4])
+        self.assertEqual([c.id for c in self.catalog.search(['2022s\nalg'])], [])
+        self.assertEqual(len(self.catalog.search([''])), 5)
+
+    def test_course_equality(self):
+        self.assertEqual(self.courses[0], self.courses[5])
+        self.assertNotEqual(self.courses[0], self.courses[1])
+        self.assertEqual(len({*self.courses}), 5)
+        self.assertEqual(sorted(self.catalog, reverse=True)[0].id, 4)
+
+
+class TestClientCatalog(unittest.TestCase):
+    def setUp(self) -> None:
+        def respond(request):
+            hidden = json.loads(request.body)[0]['args']['classification'] == 'hidden'
+            courses = [{'id': i, 'fullname': f'Course {i}', 'courseimage': 'data:image/svg+xml;base64,AAAA',
+                        'summary': '<p>Summary</p>'} for i in ([3] if hidden else range(3))]
+            return 200, {'Content-Type': 'application/json'}, \
+                json.dumps([{'error': False, 'data': {'courses': courses, 'nextoffset': 3}}]).encode()
+
+        self.adapter = FakeAdapter(respond)
+        self.client = MoodleClient()
+        self.client.session.mount('https://moodle.jku.at/', self.adapter)
+
+    def test_skip(self):
+        courses = list(self.client.courses(load_pages=False))
+        self.assertEqual(len(courses), 4)
+        self.assertIsNone(courses[0].courseimage)
+        self.assertIsNone(courses[0].summary)
+        # all and hidden courses
+        self.assertEqual(len(self.adapter.requests), 2)
+
+        self.assertIs(self.client.catalog()[0], courses[0])
+        self.assertEqual(len(self.adapter.requests), 2)
+
+        courses = list(self.client.courses(load_pages=False, skip=()))
+        self.assertEqual(courses[0].courseimage, 'data:image/svg+xml;base64,AAAA')
+        self.assertEqual(courses[0].summary, '<p>Summary</p>')
+        self.assertEqual(len(self.adapter.requests), 4)
+        self.assertIs(self.client.catalog(skip=())[0], courses[0])
+        self.assertIsNone(self.client.catalog()[0].summary)
+        self.assertEqual(len(self.adapter.requests), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,35 @@
+import json
+import shutil
+import tempfile
+import threading
 import unittest
+from argparse import Namespace
+from concurrent.futures import Executor, Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from pathlib import Path
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
 
 import keyring
+import requests
+from requests.adapters import BaseAdapter
 
+from pymoodle_jku.classes.course import Course
 from pymoodle_jku.classes.course_data import Url, UrlType
+from pymoodle_jku.classes.exceptions import NotLoggedInError
 from pymoodle_jku.client.client import MoodleClient
+from pymoodle_jku.client.download_handlers import HANDLERS, LANES, DownloadHandler, Handoff, Lane, find_handler, \
+    register_handler
 from pymoodle_jku.client.download_manager import DownloadManager
+from pymoodle_jku.client.service_parser import CourseContents
+from pymoodle_jku.scripts import downloading
+from pymoodle_jku.scripts.downloading import course_sources
 from pymoodle_jku.utils.config import config
+from pymoodle_jku.utils.dedup import BlobStore
+from pymoodle_jku.utils.manifest import SyncManifest
+from tests.fakes import FakeAdapter
+
+FIXTURES = Path(__file__).parent / 'fixtures'
 
 
 class TestDownloadManager(unittest.TestCase):
@@ -78,6 +101,26 @@ class TestDownloadManager(unittest.TestCase):
 
         del courses
 
+    def test_download_sources(self):
+        courses = [c for c in self.client.courses() if 'Logic' not in c.fullname][:2]
+
+        def sources():
+            for c in courses:
+                d = self.download_path / str(c.id)
+                d.mkdir(exist_ok=True)
+                yield c.course_page.to_course_data().links, d, c.fullname, c.id
+
+        dm = DownloadManager([], self.client, self.download_path)
+        dm.download(sources())
+        self.assertEqual(len(dm.groups), len(courses) + 1)
+        self.assertGreater(len(dm.done), 0)
+
+        for group in dm.groups[1:]:
+            self.assertEqual(group.pending, 0)
+            for url, path in group.done:
+                self.assertEqual(path.parent, group.path)
+                path.unlink()
+
     def tearDown(self) -> None:
         urls = self.download_path / 'urls.txt'
         if urls.is_file():
@@ -85,5 +128,456 @@ class TestDownloadManager(unittest.TestCase):
         self.download_path.unlink()
 
 
+class FileHandler(BaseHTTPRequestHandler):
+    """Serves files like moodle, a module page redirects to its file only with redirect=1."""
+    files = {}  # path: content
+    modules = {}  # path of a module page: path of its file
+    range_offset = 0  # added to the start of every requested range
+    requested = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.requested.append((url.path, self.headers.get('Range')))
+        if url.path in self.modules:
+            if parse_qs(url.query).get('redirect') == ['1']:
+                self.send_response(303)
+                self.send_header('Location', self.modules[url.path])
+                self.end_headers()
+            else:
+                self.send_body(200, b'<html><body>module page</body></html>', {'Content-Type': 'text/html'})
+            return
+        if (data := self.files.get(url.path)) is None:
+            self.send_body(404, b'', {})
+            return
+        headers = {'Content-Type': 'application/octet-stream', 'Accept-Ranges': 'bytes', 'ETag': '"v1"',
+                   'Content-Disposition': f'attachment; filename="{Path(url.path).name}"'}
+        if (requested := self.headers.get('Range')) is None:
+            self.send_body(200, data, headers)
+            return
+        start, end = requested[len('bytes='):].split('-')
+        start, end = int(start) + self.range_offset, int(end) if end else len(data) - 1
+        headers['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+        self.send_body(206, data[start:end + 1], headers)
+
+    def send_body(self, status, body, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ImmediateExecutor(Executor):
+    """Runs every submitted function right away in the calling thread."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class GradeAdapter(BaseAdapter):
+    """Answers the grade pages of moodle, pages maps the course id to the html of its grade page."""
+
+    def __init__(self, pages):
+        super().__init__()
+        self.pages = pages
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        body = self.pages.get(int(parse_qs(urlparse(request.url).query)['id'][0]))
+        response.status_code = 500 if body is None else 200
+        response.headers['Content-Type'] = 'text/html; charset=utf-8'
+        response._content = (body or '<html><body>error</body></html>').encode()
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class TestLocalDownloads(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = MoodleClient()
+        self.download_path = Path(tempfile.mkdtemp())
+        FileHandler.files, FileHandler.modules, FileHandler.range_offset, FileHandler.requested = {}, {}, 0, []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f'http://127.0.0.1:{self.server.server_port}'
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.download_path)
+
+    def write_part(self, dm, url, data, length):
+        """Writes a .part file of a interrupted download of url."""
+        part, meta = dm._part_files(url, self.download_path)
+        part.write_bytes(data)
+        meta.write_text(json.dumps({'url': url, 'filename': Path(url).name, 'length': length, 'resumable': True,
+                                    'etag': '"v1"', 'last_modified': None}))
+        return part, meta
+
+    def test_resume(self):
+        content = bytes(range(256)) * 4
+        FileHandler.files['/files/notes.pdf'] = content
+        url = self.base + '/files/notes.pdf'
+        dm = DownloadManager([], self.client, self.download_path)
+        part, meta = self.write_part(dm, url, content[:256], len(content))
+
+        done, _, file = dm.get_request(url)
+        self.assertTrue(done)
+        self.assertEqual(file.read_bytes(), content)
+        self.assertEqual(FileHandler.requested, [('/files/notes.pdf', 'bytes=256-')])
+        self.assertFalse(part.exists() or meta.exists())
+
+    def test_mismatched_range(self):
+        content = bytes(range(256)) * 4
+        FileHandler.files['/files/notes.pdf'] = content
+        FileHandler.range_offset = 10
+        url = self.base + '/files/notes.pdf'
+        dm = DownloadManager([], self.client, self.download_path)
+        self.write_part(dm, url, content[:256], len(content))
+
+        self.assertEqual(dm.get_request(url, self.download_path), (False, url, None))
+        self.assertEqual(FileHandler.requested, [('/files/notes.pdf', 'bytes=256-')])
+        self.assertEqual(list(self.download_path.iterdir()), [])
+
+        FileHandler.range_offset = 0
+        done, _, file = dm.get_request(url, self.download_path)
+        self.assertTrue(done)
+        self.assertEqual(file.read_bytes(), content)
+
+    def test_manifest(self):
+        FileHandler.files['/files/notes.pdf'] = b'some notes'
+        url = self.base + '/files/notes.pdf'
+        manifest = SyncManifest(self.download_path)
+        dm = DownloadManager([Url(url, UrlType.Resource)], self.client, self.download_path, manifest=manifest)
+        dm.download()
+        self.assertEqual(manifest.completed([url, self.base + '/files/other.pdf']), {url})
+        entry = manifest.entries([url])[url]
+        manifest.close()
+        self.assertEqual((entry['path'], entry['size'], entry['etag'], entry['type']),
+                         ('notes.pdf', 10, '"v1"', 'Resource'))
+
+    def test_replace_changed_file(self):
+        url = self.base + '/files/notes.pdf'
+        for store in (False, True):
+            with self.subTest(store=store):
+                directory = self.download_path / str(store)
+                directory.mkdir()
+                manifest = SyncManifest(directory)
+                for content in (b'old notes', b'new notes'):
+                    FileHandler.files['/files/notes.pdf'] = content
+                    dm = DownloadManager([Url(url, UrlType.Resource)], self.client, directory, manifest=manifest,
+                                         store=BlobStore(directory) if store else None)
+                    done, _, file = dm.get_request(url, directory)
+                    self.assertTrue(done)
+                    dm._record(url, file)
+                manifest.close()
+                self.assertEqual(file, directory / 'notes.pdf')
+                self.assertEqual(file.read_bytes(), b'new notes')
+                self.assertEqual(sorted(f.name for f in directory.glob('notes*')), ['notes.pdf'])
+
+    def test_copied_blob(self):
+        FileHandler.files['/a/notes.pdf'] = FileHandler.files['/b/notes.pdf'] = b'same notes'
+        FileHandler.files['/c/notes.pdf'] = b'other notes'
+        dm = DownloadManager([], self.client, self.download_path, store=BlobStore(self.download_path))
+        # a filesystem without hardlinks and reflinks
+        with mock.patch.object(BlobStore, 'link', staticmethod(shutil.copyfile)):
+            files = [dm.get_request(f'{self.base}/{d}/notes.pdf', self.download_path)[2] for d in 'abc']
+        self.assertEqual(files[0], self.download_path / 'notes.pdf')
+        self.assertEqual(files[1], files[0])
+        self.assertNotEqual(files[2], files[0])
+        self.assertEqual(files[2].read_bytes(), b'other notes')
+        self.assertEqual(len(list(self.download_path.glob('notes*'))), 2)
+
+    def test_segments(self):
+        content = bytes(range(256)) * 64
+        FileHandler.files['/files/video.mp4'] = content
+        dm = DownloadManager([], self.client, self.download_path, segments=4, segment_threshold=1024)
+
+        done, _, file = dm.get_request(self.base + '/files/video.mp4')
+        self.assertTrue(done)
+        self.assertEqual(file.read_bytes(), content)
+        self.assertEqual(sorted(r for p, r in FileHandler.requested if r is not None),
+                         ['bytes=12288-16383', 'bytes=4096-8191', 'bytes=8192-12287'])
+
+    def test_segments_of_redirect(self):
+        content = bytes(range(256)) * 64
+        FileHandler.files['/files/video.mp4'] = content
+        FileHandler.modules['/mod/resource/view.php'] = '/files/video.mp4'
+        url = self.base + '/mod/resource/view.php?id=1'
+        dm = DownloadManager([], self.client, self.download_path, segments=4, segment_threshold=1024)
+
+        done, _, file = dm.download_from_url(url, self.download_path)
+        self.assertTrue(done)
+        self.assertEqual(file.read_bytes(), content)
+        self.assertEqual(sorted(r for p, r in FileHandler.requested if p == '/files/video.mp4' and r is not None),
+                         ['bytes=12288-16383', 'bytes=4096-8191', 'bytes=8192-12287'])
+
+    def test_download_sources(self):
+        for name in ('a.pdf', 'b.pdf', 'c.pdf'):
+            FileHandler.files[f'/files/{name}'] = name.encode()
+
+        def sources():
+            for i, names in enumerate((['a.pdf', 'b.pdf'], ['c.pdf'])):
+                directory = self.download_path / str(i)
+                directory.mkdir()
+                yield [Url(f'{self.base}/files/{n}', UrlType.Resource) for n in names], directory, f'Course {i}', i
+
+        dm = DownloadManager([], self.client, self.download_path)
+        dm.download(sources())
+        self.assertEqual(len(dm.groups), 3)
+        for group in dm.groups[1:]:
+            self.assertEqual((group.pending, group.failed), (0, []))
+            self.assertTrue(all(file.parent == group.path for url, file in group.done))
+        self.assertEqual(sorted(file.relative_to(self.download_path).as_posix() for url, file in dm.done),
+                         ['0/a.pdf', '0/b.pdf', '1/c.pdf'])
+
+    def course(self, id, link):
+        c = Course.from_json({'id': id, 'fullname': f'2022S, Course {id}', 'viewurl': f'{self.base}/course/{id}'})
+        c.course_page = CourseContents([{'name': 'Topic', 'modules': [{'url': self.base + link}]}], c.viewurl)
+        return c
+
+    def test_failed_grade_page(self):
+        for name in ('notes1.pdf', 'notes2.pdf', 'sheet1.pdf'):
+            FileHandler.files[f'/jku/mod/resource/{name}'] = name.encode()
+        grades = (f'<html><body><div id="region-main-box"><table><thead><tr><th id="item">Item</th>'
+                  f'<th id="grade">Grade</th><th id="range">Range</th></tr></thead><tbody><tr>'
+                  f'<th><a href="{self.base}/jku/mod/resource/sheet1.pdf">Sheet 1</a></th><td>8</td><td>0-10</td>'
+                  f'</tr></tbody></table></div></body></html>')
+        self.client.session.mount('https://moodle.jku.at/', GradeAdapter({1: grades}))
+        courses = [self.course(1, '/jku/mod/resource/notes1.pdf'), self.course(2, '/jku/mod/resource/notes2.pdf')]
+        manifest = SyncManifest(self.download_path)
+
+        dm = DownloadManager([], self.client, self.download_path, manifest=manifest)
+        dm.download(course_sources(self.client, iter(courses), self.download_path, manifest))
+        manifest.close()
+        self.assertEqual(dm.failed, [])
+        self.assertEqual(sorted(file.relative_to(self.download_path).as_posix() for url, file in dm.done),
+                         ['Course 1/notes1.pdf', 'Course 1/sheet1.pdf', 'Course 2/notes2.pdf'])
+
+    def test_logged_out_grade_page(self):
+        guest = '<html><head><title>jku: Dashboard (Guest)</title></head><body></body></html>'
+        self.client.session.mount('https://moodle.jku.at/', GradeAdapter({1: guest}))
+        manifest = SyncManifest(self.download_path)
+        with self.assertRaises(NotLoggedInError):
+            list(course_sources(self.client, [self.course(1, '/jku/mod/resource/notes1.pdf')], self.download_path,
+                                manifest))
+        manifest.close()
+
+    def test_logged_out_main(self):
+        guest = '<html><head><title>jku: Dashboard (Guest)</title></head><body></body></html>'
+        self.client.session.mount('https://moodle.jku.at/', GradeAdapter({1: guest}))
+        self.client.courses = lambda *args, **kwargs: iter([self.course(1, '/jku/mod/resource/notes1.pdf')])
+        manifests = []
+
+        class Manifest(SyncManifest):
+            def __init__(self, root):
+                super().__init__(root)
+                self.closed = False
+                manifests.append(self)
+
+            def close(self):
+                super().close()
+                self.closed = True
+
+        args = Namespace(path=str(self.download_path), old=False, search=None, all=True, quiet=True, interface=None,
+                         speed=None, dedup=False, update=False, segments=1, order=None)
+        with mock.patch.object(downloading, 'SyncManifest', Manifest), self.assertRaises(NotLoggedInError):
+            downloading.main(self.client, args)
+        self.assertTrue(manifests[0].closed)
+
+    def test_shared_images(self):
+        FileHandler.files['/files/circuit.png'] = b'png'
+        url = self.base + '/files/circuit.png'
+        dm = DownloadManager([], self.client, self.download_path)
+        with dm._image_executor() as pool:
+            first, second = dm._image(url, self.download_path, pool), dm._image(url, self.download_path, pool)
+            self.assertIs(first, second)
+            self.assertEqual(first.result(), self.download_path / 'circuit.png')
+        self.assertEqual(FileHandler.requested, [('/files/circuit.png', None)])
+
+    def test_failed_image(self):
+        url = self.base + '/files/circuit.png'
+        dm = DownloadManager([], self.client, self.download_path)
+        # the downloads finish in submit, so the done callbacks have run when _image returns
+        pool = ImmediateExecutor()
+        with mock.patch.object(dm, '_download_image', side_effect=requests.ConnectionError('connection reset')):
+            with self.assertRaises(requests.ConnectionError):
+                dm._image(url, self.download_path, pool).result()
+        self.assertNotIn(url, dm._images)
+        # the file doesn't exist yet on the server
+        self.assertIsNone(dm._image(url, self.download_path, pool).result())
+        self.assertNotIn(url, dm._images)
+
+        FileHandler.files['/files/circuit.png'] = b'png'
+        self.assertEqual(dm._image(url, self.download_path, pool).result(), self.download_path / 'circuit.png')
+        self.assertIn(url, dm._images)
+
+
+class QuizAdapter(BaseAdapter):
+    """Answers the requests of a quiz download with the saved quiz pages and tiny images."""
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        path = urlparse(request.url).path
+        if path.endswith('/view.php'):
+            response.headers['Content-Type'] = 'text/html; charset=utf-8'
+            response._content = (FIXTURES / 'quiz_view.html').read_bytes()
+        elif path.endswith('/review.php'):
+            response.headers['Content-Type'] = 'text/html; charset=utf-8'
+            response._content = (FIXTURES / 'quiz_review.html').read_bytes()
+        else:
+            response.headers['Content-Type'] = 'image/png'
+            response.headers['Content-Disposition'] = f'inline; filename="{Path(path).name}"'
+            response._content = path.encode()
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        pass
+
+
+class TestQuizDownload(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = MoodleClient()
+        self.client.session.mount('https://moodle.jku.at/', QuizAdapter())
+        self.download_path = Path(tempfile.mkdtemp())
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.download_path)
+
+    def test_download_evaluation(self):
+        dm = DownloadManager([], self.client, self.download_path)
+        quiz = Url('https://moodle.jku.at/jku/mod/quiz/view.php?id=4628980', UrlType.Quiz)
+
+        done, url, file = dm.download_evaluation(quiz)
+        self.assertTrue(done)
+        self.assertEqual(len(dm._images), 10)
+        self.assertEqual(len(list(file.with_suffix('').iterdir())), 10)
+        self.assertNotIn('https://moodle.jku.at/jku/pluginfile.php', file.read_text(encoding='utf-8'))
+        # the pool of a quiz downloaded on its own is shut down after it
+        self.assertIsNone(dm._image_pool)
+        self.assertFalse(any(t.name.startswith('download-images') for t in threading.enumerate()))
+
+
+class TestLanes(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = MoodleClient()
+        self.download_path = Path(tempfile.mkdtemp())
+        self.lanes = {}  # link: names of the lanes it was downloaded in
+        self.order = []
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.download_path)
+
+    def record(self, dm, l, path):
+        """A download that only records the lane it runs in."""
+        self.lanes.setdefault(l.link, []).append(threading.current_thread().name.split('_')[0])
+        self.order.append(l.link)
+        return True, l.link, None
+
+    def recording_manager(self, urls, **kwargs):
+        dm = DownloadManager(urls, self.client, self.download_path, **kwargs)
+        dm.handlers = [DownloadHandler(h.url_type, self.record, h.lane, h.hosts) for h in dm.handlers]
+        return dm
+
+    def test_routing(self):
+        urls = [(Url('https://moodle.jku.at/jku/mod/resource/view.php?id=1', UrlType.Resource), 'files'),
+                (Url('https://moodle.jku.at/jku/mod/folder/view.php?id=2', UrlType.Folder), 'files'),
+                (Url('https://moodle.jku.at/jku/mod/url/view.php?id=3', UrlType.Url), 'files'),
+                (Url('https://www.youtube.com/watch?v=abc', UrlType.Url), 'media'),
+                (Url('https://youtu.be/abc', UrlType.Url), 'media'),
+                (Url('https://stream.jku.at/vod/video.m3u8', UrlType.Streamurl), 'media'),
+                (Url('https://moodle.jku.at/jku/mod/quiz/view.php?id=4', UrlType.Quiz), 'quiz')]
+        for url, lane in urls:
+            self.assertEqual(find_handler(url).lane, lane)
+        self.assertIsNone(find_handler(Url('https://moodle.jku.at/jku/mod/forum/view.php?id=5', UrlType.Forum)))
+
+        dm = self.recording_manager([url for url, lane in urls])
+        dm.download()
+        self.assertEqual(self.lanes, {url.link: [f'download-{lane}'] for url, lane in urls})
+        self.assertEqual(len(dm.done), len(urls))
+
+    def test_handoff(self):
+        url = Url('https://moodle.jku.at/jku/mod/url/view.php?id=3', UrlType.Url)
+
+        def hand_off(dm, l, path):
+            self.record(dm, l, path)
+            return Handoff('media', self.record, l, path)
+
+        dm = DownloadManager([url], self.client, self.download_path)
+        dm.handlers = [DownloadHandler(UrlType.Url, hand_off)]
+        dm.download()
+        self.assertEqual(self.lanes, {url.link: ['download-files', 'download-media']})
+        self.assertEqual(dm.done, [(url.link, None)])
+
+    def test_youtube_redirect(self):
+        url = 'https://moodle.jku.at/jku/mod/url/view.php?id=3'
+        self.client.session.mount('https://moodle.jku.at/', FakeAdapter(
+            lambda r: (303, {'Location': 'https://www.youtube.com/watch?v=abc'}, b'')))
+        self.client.session.mount('https://www.youtube.com/', FakeAdapter(
+            lambda r: (200, {'Content-Type': 'text/html'}, b'<html>video</html>')))
+        dm = DownloadManager([], self.client, self.download_path)
+
+        handoff = dm.download_from_url(url, self.download_path)
+        self.assertIsInstance(handoff, Handoff)
+        self.assertEqual(handoff.lane, 'media')
+        self.assertIs(handoff.download, DownloadManager.download_youtube)
+        self.assertEqual(handoff.args, ('https://www.youtube.com/watch?v=abc', url, self.download_path))
+
+    def test_register_handler(self):
+        self.addCleanup(HANDLERS.__setitem__, slice(None), list(HANDLERS))
+        self.addCleanup(LANES.pop, 'slides', None)
+        with self.assertRaises(ValueError):
+            register_handler(DownloadHandler(UrlType.Resource, self.record, 'slides'))
+
+        register_handler(DownloadHandler(UrlType.Resource, self.record, 'slides', ('slides.example.com',)),
+                         Lane('slides', workers=1))
+        slides = Url('https://cdn.slides.example.com/deck.pdf', UrlType.Resource)
+        resource = Url('https://moodle.jku.at/jku/mod/resource/view.php?id=1', UrlType.Resource)
+        dm = DownloadManager([slides, resource], self.client, self.download_path)
+        # the moodle resource keeps its own handler, only the lane is replaced here
+        dm.handlers = [h if h.hosts == ('slides.example.com',) else DownloadHandler(h.url_type, self.record, h.lane,
+                                                                                    h.hosts) for h in dm.handlers]
+        dm.download()
+        self.assertEqual(self.lanes, {slides.link: ['download-slides'], resource.link: ['download-files']})
+
+    def test_smallest_first(self):
+        sizes = {'/big.pdf': 5000, '/small.pdf': 10, '/medium.pdf': 800}
+
+        def respond(request):
+            if request.path_url == '/broken.pdf':
+                raise requests.ConnectionError('connection reset')
+            return 200, {'Content-Length': str(sizes[request.path_url])}, b''
+
+        self.client.session.mount('https://files.example.com/', FakeAdapter(respond))
+        urls = [Url(f'https://files.example.com/{name}', UrlType.Resource)
+                for name in ('big.pdf', 'broken.pdf', 'small.pdf', 'medium.pdf')]
+        dm = self.recording_manager(urls, priority='smallest')
+        dm.lanes['files'] = Lane('files', workers=1)
+        dm.download()
+
+        self.assertEqual(dm.probes['https://files.example.com/broken.pdf'], (None, None))
+        self.assertEqual(dm.probes['https://files.example.com/big.pdf'], (5000, None))
+        # files of unknown size come last
+        self.assertEqual(self.order, [f'https://files.example.com/{name}'
+                                      for name in ('small.pdf', 'medium.pdf', 'big.pdf', 'broken.pdf')])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,113 @@
+import functools
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+
+import requests
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from pymoodle_jku.client.hls import HlsDownloader, Playlist
+
+
+class RecordingHandler(SimpleHTTPRequestHandler):
+    requested = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requested.append(self.path)
+        super().do_GET()
+
+
+class TestHlsDownloader(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = Path(tempfile.mkdtemp())
+        self.output = self.directory / 'output'
+        self.output.mkdir()
+        RecordingHandler.requested = []
+        handler = functools.partial(RecordingHandler, directory=str(self.directory))
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f'http://127.0.0.1:{self.server.server_port}/'
+        self.segments = [os.urandom(1000 + i) for i in range(5)]
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def write_playlist(self, name, segments, header=''):
+        lines = ['#EXTM3U', '#EXT-X-TARGETDURATION:10', '#EXT-X-MEDIA-SEQUENCE:0', header]
+        for i, data in enumerate(segments):
+            (self.directory / f'{name}{i}.ts').write_bytes(data)
+            lines += ['#EXTINF:10.0,', f'{name}{i}.ts']
+        lines.append('#EXT-X-ENDLIST')
+        (self.directory / f'{name}.m3u8').write_text('\n'.join(lines))
+
+    def test_master_playlist(self):
+        self.write_playlist('low', [b'low'] * 3)
+        self.write_playlist('high', self.segments)
+        (self.directory / 'master.m3u8').write_text(
+            '#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=200000,RESOLUTION=640x360\nlow.m3u8\n'
+            '#EXT-X-STREAM-INF:BANDWIDTH=1500000,RESOLUTION=1280x720\nhigh.m3u8\n')
+
+        file = HlsDownloader(requests.Session()).download(self.base + 'master.m3u8', self.output / 'video.ts')
+        self.assertEqual(file, self.output / 'video.ts')
+        self.assertEqual(file.read_bytes(), b''.join(self.segments))
+        self.assertNotIn('/low0.ts', RecordingHandler.requested)
+        self.assertEqual(os.listdir(self.output), ['video.ts'])
+
+    def test_aes_128(self):
+        key, iv = os.urandom(16), os.urandom(16)
+        (self.directory / 'key.bin').write_bytes(key)
+        encrypted = []
+        for data in self.segments:
+            padder = padding.PKCS7(128).padder()
+            encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+            encrypted.append(encryptor.update(padder.update(data) + padder.finalize()) + encryptor.finalize())
+        self.write_playlist('enc', encrypted, f'#EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV=0x{iv.hex()}')
+
+        file = HlsDownloader(requests.Session()).download(self.base + 'enc.m3u8', self.output / 'video.ts')
+        self.assertEqual(file.read_bytes(), b''.join(self.segments))
+        self.assertEqual(RecordingHandler.requested.count('/key.bin'), 1)
+
+    def test_resume(self):
+        self.write_playlist('stream', self.segments)
+        (self.directory / 'stream3.ts').unlink()  # the first run fails at this segment
+
+        downloader = HlsDownloader(requests.Session(), workers=2)
+        self.assertIsNone(downloader.download(self.base + 'stream.m3u8', self.output / 'video.ts'))
+        (self.directory / 'stream3.ts').write_bytes(self.segments[3])
+        RecordingHandler.requested = []
+
+        file = downloader.download(self.base + 'stream.m3u8', self.output / 'video.ts')
+        self.assertEqual(file.read_bytes(), b''.join(self.segments))
+        self.assertEqual(RecordingHandler.requested, ['/stream.m3u8', '/stream3.ts'])
+
+    def test_fmp4(self):
+        (self.directory / 'init.mp4').write_bytes(b'init')
+        self.write_playlist('frag', self.segments, '#EXT-X-MAP:URI="init.mp4"')
+
+        file = HlsDownloader(requests.Session()).download(self.base + 'frag.m3u8', self.output / 'video.mp4')
+        self.assertEqual(file, self.output / 'video.mp4')
+        self.assertEqual(file.read_bytes(), b'init' + b''.join(self.segments))
+
+    def test_byterange(self):
+        playlist = Playlist('#EXTM3U\n#EXT-X-BYTERANGE:100@0\n#EXTINF:10,\nall.ts\n#EXT-X-BYTERANGE:50\n'
+                            '#EXTINF:10,\nall.ts\n', 'https://example.com/a/b.m3u8')
+        self.assertEqual([s.byterange for s in playlist.segments], [(0, 99), (100, 149)])
+        self.assertEqual(playlist.segments[0].uri, 'https://example.com/a/all.ts')
+
+    def test_no_playlist(self):
+        with self.assertRaises(ValueError):
+            Playlist('<html></html>', self.base)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import functools
+import multiprocessing
+import pickle
+import threading
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+
+import requests
+from lxml import etree
+
+from pymoodle_jku.classes.course_data import UrlType
+from pymoodle_jku.client.client import MoodleClient
+from pymoodle_jku.client.html_parser import QuizPage, CoursePage, ValuationPage, QuizSummary, MainRegion, \
+    parse_course_data, parse_evaluations
+from pymoodle_jku.client.markdown import MarkdownConverter
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+
+def fixture_response(name, url='https://moodle.jku.at/jku/course/view.php?id=1234') -> requests.Response:
+    """Builds a Response with a saved page as body."""
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = 'text/html; charset=utf-8'
+    response._content = (FIXTURES / name).read_bytes()
+    response.url = url
+    response.request = requests.Request('GET', url).prepare()
+    return response
+
+
+class TestHtmlParser(unittest.TestCase):
+    def test_quiz_page(self):
+        page = QuizPage(fixture_response('quiz_review.html'))
+        output = page.md_quiz()
+        self.assertEqual(len(page.questions), 30)
+        self.assertEqual(len(page.images), 10)
+        self.assertIn('Bewertung**5,00** von 10,00', output)
+        self.assertIn('### Frage 30 ###', output)
+        self.assertIn('[Logik](<https://de.wikipedia.org/wiki/Logik>)', output)
+        self.assertIn('`x < 3`', output)
+        self.assertEqual(output, page.md_quiz())
+
+    def test_quiz_summary(self):
+        summary = QuizSummary(fixture_response('quiz_view.html'))
+        self.assertEqual(summary.name, 'Quiz 3')
+        url = summary.quiz_url()
+        self.assertIs(url.type, UrlType.Quiz)
+        self.assertEqual(url.link, 'https://moodle.jku.at/jku/mod/quiz/review.php?attempt=661309&cmid=4628980')
+
+    def test_course_page(self):
+        course_data = CoursePage(fixture_response('course_view.html')).to_course_data()
+        self.assertEqual(len(course_data.sections), 12)
+        self.assertIn('### [Woche 3: Thema 3]', course_data.sections[3])
+        self.assertIn('*   Vorlesung: Montag 10:15', course_data.sections[3])
+        self.assertEqual(len(course_data.links), 12 * 8)
+        self.assertEqual(sum(l.type is UrlType.Streamurl for l in course_data.links), 12)
+        self.assertTrue(all(l.course is course_data for l in course_data.links))
+
+    def test_valuation_page(self):
+        evaluations = ValuationPage(fixture_response('grades_user.html')).evaluations()
+        self.assertEqual(len(evaluations), 40)
+        self.assertEqual(evaluations[3].name, 'Übung 3')
+        self.assertEqual(evaluations[3].grade, '3,00')
+        self.assertEqual(evaluations[3].grade_range, '0–10')
+        self.assertIs(evaluations[0].url.type, UrlType.Quiz)
+
+    def test_main_region(self):
+        response = fixture_response('quiz_view.html')
+        page = response.content.decode('utf-8').replace('Quiz 3', 'Übung 3')
+        response.headers['Content-Type'] = 'text/html; charset=ISO-8859-1'
+        response._content = page.encode('iso-8859-1')
+        self.assertEqual(QuizSummary(response).name, 'Übung 3')
+
+        response._content = page.split('<footer')[0].encode('iso-8859-1')
+        self.assertEqual(QuizSummary(response).name, 'Übung 3')
+
+        response._content = b'<html><body><footer id="page-footer"></footer></body></html>'
+        with self.assertRaises(IndexError):
+            MainRegion(response)
+
+    def test_parse_functions(self):
+        response = fixture_response('course_view.html')
+        course_data = pickle.loads(pickle.dumps(parse_course_data(response.content, 'utf-8', response.url)))
+        self.assertEqual(course_data.sections, CoursePage(response).sections())
+        self.assertTrue(all(l.course is course_data for l in course_data.links))
+
+        response = fixture_response('grades_user.html')
+        evaluations = pickle.loads(pickle.dumps(parse_evaluations(response.content, 'utf-8', response.url)))
+        self.assertEqual(evaluations, ValuationPage(response).evaluations())
+
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class TestParseExecutor(unittest.TestCase):
+    def setUp(self) -> None:
+        handler = functools.partial(QuietHandler, directory=str(FIXTURES))
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f'http://127.0.0.1:{self.server.server_port}/'
+        self.executor = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn'))
+        self.client = MoodleClient(parse_executor=self.executor)
+
+    def tearDown(self) -> None:
+        self.executor.shutdown()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_parse_pages(self):
+        pages = ['course_view.html', 'missing.html', 'course_view.html', 'course_view.html']
+        results = list(self.client._parse_pages(list(enumerate(pages)), lambda i: self.base + i[1],
+                                                parse_course_data))
+        expected = CoursePage(fixture_response('course_view.html')).to_course_data()
+        # the 404 page can't be parsed, it is left out
+        self.assertEqual(sorted(i for (i, page), course_data in results), [0, 2, 3])
+        for item, course_data in results:
+            self.assertEqual(course_data.sections, expected.sections)
+            self.assertEqual([l.link for l in course_data.links], [l.link for l in expected.links])
+
+        results = list(self.client._parse_pages([0], lambda i: self.base + 'grades_user.html', parse_evaluations))
+        self.assertEqual(results, [(0, ValuationPage(fixture_response('grades_user.html')).evaluations())])
+
+
+class TestMarkdownConverter(unittest.TestCase):
+    def test_element_unchanged(self):
+        page = CoursePage(fixture_response('course_view.html'))
+        section = page.region.xpath('.//ul[@class="topics"]/li')[1]
+        before = etree.tostring(section)
+        converter = MarkdownConverter()
+        converter.convert(section.xpath('./node()'))
+        self.assertEqual(etree.tostring(section), before)
+
+    def test_memo(self):
+        converter = MarkdownConverter(max_entries=2)
+        page = QuizPage(fixture_response('quiz_review.html'))
+        flags = [info.xpath('./div[contains(@class,"questionflag")]')[0] for info in page.info]
+        results = {converter.element(f) for f in flags}
+        self.assertEqual(len(results), 1)
+        self.assertLessEqual(len(converter._memo), 2)
+        self.assertIn('Frage markieren', results.pop())
+
+
+if __name__ == '__main__':
+    unittest.main()
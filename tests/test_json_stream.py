@@ -0,0 +1,46 @@
+import json
+import unittest
+
+from pymoodle_jku.utils.json_stream import JsonArrayStream
+
+
+def chunked(data: bytes, size: int):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+class TestJsonArrayStream(unittest.TestCase):
+    def setUp(self) -> None:
+        courses = [{'id': i, 'fullname': f'Kurs Übung {i}', 'courseimage': 'data:image/svg+xml;base64,' + 'A' * 3000,
+                    'tags': ['] ,', {'x': '{'}]} for i in range(5)]
+        self.document = [{'error': False, 'data': {'courses': courses + [12345], 'nextoffset': 25}}]
+        self.raw = json.dumps(self.document, ensure_ascii=False).encode('utf-8')
+
+    def test_chunks(self):
+        for size in (1, 3, 64, len(self.raw)):
+            stream = JsonArrayStream(chunked(self.raw, size), 'courses')
+            self.assertEqual(list(stream), self.document[0]['data']['courses'])
+            self.assertEqual(json.loads(stream.rest), [{'error': False, 'data': {'courses': [], 'nextoffset': 25}}])
+
+    def test_lazy(self):
+        read = []
+
+        def chunks():
+            for c in chunked(self.raw, 1024):
+                read.append(c)
+                yield c
+
+        next(iter(JsonArrayStream(chunks(), 'courses')))
+        self.assertLess(sum(map(len, read)), len(self.raw) / 2)
+
+    def test_error(self):
+        stream = JsonArrayStream([b'[{"error":true,"exception":{"errorcode":"invalidsesskey"}}]'], 'courses')
+        self.assertEqual(list(stream), [])
+        self.assertTrue(json.loads(stream.rest)[0]['error'])
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            list(JsonArrayStream(chunked(self.raw[:len(self.raw) // 2], 100), 'courses'))
+
+
+if __name__ == '__main__':
+    unittest.main()
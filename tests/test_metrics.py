@@ -0,0 +1,52 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from pymoodle_jku.classes.course import Course
+from pymoodle_jku.client.client import MoodleClient
+from pymoodle_jku.utils.metrics import MetricsCollector
+from tests.fakes import FakeAdapter
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+PAGES = {'/jku/course/view.php': 'course_view.html', '/jku/course/user.php': 'grades_user.html'}
+
+
+def respond(request):
+    path = request.path_url.split('?')[0]
+    return 200, {'Content-Type': 'text/html; charset=utf-8'}, (FIXTURES / PAGES[path]).read_bytes()
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self) -> None:
+        self.metrics = MetricsCollector()
+        self.client = MoodleClient(metrics=self.metrics)
+        self.client.session.mount('https://moodle.jku.at/', FakeAdapter(respond))
+        self.checked = []
+        self.client.session.hooks['response'].append(lambda r, *args, **kwargs: self.checked.append(r.url))
+        self.courses = [Course.from_json({'id': i, 'fullname': f'2022S, Course {i}',
+                                          'viewurl': f'https://moodle.jku.at/jku/course/view.php?id={i}'})
+                        for i in range(3)]
+
+    def test_course_and_grade_pages(self):
+        self.assertEqual(len(list(self.client.courses(load_pages=self.courses))), 3)
+        self.assertEqual(len(list(self.client.multi_valuation(self.courses))), 3)
+        self.client.session.get('https://moodle.jku.at/jku/course/view.php?id=1')
+
+        summary = self.metrics.summary()
+        self.assertEqual(summary['course']['requests'], 4)
+        self.assertEqual(summary['grades']['requests'], 3)
+        self.assertEqual(summary['course']['status'], {'200': 4})
+        self.assertGreater(summary['grades']['bytes_in'], 0)
+        # the hooks of the session run for requests with their own hooks too
+        self.assertEqual(len(self.checked), 7)
+
+    def test_parse_executor(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.client.parse_executor = executor
+            self.assertEqual(len(list(self.client.courses(load_pages=self.courses))), 3)
+        self.assertEqual(self.metrics.summary()['course']['requests'], 3)
+        self.assertEqual(len(self.checked), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
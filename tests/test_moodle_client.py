@@ -1,4 +1,8 @@
+import gzip
+import io
+import json
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
 from pathlib import Path
 
@@ -6,8 +10,9 @@ import keyring
 
 from pymoodle_jku.classes.course import Course
 from pymoodle_jku.classes.course_data import CourseData
-from pymoodle_jku.classes.exceptions import NotLoggedInError
-from pymoodle_jku.client.client import MoodleClient
+from pymoodle_jku.classes.exceptions import NotLoggedInError, AjaxError
+from pymoodle_jku.client.async_client import AsyncMoodleClient
+from pymoodle_jku.client.client import MoodleClient, LOGIN_URL, LOGIN_CHECK_PREFIX, PAGES_WINDOW
 
 # If you want to suppress the ResourceWarnings uncomment this:
 # import warnings
@@ -15,6 +20,7 @@ from pymoodle_jku.client.client import MoodleClient
 # These warnings are an indication that everything is working correctly and nothing is going wrong.
 from pymoodle_jku.client.download_manager import DownloadManager
 from pymoodle_jku.utils.config import config, set_new_user
+from tests.fakes import FakeAdapter
 
 
 class TestPyMoodleClientLogin(unittest.TestCase):
@@ -82,6 +88,13 @@ class TestPyMoodleClient(unittest.TestCase):
 
         self.assertGreater(len(all_courses), 0)
 
+    def test_courses_service(self):
+        courses = list(self.client.courses(use_service=True))
+        self.assertGreater(len(courses), 0)
+        for c in courses:
+            self.assertIsNotNone(c.course_page)
+            self.assertIs(type(c.course_page.to_course_data()), CourseData)
+
     def test_courses_reload_page(self):
         courses = list(self.client.courses(load_pages=False))
         courses_2 = list(self.client.courses(load_pages=courses))
@@ -96,6 +109,17 @@ class TestPyMoodleClient(unittest.TestCase):
         for c in courses_generator:
             self.assertTrue('VL' in c.fullname)
 
+    def test_ajax_batch(self):
+        calls = [{'methodname': 'core_course_get_enrolled_courses_by_timeline_classification',
+                  'args': {'offset': 0, 'limit': 0, 'classification': 'all', 'sort': 'fullname'}},
+                 {'methodname': 'not_existing_method', 'args': {}}] * 30
+        results = self.client.ajax_batch(calls)
+        self.assertEqual(len(results), len(calls))
+        for r in results[0::2]:
+            self.assertIn('courses', r)
+        for r in results[1::2]:
+            self.assertIsInstance(r, AjaxError)
+
     def test_calendar(self):
         calendar_events = self.client.calendar()
         for t in calendar_events:
@@ -127,5 +151,166 @@ class TestPyMoodleClient(unittest.TestCase):
             self.assertIs(type(val), list)
 
 
+class TestAsyncMoodleClient(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = AsyncMoodleClient()
+        username = config['Username']
+        password = keyring.get_password('pymoodle-jku', username)
+        await self.client.login(username, password)
+
+    async def test_courses(self):
+        all_courses = [c async for c in self.client.courses()]
+        self.assertGreater(len(all_courses), 0)
+        for c in all_courses:
+            self.assertIs(type(c), Course)
+            self.assertIs(type(c.course_page.to_course_data()), CourseData)
+
+    async def test_courses_without_page(self):
+        all_courses = [c async for c in self.client.courses(load_pages=False)]
+        self.assertGreater(len(all_courses), 0)
+        for c in all_courses:
+            self.assertIsNone(c.course_page)
+
+    async def test_multi_valuation(self):
+        vals = [v async for v in self.client.multi_valuation()]
+        self.assertGreater(len(vals), 0)
+        for course, val in vals:
+            self.assertIs(type(val), list)
+
+    async def test_calendar(self):
+        calendar_events = await self.client.calendar()
+        for t in calendar_events:
+            self.assertIsNotNone(t.id)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+
+ENROLLED_PATH = '/jku/lib/ajax/service.php?sesskey=None&info=core_course_get_enrolled_courses_by_timeline_classification'
+
+
+class TestStreamedLoginCheck(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = MoodleClient()
+        self.pages = {}  # path: (status, headers, body)
+        self.client.session.mount('https://moodle.jku.at/', FakeAdapter(lambda r: self.pages[r.path_url]))
+
+    def get(self, path, **kwargs):
+        return self.client.session.get('https://moodle.jku.at' + path, stream=True, **kwargs)
+
+    def test_bodies_unchanged(self):
+        page = b'<html><body>' + b''.join(b'<p>%d</p>' % i for i in range(20000)) + b'</body></html>'
+        self.assertGreater(len(page), LOGIN_CHECK_PREFIX)
+        self.pages['/plain'] = (200, {'Content-Type': 'text/html'}, page)
+        self.pages['/gzip'] = (200, {'Content-Type': 'text/html', 'Content-Encoding': 'gzip'}, gzip.compress(page))
+        self.pages['/short'] = (200, {'Content-Type': 'text/html'}, b'<html>short</html>')
+        self.pages['/json'] = (200, {'Content-Type': 'application/json'}, b'[{"error": false, "data": []}]')
+
+        self.assertEqual(self.get('/plain').content, page)
+        self.assertEqual(b''.join(self.get('/gzip').iter_content(chunk_size=1000)), page)
+        self.assertEqual(self.get('/short').content, b'<html>short</html>')
+        self.assertEqual(self.get('/json').json(), [{'error': False, 'data': []}])
+
+    def test_logged_out(self):
+        self.pages['/file'] = (303, {'Location': LOGIN_URL}, b'')
+        self.pages['/jku/login/index.php'] = (200, {'Content-Type': 'text/html'}, b'<html>login</html>')
+        self.pages['/guest'] = (200, {'Content-Type': 'text/html'},
+                                b'<html><head><title>jku: Dashboard (Guest)</title></head></html>')
+        self.pages['/ajax'] = (200, {'Content-Type': 'application/json'},
+                               b'[{"error": true, "exception": {"errorcode": "servicerequireslogin"}}]')
+        for path in ('/file', '/guest', '/ajax'):
+            with self.subTest(path=path), self.assertRaises(NotLoggedInError):
+                self.get(path)
+
+    def test_enrolled_courses_streamed(self):
+        courses = [{'id': i, 'fullname': f'2022S, Course {i}', 'courseimage': 'A' * 3000} for i in range(100)]
+        body = io.BytesIO(json.dumps([{'error': False, 'data': {'courses': courses, 'nextoffset': 100}}]).encode())
+        self.pages[ENROLLED_PATH] = (200, {'Content-Type': 'application/json'}, body)
+
+        loaded = self.client.enrolled_courses(classifications=('all',), page_size=0)
+        self.assertEqual(next(loaded).id, 0)
+        # the first course is decoded before most of the body is received
+        self.assertLess(body.tell(), len(body.getvalue()) // 10)
+        self.assertEqual(len(list(loaded)), 99)
+
+    def test_enrolled_courses_logged_out(self):
+        self.pages[ENROLLED_PATH] = (200, {'Content-Type': 'application/json'},
+                                     b'[{"error": true, "exception": {"message": "' + b'x' * 10000 +
+                                     b'", "errorcode": "servicerequireslogin"}}]')
+        with self.assertRaises(NotLoggedInError):
+            list(self.client.enrolled_courses(classifications=('all',)))
+
+
+class TestAjaxBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = MoodleClient()
+        self.posts = []  # the calls of every POST
+        self.client.session.mount('https://moodle.jku.at/', FakeAdapter(self.respond))
+
+    def respond(self, request):
+        """Answers the calls like moodle, the first failing call ends the answers."""
+        calls = json.loads(request.body)
+        self.posts.append(calls)
+        answers = []
+        for call in calls:
+            if call['methodname'] == 'fail':
+                answers.append({'error': True, 'exception': {'message': 'failed', 'errorcode': 'invalidrecord'}})
+                break
+            answers.append({'error': False, 'data': call['args']})
+        return 200, {'Content-Type': 'application/json'}, json.dumps(answers).encode()
+
+    def test_max_calls(self):
+        calls = [{'methodname': 'fail' if i == 3 else 'echo', 'args': {'n': i}} for i in range(7)]
+        results = self.client.ajax_batch(calls, max_calls=3)
+
+        self.assertEqual(results[:3] + results[4:], [{'n': i} for i in (0, 1, 2, 4, 5, 6)])
+        self.assertIsInstance(results[3], AjaxError)
+        self.assertEqual(results[3].errorcode, 'invalidrecord')
+        # the calls after the failing one are sent again
+        self.assertEqual(sorted([c['args']['n'] for c in calls] for calls in self.posts),
+                         [[0, 1, 2], [3, 4, 5], [4, 5], [6]])
+        self.assertTrue(all([c['index'] for c in calls] == list(range(len(calls))) for calls in self.posts))
+
+    def test_max_bytes(self):
+        calls = [{'methodname': 'echo', 'args': {'text': 'x' * 40}} for _ in range(4)]
+        calls.insert(2, {'methodname': 'echo', 'args': {'text': 'x' * 500}})
+        results = self.client.ajax_batch(calls, max_bytes=200)
+
+        self.assertEqual(results, [c['args'] for c in calls])
+        # a call bigger than max_bytes is sent alone
+        self.assertEqual(sorted([len(c['args']['text']) for c in calls] for calls in self.posts),
+                         [[40, 40], [40, 40], [500]])
+        self.assertTrue(all(len(json.dumps(calls)) <= 200 for calls in self.posts if len(calls) > 1))
+
+
+class TestPagesWindow(unittest.TestCase):
+    def setUp(self) -> None:
+        grades = (Path(__file__).parent / 'fixtures' / 'grades_user.html').read_bytes()
+        self.client = MoodleClient()
+        self.client.session.mount('https://moodle.jku.at/', FakeAdapter(
+            lambda r: (200, {'Content-Type': 'text/html; charset=utf-8'}, grades)))
+        self.taken = 0
+
+    def courses(self, amount):
+        for i in range(amount):
+            self.taken += 1
+            yield Course(i, f'2022S, Course {i}')
+
+    def test_multi_valuation(self):
+        valuations = self.client.multi_valuation(self.courses(100))
+        next(valuations)
+        self.assertLessEqual(self.taken, PAGES_WINDOW + 1)
+        self.assertEqual(len(list(valuations)), 99)
+        self.assertEqual(self.taken, 100)
+
+    def test_parse_executor(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.client.parse_executor = executor
+            valuations = self.client.multi_valuation(self.courses(100))
+            next(valuations)
+            self.assertLessEqual(self.taken, PAGES_WINDOW + 1)
+            self.assertEqual(len(list(valuations)), 99)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,123 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import psutil
+
+from pymoodle_jku.utils import net_usage
+from pymoodle_jku.utils.net_usage import TokenBucket, InterfaceSampler
+
+NET_DEV = '''Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:    1200      12    0    0    0     0          0         0     1200      12    0    0    0     0       0          0
+  eth0: {received} 84571    0    0    0     0          0       112  8302516   51293    0    0    0     0       0          0
+'''
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        patch = mock.patch.object(net_usage, 'time', self.clock)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_rate(self):
+        bucket = TokenBucket(1000)
+        bucket.consume(250)
+        self.assertEqual(self.clock.slept, 0)
+        for _ in range(100):
+            bucket.consume(100)
+        # the burst is free, everything else is paid back with 1000 bytes/s
+        self.assertAlmostEqual(self.clock.slept, 10)
+        self.assertEqual(bucket.consumed, 10250)
+
+        bucket.set_rate(4000)
+        self.clock.sleep(1)
+        slept = self.clock.slept
+        bucket.consume(4000)
+        # at most burst tokens are saved up while idle
+        self.assertAlmostEqual(self.clock.slept - slept, (4000 - 250) / 4000)
+
+    def test_chunk_size(self):
+        self.assertEqual(TokenBucket(1024 * 1024).chunk_size(), 128 * 1024)
+        self.assertEqual(TokenBucket(1000).chunk_size(), 16 * 1024)
+        self.assertEqual(TokenBucket(1024 ** 3).chunk_size(), 1024 * 1024)
+
+
+class Samples:
+    """Replaces the stop event of a InterfaceSampler, every wait runs the next step instead of sleeping."""
+
+    def __init__(self, *steps):
+        self.steps = iter(steps)
+
+    def wait(self, timeout):
+        step = next(self.steps, None)
+        if step is None:
+            return True
+        step()
+        return False
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'psutil reads /proc/net/dev only on linux')
+class TestInterfaceSampler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        patch = mock.patch.object(net_usage, 'time', self.clock)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        procfs = Path(tempfile.mkdtemp())
+        (procfs / 'net').mkdir()
+        self.net_dev = procfs / 'net' / 'dev'
+        self.received = 52347811
+        self.write_net_dev()
+        procfs_path = psutil.PROCFS_PATH
+        psutil.PROCFS_PATH = str(procfs)
+        self.addCleanup(setattr, psutil, 'PROCFS_PATH', procfs_path)
+        psutil.net_io_counters.cache_clear()
+        self.addCleanup(psutil.net_io_counters.cache_clear)
+
+    def write_net_dev(self):
+        self.net_dev.write_text(NET_DEV.format(received=self.received))
+
+    def step(self, received, consumed):
+        def run():
+            self.clock.now += 1
+            self.received += received
+            self.bucket.consumed += consumed
+            self.write_net_dev()
+
+        return run
+
+    def test_foreign_traffic(self):
+        self.bucket = TokenBucket(5_000_000)
+        sampler = InterfaceSampler(self.bucket, 'eth0', limit=5_000_000)
+        rates = []
+        set_rate = self.bucket.set_rate
+        self.bucket.set_rate = lambda rate: (rates.append(rate), set_rate(rate))
+        sampler._stop_event = Samples(self.step(3_000_000, 1_000_000), self.step(10_000_000, 0),
+                                      self.step(500_000, 500_000))
+        sampler.run()
+
+        # other programs received 2 MB/s, then 10 MB/s, then nothing
+        self.assertEqual(rates, [3_000_000, 250_000, 5_000_000])
+        self.assertEqual(self.bucket.rate, 5_000_000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from pymoodle_jku.classes.course_data import UrlType
+from pymoodle_jku.client.service_parser import CourseContents
+
+RESOURCE = 'https://moodle.jku.at/jku/mod/resource/view.php?id=5'
+
+
+class TestCourseContents(unittest.TestCase):
+    def setUp(self) -> None:
+        self.contents = CourseContents([
+            {'name': 'Woche 1', 'summary': '<p>Intro <b>Kapitel 1</b></p>', 'modules': [
+                {'modname': 'label', 'name': 'Hinweis', 'description': '<p>Bitte <i>vorab</i> lesen</p>'},
+                {'modname': 'resource', 'name': 'Folien', 'url': RESOURCE, 'description': '<p>Zu Kapitel 1</p>'},
+            ]},
+            {'name': 'Woche 2', 'modules': []},
+        ], 'https://moodle.jku.at/jku/course/view.php?id=1')
+
+    def test_sections(self):
+        sections = self.contents.sections()
+        self.assertEqual(len(sections), 2)
+        self.assertIn('Intro **Kapitel 1**', sections[0])
+        self.assertIn('Bitte *vorab* lesen', sections[0])
+        self.assertIn(f'[Folien](<{RESOURCE}>)', sections[0])
+        self.assertIn('Zu Kapitel 1', sections[0])
+        self.assertNotIn('Hinweis', sections[0])
+        self.assertTrue(sections[1].startswith('Woche 2'))
+
+    def test_urls(self):
+        urls = self.contents.urls()
+        self.assertEqual([(u.link, u.type) for u in urls], [(RESOURCE, UrlType.Resource)])
+
+
+if __name__ == '__main__':
+    unittest.main()